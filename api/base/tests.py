@@ -0,0 +1,88 @@
+from datetime import timedelta
+
+from django.db import connection
+from django.db.models import Q
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.exceptions import NotFound
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from api.base.views.mixins import CustomListModelMixin
+from api.utils.pagination import Pagination
+from controls.models import Element
+from siteapp.models import User
+
+
+class CursorPaginationTests(TestCase):
+
+    def paginate(self, queryset, **params):
+        pagination = Pagination()
+        page = pagination.paginate_queryset(queryset, Request(APIRequestFactory().get('/', params)))
+        return [element.name for element in page], pagination.get_paginated_response([]).data['pages']
+
+    def test_cursor_pagination(self):
+        # Two elements share a created time so that pages are ordered by id within it.
+        now = timezone.now()
+        for i in range(5):
+            element = Element.objects.create(name="Element {}".format(i), element_type="system_element")
+            Element.objects.filter(id=element.id).update(created=now + timedelta(seconds=min(i, 3)))
+        queryset = Element.objects.all()
+
+        names, pages = self.paginate(queryset, cursor='', count=2, total='true')
+        self.assertEqual(names, ["Element 4", "Element 3"])
+        self.assertEqual(pages['total_records'], 5)
+        self.assertIsNone(pages['prev_cursor'])
+
+        names, pages = self.paginate(queryset, cursor=pages['next_cursor'], count=2)
+        self.assertEqual(names, ["Element 2", "Element 1"])
+        self.assertIsNone(pages['total_records'])
+        prev_cursor = pages['prev_cursor']
+
+        names, pages = self.paginate(queryset, cursor=pages['next_cursor'], count=2)
+        self.assertEqual(names, ["Element 0"])
+        self.assertIsNone(pages['next_cursor'])
+
+        names, pages = self.paginate(queryset, cursor=prev_cursor, count=2)
+        self.assertEqual(names, ["Element 4", "Element 3"])
+        self.assertIsNone(pages['prev_cursor'])
+
+        # Page number pagination is unchanged.
+        names, pages = self.paginate(queryset.order_by('id'), page=2, count=2)
+        self.assertEqual(names, ["Element 2", "Element 3"])
+        self.assertEqual(pages['total_records'], 5)
+
+        with self.assertRaises(NotFound):
+            self.paginate(queryset, cursor='not a cursor')
+
+
+class RollupTests(TestCase):
+
+    class ElementRollupView(CustomListModelMixin):
+        ROLLUP = {
+            "systems": Q(element_type="system"),
+            "components": Q(element_type="system_element"),
+        }
+        kwargs = {}
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}},
+                       GR_API_ROLLUP_CACHE_SECONDS=30)
+    def test_rollup(self):
+        for element_type in ["system", "system_element", "system_element"]:
+            Element.objects.create(name="Element {}".format(Element.objects.count()), element_type=element_type)
+        request = Request(APIRequestFactory().get('/', {'rollup': 'true', 'page': 1}))
+        request.user = User.objects.create(username="Jane", email="jane@example.com")
+        view = self.ElementRollupView()
+
+        # The rollups are counted in one query, after the query of the latest update.
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(view.get_rollup(request, Element.objects.distinct()), {"systems": 1, "components": 2})
+        self.assertEqual(len(queries), 2)
+
+        # The rollup is then cached until the elements change.
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(view.get_rollup(request, Element.objects.distinct()), {"systems": 1, "components": 2})
+        self.assertEqual(len(queries), 1)
+        Element.objects.create(name="Another Element", element_type="system")
+        self.assertEqual(view.get_rollup(request, Element.objects.all()), {"systems": 2, "components": 2})
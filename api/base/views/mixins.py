@@ -1,5 +1,11 @@
 import abc
-from django.db.models.aggregates import Count
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models.aggregates import Count, Max
 from rest_framework import status
 from rest_framework.mixins import CreateModelMixin
 from rest_framework.mixins import DestroyModelMixin
@@ -41,12 +47,48 @@ class CustomListModelMixin(ListModelMixin):
             retdict[key.replace(".", "__")] = value
         return retdict
 
+    # Query parameters that do not change rollups
+    ROLLUP_CACHE_IGNORED_PARAMS = ('page', 'count', 'cursor', 'total', 'ordering', 'rollup')
+
+    def get_rollup_cache_key(self, request, queryset):
+        """Return the cache key of the rollup of a list request, or None if it is not cached.
+        The key includes the latest `updated` of the model so that rollups are recomputed
+        after rows change. Deleted rows are only reflected once the cached rollup expires."""
+        if not settings.GR_API_ROLLUP_CACHE_SECONDS:
+            return None
+        model = queryset.model
+        try:
+            model._meta.get_field('updated')
+        except FieldDoesNotExist:
+            return None
+        latest = model._default_manager.aggregate(latest=Max('updated'))['latest']
+        params = sorted((key, value) for key, values in request.query_params.lists()
+                        if key not in self.ROLLUP_CACHE_IGNORED_PARAMS for value in values)
+        key = json.dumps([type(self).__module__, type(self).__qualname__, request.user.id,
+                          sorted((key, str(value)) for key, value in self.kwargs.items()), params,
+                          latest.isoformat() if latest else None])
+        return "api-rollup:" + hashlib.sha256(key.encode("utf8")).hexdigest()
+
     def get_rollup(self, request, queryset):
         rollup = {}
         if True if request.query_params.get("rollup", False) in [
             "True", "true", "t", "T"] else False:
-            for key, filter_ in self.ROLLUP.items():
-                rollup[key] = queryset.filter(filter_).aggregate(count=Count('id'))['count']
+            if not self.ROLLUP:
+                return rollup
+            cache_key = self.get_rollup_cache_key(request, queryset)
+            if cache_key:
+                rollup = cache.get(cache_key)
+                if rollup is not None:
+                    return rollup
+            # Count every rollup in one query. Aliases avoid conflicts with model field names.
+            keys = list(self.ROLLUP)
+            counts = queryset.aggregate(**{
+                f"rollup_{i}": Count('id', filter=self.ROLLUP[key], distinct=True)
+                for i, key in enumerate(keys)
+            })
+            rollup = {key: counts[f"rollup_{i}"] for i, key in enumerate(keys)}
+            if cache_key:
+                cache.set(cache_key, rollup, settings.GR_API_ROLLUP_CACHE_SECONDS)
         return rollup
 
     def list(self, request, *args, **kwargs):
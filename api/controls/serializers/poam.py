@@ -1,5 +1,3 @@
-import pathlib
-import pandas
 import structlog
 from structlog import get_logger
 from structlog.stdlib import LoggerFactory
@@ -8,6 +6,7 @@ from rest_framework import serializers
 from api.base.serializers.types import ReadOnlySerializer, WriteOnlySerializer
 from api.controls.serializers.statements import DetailedStatementSerializer
 from controls.models import Poam, System
+from controls.poam_spreadsheet import POAM_SPREADSHEET_PATH, get_spreadsheet
 
 structlog.configure(logger_factory=LoggerFactory())
 logger = get_logger()
@@ -61,41 +60,38 @@ class SimpleSpreadsheetPoamSerializer(ReadOnlySerializer):
     spreadsheet_poams = serializers.SerializerMethodField('get_spreadsheet_poams')
 
     def get_spreadsheet_poams(self, system):
-        print(2, "======== system.id, system", system.id, system)
         poams_list = []
-        counter = 1;
-        fn = "local/poams_list.xlsx"
-        if pathlib.Path(fn).is_file():
-            try:
-                df_dict = pandas.read_excel(fn, header=1)
-                for index, row in df_dict.iterrows():
-                    # import ipdb; ipdb.set_trace()
-                    if "CSAM ID" in system.info  and system.info["CSAM ID"] == row.get('CSAM ID'):
-                        poam_dict = {
-                            "id": index,
-                            "csam_id": row.get('CSAM ID', ""),
-                            "inherited": "No",
-                            "org": row.get('Org', ""),
-                            "sub_org": row.get('Sub Org', ""),
-                            "system_name": row.get('System Name', ""),
-                            "poam_id": row.get('POAM ID', ""   ),
-                            "poam_title": row.get('POAM Title', ""),
-                            "system_type": row.get('System Type', ""),
-                            "detailed_weakness_description": row.get('Detailed Weakness Description', ""),
-                            "status": row.get('Status', "")
-                        }
-                        counter += 1
-                        # Enhance data
-                        # Test for control inheritance
-                        inherited = "No"
-                        if "CA-8" in row.get('POAM Title', ""):
-                            poam_dict['inherited'] = "Yes"
-                            poam_dict['system_name'] = f"{poam_dict['system_name']} inherits from Central Log Server"
-                        poams_list.append(poam_dict)
-            except FileNotFoundError as e:
-                logger.error(f"Error reading file {fn}: {e}")
-            except Exception as e:
-                logger.error(f"Other Error reading file {fn}: {e}")
+        if "CSAM ID" not in system.info:
+            return poams_list
+        fn = POAM_SPREADSHEET_PATH
+        try:
+            spreadsheet = get_spreadsheet(fn)
+            if spreadsheet is None:
+                return poams_list
+            for index, row in spreadsheet.get_rows(system.info["CSAM ID"]):
+                poam_dict = {
+                    "id": index,
+                    "csam_id": row.get('CSAM ID', ""),
+                    "inherited": "No",
+                    "org": row.get('Org', ""),
+                    "sub_org": row.get('Sub Org', ""),
+                    "system_name": row.get('System Name', ""),
+                    "poam_id": row.get('POAM ID', ""   ),
+                    "poam_title": row.get('POAM Title', ""),
+                    "system_type": row.get('System Type', ""),
+                    "detailed_weakness_description": row.get('Detailed Weakness Description', ""),
+                    "status": row.get('Status', "")
+                }
+                # Enhance data
+                # Test for control inheritance
+                if "CA-8" in str(row.get('POAM Title', "")):
+                    poam_dict['inherited'] = "Yes"
+                    poam_dict['system_name'] = f"{poam_dict['system_name']} inherits from Central Log Server"
+                poams_list.append(poam_dict)
+        except FileNotFoundError as e:
+            logger.error(f"Error reading file {fn}: {e}")
+        except Exception as e:
+            logger.error(f"Other Error reading file {fn}: {e}")
         return poams_list
     class Meta:
         model = System
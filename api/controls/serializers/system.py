@@ -5,7 +5,7 @@ from django.core import serializers as serial
 from api.base.serializers.types import ReadOnlySerializer, WriteOnlySerializer
 from api.controls.serializers.element import DetailedElementSerializer
 from api.siteapp.serializers.tags import SimpleTagSerializer
-from controls.models import System, Poam
+from controls.models import System, SystemRollup, Poam
 from siteapp.models import Tag
 import json
 import types
@@ -46,12 +46,32 @@ class SimpleSystemPoamsSerializer(ReadOnlySerializer):
         fields = ['data']
 
 
-class DetailedSystemSerializer(SimpleSystemSerializer):
+class SystemStatusRollupMixin(serializers.Serializer):
+    status_rollup = serializers.SerializerMethodField('get_status_rollup')
+
+    def get_status_rollup(self, system):
+        # Lists load the rollups of a page of systems at once (see SystemViewSet).
+        rollup = system.get_status_rollup()
+        return {
+            "controls_status_count": rollup.get_controls_status_count(),
+            "poam_status_counts": rollup.get_poam_status_counts(),
+            "component_status_counts": rollup.get_component_status_counts(),
+        }
+
+
+class ListSystemSerializer(SimpleSystemSerializer, SystemStatusRollupMixin):
+
+    class Meta:
+        model = System
+        fields = SimpleSystemSerializer.Meta.fields + ['status_rollup']
+
+
+class DetailedSystemSerializer(SimpleSystemSerializer, SystemStatusRollupMixin):
     root_element = DetailedElementSerializer()
 
     class Meta:
         model = System
-        fields = SimpleSystemSerializer.Meta.fields + ['root_element']
+        fields = SimpleSystemSerializer.Meta.fields + ['root_element', 'status_rollup']
 
 
 class WriteElementTagsSerializer(WriteOnlySerializer):
@@ -1,7 +1,4 @@
 from os import system
-import pathlib
-import pandas
-from openpyxl import load_workbook
 from rest_framework.decorators import action
 from rest_framework.response import Response
 
@@ -9,10 +6,11 @@ from api.base.views.base import SerializerClasses
 from api.base.views.viewsets import ReadOnlyViewSet, ReadWriteViewSet
 from api.controls.serializers.element import SimpleElementControlSerializer, DetailedElementControlSerializer
 from api.controls.serializers.poam import DetailedPoamSerializer, SimplePoamSerializer, SimpleSpreadsheetPoamSerializer, SimpleUpdatePoamSpreadsheetSerializer, WritePoamSerializer, UpdatePoamExtraSerializer
-from api.controls.serializers.system import DetailedSystemSerializer, SimpleSystemSerializer, SystemCreateAndSetProposalSerializer, SystemRetrieveProposalsSerializer, SimpleSystemPoamsSerializer
+from api.controls.serializers.system import DetailedSystemSerializer, ListSystemSerializer, SystemCreateAndSetProposalSerializer, SystemRetrieveProposalsSerializer, SimpleSystemPoamsSerializer
 from api.controls.serializers.system_assement_results import DetailedSystemAssessmentResultSerializer, \
     SimpleSystemAssessmentResultSerializer
-from controls.models import System, Element, ElementControl, SystemAssessmentResult, Poam
+from controls.poam_spreadsheet import update_cell as update_poam_spreadsheet_cell
+from controls.models import System, SystemRollup, Element, ElementControl, SystemAssessmentResult, Poam
 from siteapp.models import Proposal, User
 
 
@@ -20,11 +18,18 @@ class SystemViewSet(ReadOnlyViewSet):
     queryset = System.objects.all()
 
     serializer_classes = SerializerClasses(retrieve=DetailedSystemSerializer,
-                                           list=SimpleSystemSerializer,
+                                           list=ListSystemSerializer,
                                            CreateAndSetProposal=SystemCreateAndSetProposalSerializer,
                                            retrieveProposals=SystemRetrieveProposalsSerializer,
                                            getSystemPoams=SimpleSystemPoamsSerializer)
 
+    def paginate_queryset(self, queryset):
+        # Load the status rollups of the whole page in one query.
+        page = super().paginate_queryset(queryset)
+        if page is not None:
+            SystemRollup.load_for_systems(page)
+        return page
+
     @action(detail=True, url_path="CreateAndSetProposal", methods=["POST"])
     def CreateAndSetProposal(self, request, **kwargs):
         system, validated_data = self.validate_serializer_and_get_object(request)
@@ -119,26 +124,9 @@ class SystemPoamSpreadsheetViewSet(ReadOnlyViewSet):
                 column = value
             if key == 'value':
                 value = value
-        print(row, column, value)
 
         system.save()
-        fn = "local/poams_list.xlsx"
-        #load excel file
-        workbook = load_workbook(filename=fn)
-        sheet = workbook.active
-        
-        #open workbook
-        colNames = {}
-        current = 0
-        for col in sheet.iter_cols(min_row=2, max_row=2, min_col=1, max_col=sheet.max_column):
-            colNames[col[0].value.lower()] = current
-            current += 1
-        
-        #modify the desired cell
-        sheet.cell(row=row+2, column=colNames[column]+1).value = value
-        
-        #save the file
-        workbook.save(fn)
+        update_poam_spreadsheet_cell(row, column, value)
 
         serializer_class = self.get_serializer_class('updateSpreadsheet')
         serializer = self.get_serializer(serializer_class, system)
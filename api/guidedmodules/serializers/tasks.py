@@ -1,3 +1,4 @@
+from django.db.models.query import Prefetch
 from rest_framework import serializers
 
 from api.base.serializers.types import ReadOnlySerializer
@@ -12,6 +13,9 @@ class SimpleTaskSerializer(ReadOnlySerializer):
     class Meta:
         model = Task
         fields = ['title_override', 'notes', 'deleted_at', 'cached_state', 'extra', 'uuid']
+        # cached_state reads the Task's TaskStateCacheEntry records, which are
+        # prefetched so that lists of tasks don't need a query per Task.
+        joins = [Prefetch('state_cache')]
 
 class TaskSerializer(SimpleTaskSerializer):
     module = SimpleModuleSerializer()
@@ -19,6 +23,7 @@ class TaskSerializer(SimpleTaskSerializer):
     class Meta:
         model = Task
         fields = SimpleTaskSerializer.Meta.fields + [ 'module']
+        joins = [Prefetch('state_cache')]
 
 
 class DetailedTaskSerializer(SimpleTaskSerializer):
@@ -34,6 +39,7 @@ class DetailedTaskSerializer(SimpleTaskSerializer):
     class Meta:
         model = Task
         fields = SimpleTaskSerializer.Meta.fields + ['project', 'editor', 'module', 'invitation_history']
+        joins = [Prefetch('state_cache')]
 
 
 class SimpleTaskAnswerSerializer(ReadOnlySerializer):
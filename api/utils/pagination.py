@@ -1,15 +1,123 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime
+from uuid import UUID
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
 from rest_framework import pagination
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import _positive_int
 from rest_framework.response import Response
 
 
 class Pagination(pagination.PageNumberPagination):
+    """Page number pagination, or keyset pagination when the request has a
+    `cursor` parameter (empty for the first page). Keyset pages are ordered by
+    the view's `cursor_ordering` (default `cursor_ordering` below) and filtered
+    on the position of the last row of the previous page rather than counted
+    and offset. The total count is only included when `total=true`."""
 
     page_size = 20
     page_size_query_param = 'count'
     max_page_size = 100
 
+    cursor_query_param = 'cursor'
+    total_query_param = 'total'
+    # Fields ending with a unique field, each prefixed with '-' for descending order
+    cursor_ordering = ('-created', '-id')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            return super().paginate_queryset(queryset, request, view=view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        self.ordering = getattr(view, 'cursor_ordering', self.cursor_ordering)
+        position, reverse = self.decode_cursor(request.query_params[self.cursor_query_param])
+
+        self.total_records = None
+        if request.query_params.get(self.total_query_param) in ["True", "true", "t", "T"]:
+            self.total_records = queryset.count()
+
+        # Read one more row than the page size to tell whether there is another page.
+        ordering = [self.reverse_field(field) for field in self.ordering] if reverse else self.ordering
+        if position is not None:
+            try:
+                queryset = queryset.filter(self.get_position_filter(ordering, position))
+            except (ValidationError, ValueError, TypeError):
+                raise NotFound("Invalid cursor")
+        rows = list(queryset.order_by(*ordering)[:page_size + 1])
+        has_more = len(rows) > page_size
+        rows = rows[:page_size]
+        if reverse:
+            rows.reverse()
+            has_next, has_prev = position is not None, has_more
+        else:
+            has_next, has_prev = has_more, position is not None
+
+        self.next_cursor = self.encode_cursor(rows[-1], False) if rows and has_next else None
+        self.prev_cursor = self.encode_cursor(rows[0], True) if rows and has_prev else None
+        self.page_size_used = page_size
+        return rows
+
+    @staticmethod
+    def reverse_field(field):
+        return field[1:] if field.startswith('-') else '-' + field
+
+    @staticmethod
+    def get_position_filter(ordering, position):
+        """Return a filter for the rows after position in the ordering, i.e.
+        (a > x) OR (a = x AND b > y) OR ..."""
+        position_filter = Q()
+        for i, field in enumerate(ordering):
+            name = field.lstrip('-')
+            lookup = '{}__{}'.format(name, 'lt' if field.startswith('-') else 'gt')
+            equal = {f.lstrip('-'): value for f, value in zip(ordering[:i], position[:i])}
+            position_filter |= Q(**equal, **{lookup: position[i]})
+        return position_filter
+
+    def encode_cursor(self, obj, reverse):
+        position = []
+        for field in self.ordering:
+            value = getattr(obj, field.lstrip('-'))
+            if isinstance(value, (datetime, date)):
+                value = value.isoformat()
+            elif isinstance(value, UUID):
+                value = str(value)
+            position.append(value)
+        cursor = json.dumps({"p": position, "r": reverse}, separators=(',', ':'))
+        return base64.urlsafe_b64encode(cursor.encode('utf8')).decode('ascii')
+
+    def decode_cursor(self, cursor):
+        """Return the position and direction of a cursor, or (None, False) for the first page"""
+        if not cursor:
+            return None, False
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf8'))
+            position, reverse = cursor["p"], cursor["r"]
+        except (binascii.Error, UnicodeError, ValueError, TypeError, KeyError):
+            raise NotFound("Invalid cursor")
+        if not isinstance(position, list) or len(position) != len(self.ordering):
+            raise NotFound("Invalid cursor")
+        return position, bool(reverse)
+
+    def get_cursor_paginated_response(self, data):
+        return Response({
+            'pages': {
+                'next_cursor': self.next_cursor,
+                'prev_cursor': self.prev_cursor,
+                'page_size': self.page_size_used,
+                'total_records': self.total_records,
+            },
+            'data': data
+        })
+
     def get_paginated_response(self, data):
+        if getattr(self, 'cursor_mode', False):
+            return self.get_cursor_paginated_response(data)
 
         try:
             prev_page = self.page.previous_page_number()
@@ -0,0 +1,90 @@
+# Precompiled control catalog snapshots.
+#
+# Loading a catalog from the database means deserializing its (multi-megabyte)
+# catalog_json and building its indexes. The compilecatalogs management
+# command writes each catalog's parsed form, indexes and flattened controls
+# to a snapshot file that workers load instead. A snapshot file is:
+#
+#   SNAPSHOT_MAGIC
+#   header length (8 bytes, big-endian)
+#   header (JSON): catalog key, id, metadata, content hash, body offset/length
+#   body (JSON): the catalog, its flattened controls and tokenized prose
+#
+# Listing catalogs only reads the headers. The body is read when a catalog is
+# first used. The content hash is derived from CatalogData.updated, so a
+# snapshot is ignored once its catalog changes. The body is JSON rather than
+# pickle because snapshot files are written to a directory the application
+# can write to, and unpickling a modified file could run arbitrary code.
+
+import hashlib
+import json
+import os
+import os.path
+import struct
+
+from django.conf import settings
+
+SNAPSHOT_MAGIC = b"GOVREADY-Q CATALOG SNAPSHOT 2\n"
+HEADER_LENGTH = struct.Struct(">Q")
+
+
+def get_snapshot_path(catalog_key):
+    return os.path.join(settings.GR_CATALOG_SNAPSHOT_DIR, catalog_key + ".snapshot")
+
+def get_content_hash(catalog_key, catalog_updated):
+    """Return the content hash of a catalog as of the CatalogData.updated timestamp"""
+    return hashlib.sha256("{}\n{}".format(catalog_key, catalog_updated.isoformat()).encode("utf8")).hexdigest()
+
+def write_snapshot(catalog_key, catalog_updated, catalog_id, metadata, body):
+    """Write a snapshot file for a catalog and return its path"""
+    body = json.dumps(body, separators=(",", ":")).encode("utf8")
+    header = {
+        "catalog_key": catalog_key,
+        "catalog_id": catalog_id,
+        "metadata": metadata,
+        "content_hash": get_content_hash(catalog_key, catalog_updated),
+        "body_length": len(body),
+    }
+    # The body follows the header, so its offset depends on the length of
+    # the header, which includes the offset. Pad the offset to a fixed width.
+    header["body_offset"] = 0
+    header_length = len(json.dumps(header).encode("utf8")) + 20
+    header["body_offset"] = len(SNAPSHOT_MAGIC) + HEADER_LENGTH.size + header_length
+    header = json.dumps(header).encode("utf8").ljust(header_length)
+
+    path = get_snapshot_path(catalog_key)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # Write to a temporary name and rename so that workers never read a
+    # partially-written snapshot.
+    tmp_path = "{}.{}.tmp".format(path, os.getpid())
+    with open(tmp_path, "wb") as f:
+        f.write(SNAPSHOT_MAGIC)
+        f.write(HEADER_LENGTH.pack(len(header)))
+        f.write(header)
+        f.write(body)
+    os.replace(tmp_path, path)
+    return path
+
+def read_snapshot_header(catalog_key, catalog_updated):
+    """Return the header of a catalog's snapshot, or None if there is no
+       snapshot or it is not of the current version of the catalog"""
+    path = get_snapshot_path(catalog_key)
+    try:
+        with open(path, "rb") as f:
+            if f.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+                return None
+            header_length, = HEADER_LENGTH.unpack(f.read(HEADER_LENGTH.size))
+            header = json.loads(f.read(header_length).decode("utf8"))
+    except (OSError, ValueError, struct.error):
+        return None
+    if header.get("catalog_key") != catalog_key \
+            or header.get("content_hash") != get_content_hash(catalog_key, catalog_updated):
+        return None
+    return header
+
+def read_snapshot_body(catalog_key, header):
+    """Return the body of a catalog's snapshot given its header"""
+    path = get_snapshot_path(catalog_key)
+    with open(path, "rb") as f:
+        f.seek(header["body_offset"])
+        return json.loads(f.read(header["body_length"]).decode("utf8"))
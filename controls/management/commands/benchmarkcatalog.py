@@ -0,0 +1,72 @@
+# Usage:
+#   python manage.py benchmarkcatalog [--catalog <catalog_key>] [--statements <n>] [--repeat <n>]
+#
+# Times the control catalog lookups made while rendering an SSP, i.e. one
+# control, group and property lookup per control implementation statement.
+#
+# Example:
+#   python3 manage.py benchmarkcatalog --catalog NIST_SP-800-53_rev4 --statements 400
+#
+# Example Docker:
+#   docker exec -it govready-q-dev python3 manage.py benchmarkcatalog --statements 400
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from controls.oscal import Catalog, Catalogs
+
+
+class Command(BaseCommand):
+    help = 'Benchmark control catalog lookups for an SSP-sized set of statements'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--catalog', metavar='catalog_key', nargs='?', required=False, type=str, default=Catalogs.NIST_SP_800_53_rev4, help="Catalog to benchmark")
+        parser.add_argument('--statements', metavar='n', nargs='?', required=False, type=int, default=400, help="Number of statements to look up controls for")
+        parser.add_argument('--repeat', metavar='n', nargs='?', required=False, type=int, default=5, help="Number of times to repeat the benchmark")
+
+    def handle(self, *args, **options):
+
+        start = time.perf_counter()
+        catalog = Catalog(catalog_key=options['catalog'])
+        load_time = time.perf_counter() - start
+        if catalog.status != "ok":
+            raise CommandError("Could not load catalog {}.".format(options['catalog']))
+
+        # Use the catalog's controls, repeated if necessary, as the
+        # statements of an SSP.
+        control_ids = catalog.get_controls_all_ids()
+        if not control_ids:
+            raise CommandError("Catalog {} has no controls.".format(options['catalog']))
+        statement_ids = [control_ids[i % len(control_ids)] for i in range(options['statements'])]
+
+        def indexed_lookups():
+            for control_id in statement_ids:
+                control = catalog.get_control_by_id(control_id)
+                catalog.get_group_title_by_id(catalog.get_group_id_by_control_id(control_id))
+                catalog.get_control_property_by_name(control, "label")
+                catalog.get_control_part_by_name(control, "statement")
+
+        def scanned_lookups():
+            # The same lookups done by scanning the catalog, for comparison.
+            for control_id in statement_ids:
+                control = catalog.find_dict_by_value(catalog.get_controls_all(), "id", control_id)
+                group_id = next((g for g in catalog.get_group_ids() if g.lower() == control_id[:2].lower()), None)
+                catalog.find_dict_by_value(catalog.get_groups(), "id", group_id)
+                catalog.find_dict_by_value(control.get("properties", []), "name", "label")
+                catalog.find_dict_by_value(control.get("parts", []), "name", "statement")
+
+        def flattened_controls():
+            for control_id in statement_ids:
+                catalog.get_flattened_control_as_dict(catalog.get_control_by_id(control_id))
+
+        print(f"Catalog {catalog.catalog_key}: {len(control_ids)} controls, loaded and indexed in {load_time * 1000:.1f} ms")
+        for name, func in (("indexed lookups", indexed_lookups),
+                           ("scanned lookups", scanned_lookups),
+                           ("flattened controls", flattened_controls)):
+            timings = []
+            for i in range(options['repeat']):
+                start = time.perf_counter()
+                func()
+                timings.append(time.perf_counter() - start)
+            print(f"{name:20} {len(statement_ids)} statements: best {min(timings) * 1000:.2f} ms, mean {sum(timings) / len(timings) * 1000:.2f} ms")
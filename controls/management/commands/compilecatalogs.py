@@ -0,0 +1,47 @@
+# Usage:
+#   python manage.py compilecatalogs [--catalog <catalog_key> ...]
+#
+# Compiles control catalogs into snapshot files in GR_CATALOG_SNAPSHOT_DIR
+# that are loaded in place of the catalog JSON stored in the database. Run
+# after deploying or after catalogs change. Snapshots of catalogs that have
+# changed since they were compiled are ignored.
+#
+# Example:
+#   python3 manage.py compilecatalogs --catalog NIST_SP-800-53_rev5
+#
+# Example Docker:
+#   docker exec -it govready-q-dev python3 manage.py compilecatalogs
+
+import os.path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from controls.catalog_snapshot import write_snapshot
+from controls.oscal import Catalog, CatalogData
+
+
+class Command(BaseCommand):
+    help = 'Compile control catalogs into snapshot files for fast loading'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--catalog', metavar='catalog_key', action='append', required=False, help="Catalog to compile (default: all catalogs)")
+
+    def handle(self, *args, **options):
+
+        catalogs = CatalogData.objects.order_by('catalog_key').values_list('catalog_key', 'updated')
+        if options['catalog']:
+            catalogs = catalogs.filter(catalog_key__in=options['catalog'])
+            missing = set(options['catalog']) - set(key for key, updated in catalogs)
+            if missing:
+                raise CommandError("Unknown catalog: {}".format(", ".join(sorted(missing))))
+
+        for catalog_key, updated in catalogs:
+            catalog = Catalog(catalog_key=catalog_key, use_snapshot=False)
+            if catalog.status != "ok":
+                raise CommandError("Could not load catalog {}.".format(catalog_key))
+            path = write_snapshot(catalog_key, updated, catalog.catalog_id, catalog.oscal.get('metadata'),
+                                  catalog.get_snapshot_body())
+            print(f"{catalog_key}\t{len(catalog.controls_all)} controls\t{os.path.getsize(path)} bytes\t{path}")
+
+        # Make this process load the new snapshots.
+        Catalog.ClearCache()
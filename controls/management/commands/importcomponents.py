@@ -1,16 +1,32 @@
+# Usage:
+#   python manage.py importcomponents [--path <dir>] [--importname <name>] [--no-stopinvalid] [--workers <n>]
+#
+# Imports a directory of OSCAL component definition files. With --workers,
+# files are read and validated in a pool of worker processes and the valid
+# components are written to the database in batches by this process. A
+# timing and failure report is printed at the end.
+#
+# Example:
+#   python3 manage.py importcomponents --path local/export/components --workers 4
+
+import json
 import sys
 import os.path
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
 
 from django.core.management import call_command
 from django.core.management.base import BaseCommand, CommandError
-from django.db import transaction, models
+from django.db import connections, transaction, models
 from django.db.utils import OperationalError
 from django.conf import settings
 from pathlib import Path
 from pathlib import PurePath
 from django.utils.text import slugify
 
-# from siteapp.models import User, Organization, Portfolio
+from siteapp.models import User
 from controls.models import Element, Statement
 # from controls.views import system_element_download_oscal_json
 from controls.views import OSCALComponentSerializer, ComponentImporter
@@ -18,6 +34,24 @@ from controls.views import OSCALComponentSerializer, ComponentImporter
 import fs, fs.errors
 
 
+def parse_component_file(path):
+    """Reads and validates an OSCAL component file (in a worker process)
+
+    Returns a tuple of the path, the parsed JSON (None if invalid), an
+    error message (None if valid) and the time taken in seconds.
+    """
+    start = time.perf_counter()
+    try:
+        with open(path) as f:
+            oscal_json = json.load(f)
+        ComponentImporter().validate_component_definition(oscal_json)
+        error = None
+    except Exception as e:
+        oscal_json = None
+        error = str(e.__context__ or e)
+    return path, oscal_json, error, time.perf_counter() - start
+
+
 class Command(BaseCommand):
     help = 'Import directory of component files.'
 
@@ -27,6 +61,8 @@ class Command(BaseCommand):
         parser.add_argument('--importname', metavar='importname', nargs='?', default="Batch component import", help="Name to identify the batch import")
         parser.add_argument('--stopinvalid', default=True, action='store_true')
         parser.add_argument('--no-stopinvalid', dest='stopinvalid', action='store_false')
+        parser.add_argument('--workers', metavar='n', type=int, default=0, help="Number of processes to validate files in (default: validate and import each file in turn)")
+        parser.add_argument('--batch-size', metavar='n', type=int, default=500, help="Number of components to write to the database at a time with --workers")
 
 
     def handle(self, *args, **options):
@@ -41,7 +77,11 @@ class Command(BaseCommand):
             print(f"Import directory {IMPORT_PATH} not found.")
             quit()
 
-        if FORMAT == 'oscal':
+        if FORMAT == 'oscal' and options['workers'] > 0:
+            counter = self.import_in_parallel(sorted(str(path) for path in Path(IMPORT_PATH).rglob('*.json')),
+                                              IMPORT_NAME, STOPINVALID, options['workers'], options['batch_size'])
+
+        elif FORMAT == 'oscal':
             counter = 0
             # Get list of files in directory
             pathlist = Path(IMPORT_PATH).rglob('*.json')
@@ -66,3 +106,64 @@ class Command(BaseCommand):
         # Done
         print(f"Imported {counter} components in {FORMAT} from folder `{IMPORT_PATH}`.")
 
+    def import_in_parallel(self, paths, import_name, stopinvalid, workers, batch_size):
+        """Validates files in a process pool and imports their components in batches, returning the number of files imported"""
+        importer = ComponentImporter()
+        user_owner = User.objects.filter(is_superuser=True)[0]
+        report = []
+        batch = []
+        batch_files = []
+        imported = 0
+
+        def write_batch():
+            # Write the components of the validated files to the database.
+            nonlocal imported
+            if batch:
+                created_components = importer.create_components({'component-definition': {'components': batch}}, user_owner)
+                importer.create_import_record(import_name, created_components, existing_import_record=True)
+                imported += len(batch_files)
+                batch.clear()
+                batch_files.clear()
+
+        # Worker processes don't use the database, and forked ones must not
+        # share this process's connections.
+        connections.close_all()
+        start = time.perf_counter()
+        invalid = None
+        with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as executor:
+            # Results are returned in file order so that, as when importing
+            # serially, the files before an invalid file are imported.
+            results = executor.map(parse_component_file, paths, chunksize=4)
+            for path, oscal_json, error, seconds in results:
+                if error is not None:
+                    report.append((path, seconds, 0, error))
+                    if stopinvalid:
+                        invalid = (path, error)
+                        # Closing the results cancels the files not yet started.
+                        results.close()
+                        break
+                    continue
+                components = oscal_json['component-definition'].get('components', [])
+                report.append((path, seconds, len(components), None))
+                batch.extend(components)
+                batch_files.append(path)
+                if len(batch) >= batch_size:
+                    write_batch()
+        write_batch()
+
+        self.print_report(report, time.perf_counter() - start)
+        if invalid:
+            path, error = invalid
+            print("\nNOTICE - ISSUES DURING COMPONENT IMPORT\n")
+            print({"object": "component", "name": path, "error": error})
+            print("\nPROGRAM HALTED\n")
+            sys.exit()
+        return imported
+
+    def print_report(self, report, elapsed):
+        print(f"{'seconds':>8}  {'components':>10}  file")
+        for path, seconds, components, error in report:
+            print(f"{seconds:8.3f}  {components:10}  {path}" + (f"  INVALID: {' '.join(error.split())}" if error else ""))
+        failures = [path for path, seconds, components, error in report if error]
+        print(f"Validated {len(report)} files in {sum(seconds for path, seconds, components, error in report):.1f} worker seconds,"
+              f" {elapsed:.1f} seconds elapsed, {len(failures)} invalid.")
@@ -0,0 +1,36 @@
+# Usage:
+#   python manage.py rebuildsystemrollups [--system <system_id> ...]
+#
+# Recomputes the materialized control status and POA&M status counts of
+# systems (SystemRollup). Rollups are otherwise recomputed when first read
+# after a statement changes, so this is only needed after statements are
+# changed outside of the application, e.g. by SQL.
+#
+# Example:
+#   python3 manage.py rebuildsystemrollups --system 1
+#
+# Example Docker:
+#   docker exec -it govready-q-dev python3 manage.py rebuildsystemrollups
+
+from django.core.management.base import BaseCommand, CommandError
+
+from controls.models import System, SystemRollup
+
+
+class Command(BaseCommand):
+    help = 'Recompute the control status rollups of systems'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--system', metavar='system_id', action='append', type=int, required=False, help="System to recompute (default: all systems)")
+
+    def handle(self, *args, **options):
+
+        systems = System.objects.select_related('root_element')
+        if options['system']:
+            systems = systems.filter(id__in=options['system'])
+            missing = set(options['system']) - set(system.id for system in systems)
+            if missing:
+                raise CommandError("Unknown system: {}".format(", ".join(str(system_id) for system_id in sorted(missing))))
+
+        count = SystemRollup.rebuild(systems)
+        print(f"Rebuilt the rollups of {count} systems.")
@@ -0,0 +1,26 @@
+# Generated by Django 3.2.19 on 2026-10-18 21:07
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('controls', '0081_auto_20230609_0221'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SystemRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('control_status_counts', models.JSONField(default=list, help_text="[status, count] pairs of the system's control implementation statements.")),
+                ('controls_addressed', models.IntegerField(default=0, help_text='The number of distinct controls with control implementation statements.')),
+                ('poam_status_counts', models.JSONField(default=list, help_text="[status, count] pairs of the system's POA&M statements.")),
+                ('component_status_counts', models.JSONField(default=dict, help_text='[status, count] pairs of control implementation statements, by producer element id.')),
+                ('updated', models.DateTimeField(auto_now=True, help_text='When the counts were computed.')),
+                ('system', models.OneToOneField(help_text='The System whose statements are counted.', on_delete=django.db.models.deletion.CASCADE, related_name='status_rollup', to='controls.system')),
+            ],
+        ),
+    ]
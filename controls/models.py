@@ -1,15 +1,21 @@
 from pathlib import Path
 import os
+from collections import defaultdict
 import json
 from unicodedata import name
 import auto_prefetch
+from django.contrib.contenttypes.models import ContentType
 from django.db import models
 from django.db.models import Count
 from django.db.models import Q
+from django.db.models.functions import Now
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.utils.functional import cached_property
 from guardian.shortcuts import (assign_perm, get_objects_for_user,
                                 get_perms_for_model, get_user_perms,
                                 get_users_with_perms, remove_perm)
+from guardian.utils import get_user_obj_perms_model
 from simple_history.models import HistoricalRecords
 from jsonfield import JSONField
 from natsort import natsorted
@@ -335,6 +341,26 @@ class Element(auto_prefetch.Model, TagModelMixin, AppointmentModelMixin, Request
             )
             return False
 
+    @staticmethod
+    def assign_owner_permissions_in_bulk(user, elements):
+        """Assign a user as an owner of many elements with one insert"""
+        # guardian's bulk assign_perm skips objects a superuser already has
+        # permission on, so create the permission rows directly.
+        element_ids = [element.id for element in elements]
+        UserObjectPermission = get_user_obj_perms_model(Element)
+        content_type = ContentType.objects.get_for_model(Element)
+        UserObjectPermission.objects.bulk_create([
+            UserObjectPermission(permission=perm, user=user, content_type=content_type, object_pk=str(element_id))
+            for perm in get_perms_for_model(Element)
+            for element_id in element_ids
+        ], batch_size=500, ignore_conflicts=True)
+        logger.info(
+            event="update_element_permission assign_owner",
+            comment=f"Assigning {user.username} as an owner of {len(element_ids)} components",
+            object={"object": "element", "count": len(element_ids)},
+            user={"id": user.id, "username": user.username}
+        )
+
     def assign_edit_permissions(self, user):
         try:
             permissions = ['view_element', 'change_element', 'add_element']
@@ -464,86 +490,80 @@ class Element(auto_prefetch.Model, TagModelMixin, AppointmentModelMixin, Request
 
         return result
 
-    @transaction.atomic
     def assign_baseline_controls(self, user, baselines_key, baseline_name):
-        """Assign set of controls from baseline to system.root_element"""
+        """Assign set of controls from baseline to system.root_element
+
+        Returns the changed controls report ({"add": [...], "remove": [...],
+        "no_change": [...]}) or False if the user cannot change the element."""
 
         # Usage
         # s = System.objects.get(pk=20)
         # s.root_element.assign_baseline_controls(user, 's', 'low')
 
-        # Get system's existing selected controls and build list control ids
-        selected_controls_cur = self.controls.all()
-        selected_controls_ids_cur = set([f"{sc.oscal_ctl_id}=+={sc.oscal_catalog_key}" for sc in selected_controls_cur])
-
-        # Create object to track controls added, removed, and no_change in existing selected controls
-        changed_controls = {"add": [], "remove": [], "no_change": []}
-
-        # Does user have edit permissions on system?
-        can_assign_controls = user.has_perm('change_element', self)
-        if can_assign_controls:
-            bs = Baselines()
-            controls = bs.get_baseline_controls(baselines_key, baseline_name)
-            for oscal_ctl_id in controls:
-                if f"{oscal_ctl_id}=+={baselines_key}" in selected_controls_ids_cur:
-                    # Control already in selected, just append to 'no_change' list
-                    changed_controls['no_change'].append(f"{oscal_ctl_id}=+={baselines_key}")
-                    next
-                else:
-                    # Control is in selected, add control to selected controls and append to 'add' list
-                    ec = ElementControl(element=self, oscal_ctl_id=oscal_ctl_id, oscal_catalog_key=baselines_key)
-                    ec.save()
-                    changed_controls['add'].append(f"{oscal_ctl_id}=+={baselines_key}")
-            # We are done adding new controls to selected
-            # Now remove controls previously selected but not in new baseline
-            selected_controls_ids_new = set([f"{oscal_ctl_id}=+={baselines_key}" for oscal_ctl_id in controls])
-            for scc in selected_controls_ids_cur:
-                if scc not in selected_controls_ids_new:
-                    oscal_ctl_id_rm, catalog_key_rm = scc.split("=+=")
-                    remove_result = self.remove_element_control(oscal_ctl_id_rm, catalog_key_rm)
-                    if remove_result:
-                        changed_controls['remove'].append(scc)
-            return True
-        else:
-            # print("User does not have permission to assign selected controls to element's system.")
-            return False
+        return Element.assign_baseline_controls_in_bulk(user, [self], baselines_key, baseline_name)[self.id]
 
-    @transaction.atomic
     def add_baseline_controls(self, user, baselines_key, baseline_name):
         """Add additional set of controls from baseline to system.root_element without changing existing assigned controls"""
 
         # Usage
         # s = System.objects.get(pk=20)
-        # s.root_element.assign_baseline_controls(user, 's', 'low')
+        # s.root_element.add_baseline_controls(user, 's', 'low')
+
+        return Element.assign_baseline_controls_in_bulk(user, [self], baselines_key, baseline_name, remove_others=False)[self.id]
 
-        # Get system's existing selected controls and build list control ids
-        selected_controls_cur = self.controls.all()
-        selected_controls_ids_cur = set([f"{sc.oscal_ctl_id}=+={sc.oscal_catalog_key}" for sc in selected_controls_cur])
-
-        # Create object to track controls added, removed, and no_change in existing selected controls
-        changed_controls = {"add": [], "remove": [], "no_change": []}
-
-        # Does user have edit permissions on system?
-        can_assign_controls = user.has_perm('change_element', self)
-        if can_assign_controls:
-            bs = Baselines()
-            controls = bs.get_baseline_controls(baselines_key, baseline_name)
-            for oscal_ctl_id in controls:
-                if f"{oscal_ctl_id}=+={baselines_key}" in selected_controls_ids_cur:
-                    # Control already in selected, just append to 'no_change' list
-                    changed_controls['no_change'].append(f"{oscal_ctl_id}=+={baselines_key}")
-                    next
+    @staticmethod
+    @transaction.atomic
+    def assign_baseline_controls_in_bulk(user, elements, baselines_key, baseline_name, remove_others=True):
+        """Assign set of controls from baseline to many system root elements
+
+        Controls of the baseline that are not selected are added and, if
+        remove_others, selected controls not in the baseline are removed.
+        Returns a dict mapping element ids to the changed controls report, or
+        to False if the user cannot change the element or the baseline does
+        not exist."""
+
+        changed_controls_by_element = {element.id: False for element in elements}
+        controls = Baselines().get_baseline_controls(baselines_key, baseline_name)
+        if controls is False:
+            return changed_controls_by_element
+        baseline_ids = [f"{oscal_ctl_id}=+={baselines_key}" for oscal_ctl_id in controls]
+        baseline_ids_set = set(baseline_ids)
+
+        # Does user have edit permissions on systems?
+        element_ids = list(get_objects_for_user(user, 'controls.change_element', Element.objects.filter(id__in=changed_controls_by_element.keys()))
+                           .values_list('id', flat=True))
+
+        # Get systems' existing selected controls and build sets of control ids
+        selected_controls_cur = defaultdict(dict)
+        for ec_id, element_id, oscal_ctl_id, oscal_catalog_key in ElementControl.objects.filter(element_id__in=element_ids)\
+                .values_list('id', 'element_id', 'oscal_ctl_id', 'oscal_catalog_key'):
+            selected_controls_cur[element_id][f"{oscal_ctl_id}=+={oscal_catalog_key}"] = ec_id
+
+        new_element_controls = []
+        removed_element_control_ids = []
+        for element_id in element_ids:
+            selected_controls_ids_cur = selected_controls_cur[element_id]
+            # Track controls added, removed, and no_change in existing selected controls
+            changed_controls = {"add": [], "remove": [], "no_change": []}
+            for control_id in baseline_ids:
+                if control_id in selected_controls_ids_cur:
+                    changed_controls['no_change'].append(control_id)
                 else:
-                    # Control is in selected, add control to selected controls and append to 'add' list
-                    ec = ElementControl(element=self, oscal_ctl_id=oscal_ctl_id, oscal_catalog_key=baselines_key)
-                    ec.save()
-                    changed_controls['add'].append(f"{oscal_ctl_id}=+={baselines_key}")
-            # We are done adding new controls to selected
-            # Do not change any existing controls
-            return True
-        else:
-            # print("User does not have permission to assign selected controls to element's system.")
-            return False
+                    oscal_ctl_id, oscal_catalog_key = control_id.split("=+=")
+                    new_element_controls.append(ElementControl(element_id=element_id, oscal_ctl_id=oscal_ctl_id, oscal_catalog_key=oscal_catalog_key))
+                    changed_controls['add'].append(control_id)
+            if remove_others:
+                # Remove controls previously selected but not in new baseline
+                for control_id, ec_id in selected_controls_ids_cur.items():
+                    if control_id not in baseline_ids_set:
+                        removed_element_control_ids.append(ec_id)
+                        changed_controls['remove'].append(control_id)
+            changed_controls_by_element[element_id] = changed_controls
+
+        ElementControl.objects.bulk_create(new_element_controls, batch_size=500)
+        if removed_element_control_ids:
+            ElementControl.objects.filter(id__in=removed_element_control_ids).delete()
+        return changed_controls_by_element
 
     def statements(self, statement_type):
         """Return on the statements of statement_type produced by this element"""
@@ -862,35 +882,23 @@ class System(auto_prefetch.Model, TagModelMixin, ProposalModelMixin):
 
     @cached_property
     def control_implementation_as_dict(self):
-        self.pid_current = None
+        # Define status options
+        impl_statuses = ["Not implemented", "Planned", "Partially implemented", "Implemented", "Unknown"]
 
         def combined_smt_partial(smt):
             """ Return the built partial statement to display in a document """
-            # Define status options
-            impl_statuses = ["Not implemented", "Planned", "Partially implemented", "Implemented", "Unknown"]
-            status_str = ""
-            for status in impl_statuses:
-                if (smt.status is not None) and (smt.status.lower() == status.lower()):
-                    status_str += f'[x] {status} '
-                else:
-                    status_str += f'<span style="color: #888;">[ ] {status}</span> '
-            # Conditionally add statement part in the beginning of a block of statements related to a part
-            print(f"self.pid_current: {self.pid_current}")
-            # if smt.pid != "" and smt.pid != self.pid_current:
-            #     smts_as_dict[smt.sid]['combined_smt'] += f"{smt.pid}.\n"
-            #     print(f"self.pid_current: {self.pid_current} XXXXXXXXXXXXX") # DEBUG
-            #     self.pid_current = smt.pid
-            if smt.producer_element:
-                smt_formatted = smt.body.replace('\n','<br/>')
-                # TODO: Clean up special characters
-                smt_formatted = smt_formatted.replace(u"\u2019", "'").replace(u"\u2022", "<li>")
-                # Poor performance, at least in some instances, appears to being caused by `smt.producer_element.name`
-                # parameter in the above statement.
-                # When "smt.producer_element.name" the provided as a fixed string (e.g, "smt.producer_element.name")
-                # for testing purposes, the loop runs 3x faster
-                # The reference `smt.producer_element.name` appears to be calling the database and creating poor performance
-                # even where there are no statements.
-            return f"<i>{smt.producer_element.name}</i><br/>{status_str}<br/><br/>{smt_formatted}<br/><br/>"
+            status = smt.status.lower() if smt.status is not None else None
+            status_str = "".join(
+                f'[x] {impl_status} ' if status == impl_status.lower()
+                else f'<span style="color: #888;">[ ] {impl_status}</span> '
+                for impl_status in impl_statuses)
+            smt_formatted = smt.body.replace('\n','<br/>')
+            # TODO: Clean up special characters
+            smt_formatted = smt_formatted.replace(u"\u2019", "'").replace(u"\u2022", "<li>")
+            # The producer element is fetched in the same query as the statements
+            # (select_related below), since fetching it for each statement was slow.
+            producer_element_name = smt.producer_element.name if smt.producer_element else ""
+            return f"<i>{producer_element_name}</i><br/>{status_str}<br/><br/>{smt_formatted}<br/><br/>"
 
         # Fetch all controls from assigned baseline
         elm = self.root_element
@@ -909,47 +917,42 @@ class System(auto_prefetch.Model, TagModelMixin, ProposalModelMixin):
                                                         }
 
         # Get the smts_control_implementations ordered by part, e.g. pid
-        smts_all = elm.statements_consumed.filter(Q(statement_type=StatementTypeEnum.CONTROL_IMPLEMENTATION_LEGACY.name) | 
-            Q(statement_type=StatementTypeEnum.CONTROL_IMPLEMENTATION.name)).order_by('pid')
+        smts_all = elm.statements_consumed.filter(Q(statement_type=StatementTypeEnum.CONTROL_IMPLEMENTATION_LEGACY.name) |
+            Q(statement_type=StatementTypeEnum.CONTROL_IMPLEMENTATION.name)).order_by('pid').select_related('producer_element')
 
         # Populate control statement if set for system and/or control
         # TODO: Add conditional test for adding legacy control implementation statements
+        # Collect the pieces of each control's combined statement and join them at the end.
+        self.pid_current = None
+        combined_smt_parts = defaultdict(list)
         for smt in smts_all:
             if smt.sid in smts_as_dict:
                 smts_as_dict[smt.sid]['control_impl_smts_legacy'].append(smt)
                 if smt.pid != "" and smt.pid != self.pid_current:
-                    smts_as_dict[smt.sid]['combined_smt'] += f"{smt.pid}.\n"
+                    combined_smt_parts[smt.sid].append(f"{smt.pid}.\n")
                     self.pid_current = smt.pid
-                smts_as_dict[smt.sid]['combined_smt'] += combined_smt_partial(smt)
+                combined_smt_parts[smt.sid].append(combined_smt_partial(smt))
+        for sid, parts in combined_smt_parts.items():
+            smts_as_dict[sid]['combined_smt'] = "".join(parts)
 
         # Return the dictionary
         return smts_as_dict
 
+    def get_status_rollup(self):
+        """Return the SystemRollup of this system's statement status counts"""
+        if not hasattr(self, '_status_rollup'):
+            SystemRollup.load_for_systems([self])
+        return self._status_rollup
+
     @cached_property
     def controls_status_count(self):
         """Retrieve counts of control status"""
-
-        status_list = ['Not Implemented', 'Planned', 'Partially Implemented', 'Implemented', 'Unknown']
-        status_stats = {status: 0 for status in status_list}
-        # Fetch all selected controls
-        elm = self.root_element
-
-        counts = Statement.objects.filter(statement_type=StatementTypeEnum.CONTROL_IMPLEMENTATION.name, status__in=status_list).values('status').order_by('status').annotate(count=Count('status'))
-        status_stats.update({r['status']: r['count'] for r in counts})
-
-        # TODO add index on statement status
-        # Get overall controls addressed (e.g., covered)
-        status_stats['Addressed'] = elm.statements_consumed.filter(statement_type=StatementTypeEnum.CONTROL_IMPLEMENTATION.name).values('sid').distinct().count()
-        return status_stats
+        return self.get_status_rollup().get_controls_status_count()
 
     @cached_property
     def poam_status_counts(self):
         """Retrieve counts of poam status"""
-
-        status_qr = self.root_element.statements_consumed.all().values('status').order_by('status').annotate(
-            count=Count('status'))
-        status_counts = {sc['status']:sc['count'] for sc in status_qr}
-        return status_counts
+        return self.get_status_rollup().get_poam_status_counts()
 
     # @property (See below for creation of property from method)
     def get_producer_elements(self):
@@ -979,24 +982,22 @@ class System(auto_prefetch.Model, TagModelMixin, ProposalModelMixin):
     producer_elements_control_impl_smts_dict = cached_property(get_producer_elements_control_impl_smts_dict)
 
     def get_producer_elements_control_impl_smts_status_dict(self):
-        components_smts = self.producer_elements_control_impl_smts_dict
-        components_smts_status = {}
-        for component in components_smts.keys():
-            cmpt_smts_status = {}
-            for smt in components_smts[component]:
-                if smt.status in cmpt_smts_status:
-                    cmpt_smts_status[smt.status] += 1
-                else:
-                    cmpt_smts_status[smt.status] = 1
-            components_smts_status[component] = cmpt_smts_status
-        return components_smts_status
+        component_status_counts = self.get_status_rollup().get_component_status_counts()
+        components = Element.objects.in_bulk(component_status_counts.keys())
+        return {
+            components[component_id]: status_counts
+            for component_id, status_counts in component_status_counts.items()
+            if component_id in components
+        }
 
     producer_elements_control_impl_smts_status_dict = cached_property(get_producer_elements_control_impl_smts_status_dict)
 
     def set_component_control_status(self, element, status):
         """Batch update status of system control implementation statements for a specific element."""
 
-        self.root_element.statements_consumed.filter(producer_element=element, statement_type=StatementTypeEnum.CONTROL_IMPLEMENTATION.name).update(status=status)
+        # Set updated, which versions the system's exported documents (Task.get_answers_version).
+        self.root_element.statements_consumed.filter(producer_element=element, statement_type=StatementTypeEnum.CONTROL_IMPLEMENTATION.name).update(status=status, updated=Now())
+        SystemRollup.invalidate([self.root_element_id])
         return True
 
     def add_event(self, event_type, description, info={}):
@@ -1011,6 +1012,127 @@ class System(auto_prefetch.Model, TagModelMixin, ProposalModelMixin):
 
         return se
 
+class SystemRollup(models.Model):
+    """Materialized counts of a System's statements by status, for dashboards.
+    A rollup is deleted whenever a statement consumed by the system changes
+    and is recomputed the next time it is read. Status counts are stored as
+    lists of [status, count] pairs because a status may be null."""
+
+    # Statuses counted by System.controls_status_count.
+    CONTROL_STATUSES = ['Not Implemented', 'Planned', 'Partially Implemented', 'Implemented', 'Unknown']
+
+    system = models.OneToOneField(System, related_name="status_rollup", on_delete=models.CASCADE,
+                                  help_text="The System whose statements are counted.")
+    control_status_counts = models.JSONField(default=list, help_text="[status, count] pairs of the system's control implementation statements.")
+    controls_addressed = models.IntegerField(default=0, help_text="The number of distinct controls with control implementation statements.")
+    poam_status_counts = models.JSONField(default=list, help_text="[status, count] pairs of the system's POA&M statements.")
+    component_status_counts = models.JSONField(default=dict, help_text="[status, count] pairs of control implementation statements, by producer element id.")
+    updated = models.DateTimeField(auto_now=True, help_text="When the counts were computed.")
+
+    def __repr__(self):
+        # For debugging.
+        return "<SystemRollup system=%s addressed=%d>" % (self.system_id, self.controls_addressed)
+
+    def get_controls_status_count(self):
+        status_stats = {status: 0 for status in SystemRollup.CONTROL_STATUSES}
+        status_stats.update({status: count for status, count in self.control_status_counts if status in status_stats})
+        # Get overall controls addressed (e.g., covered)
+        status_stats['Addressed'] = self.controls_addressed
+        return status_stats
+
+    def get_poam_status_counts(self):
+        return {status: count for status, count in self.poam_status_counts}
+
+    def get_component_status_counts(self):
+        return {
+            int(component_id): {status: count for status, count in status_counts}
+            for component_id, status_counts in self.component_status_counts.items()
+        }
+
+    @staticmethod
+    def invalidate(element_ids):
+        """Delete the rollups of the systems whose root elements are given, e.g. after their statements change"""
+        element_ids = [element_id for element_id in element_ids if element_id is not None]
+        if element_ids:
+            with transaction.atomic():
+                # Wait for rollups of these systems that are being computed
+                # (see lock_systems) so that they are deleted here rather
+                # than stored after the change.
+                SystemRollup.lock_systems(System.objects.filter(root_element__in=element_ids))
+                SystemRollup.objects.filter(system__root_element__in=element_ids).delete()
+
+    @staticmethod
+    def lock_systems(systems):
+        """Lock the rows of systems until the end of the transaction. Rollups are
+        computed and stored, and invalidated, while holding this lock, so that a
+        rollup computed before a statement changes is never stored after it is
+        invalidated."""
+        if not isinstance(systems, models.QuerySet):
+            systems = System.objects.filter(id__in=[system.id for system in systems])
+        # Lock in a consistent order to avoid deadlocks.
+        list(systems.select_for_update().order_by('id').values_list('id', flat=True))
+
+    @staticmethod
+    def load_for_systems(systems):
+        """Load (computing if necessary) the rollups of many systems at once, and set
+        them on the System instances for System.get_status_rollup"""
+        systems = list(systems)
+        rollups = { rollup.system_id: rollup for rollup in SystemRollup.objects.filter(system__in=systems) }
+        missing = [system for system in systems if system.id not in rollups]
+        if missing:
+            with transaction.atomic():
+                SystemRollup.lock_systems(missing)
+                computed = SystemRollup.compute(missing)
+                SystemRollup.objects.bulk_create(computed, ignore_conflicts=True)
+            rollups.update({ rollup.system_id: rollup for rollup in computed })
+        for system in systems:
+            system._status_rollup = rollups[system.id]
+        return rollups
+
+    @staticmethod
+    def compute(systems):
+        """Return new (unsaved) rollups for the systems, using a constant number of queries"""
+        rollups = {
+            system.root_element_id: SystemRollup(system=system, control_status_counts=[], poam_status_counts=[],
+                                                 component_status_counts={})
+            for system in systems
+        }
+        statements = Statement.objects.filter(consumer_element__in=list(rollups)).order_by()
+
+        # Control implementation statements by system, component and status.
+        control_status_counts = defaultdict(lambda: defaultdict(int))
+        for row in statements.filter(statement_type=StatementTypeEnum.CONTROL_IMPLEMENTATION.name)\
+                .values('consumer_element', 'producer_element', 'status').annotate(count=Count('id')):
+            rollup = rollups[row['consumer_element']]
+            control_status_counts[row['consumer_element']][row['status']] += row['count']
+            if row['producer_element'] is not None:
+                rollup.component_status_counts.setdefault(str(row['producer_element']), []).append([row['status'], row['count']])
+        for element_id, status_counts in control_status_counts.items():
+            rollups[element_id].control_status_counts = [[status, count] for status, count in status_counts.items()]
+
+        for row in statements.filter(statement_type=StatementTypeEnum.CONTROL_IMPLEMENTATION.name)\
+                .values('consumer_element').annotate(addressed=Count('sid', distinct=True)):
+            rollups[row['consumer_element']].controls_addressed = row['addressed']
+
+        for row in statements.filter(statement_type=StatementTypeEnum.POAM.name)\
+                .values('consumer_element', 'status').annotate(count=Count('id')):
+            rollups[row['consumer_element']].poam_status_counts.append([row['status'], row['count']])
+
+        return list(rollups.values())
+
+    @staticmethod
+    def rebuild(systems=None):
+        """Recompute the rollups of the given systems, or of all systems"""
+        if systems is None:
+            systems = System.objects.all()
+        systems = list(systems)
+        with transaction.atomic():
+            SystemRollup.lock_systems(systems)
+            SystemRollup.objects.filter(system__in=systems).delete()
+            SystemRollup.objects.bulk_create(SystemRollup.compute(systems))
+        return len(systems)
+
+
 class SystemEvent(auto_prefetch.Model, TagModelMixin, BaseModel):
     system = auto_prefetch.ForeignKey('System', related_name='events', on_delete=models.CASCADE, blank=True,
                                       null=True, help_text="Events related to the system")
@@ -1073,10 +1195,16 @@ class ElementCommonControl(auto_prefetch.Model, BaseModel):
 class Baselines(object):
     """Represent list of baselines"""
 
+    # Baselines by catalog key, cached along with the CatalogData.updated
+    # timestamp they were loaded at so that they are reloaded when the
+    # catalog changes: { catalog_key: (updated, baselines_json) }
+    _cache = {}
+
     def __init__(self):
 
         self.file_path = BASELINE_PATH
-        self.baselines_keys = self._list_keys()
+        self.catalogs_updated = self._list_catalogs_updated()
+        self.baselines_keys = list(self.catalogs_updated)
 
         # Usage
         # from controls.models import Baselines
@@ -1087,15 +1215,19 @@ class Baselines(object):
         # # Returns ['ac-1', 'ac-2', 'ac-2.1', 'ac-2.2', ...]
         # bs.get_baseline_controls('NIST_SP-800-53_rev4', 'moderate')
 
-    def _list_keys(self):
+    def _list_catalogs_updated(self):
         # TODO: only return keys for records that have baselines?
-        return list(CatalogData.objects.order_by('catalog_key').values_list('catalog_key', flat=True).distinct())
+        return dict(CatalogData.objects.order_by('catalog_key').values_list('catalog_key', 'updated'))
 
     def _load_json(self, baselines_key):
         """Read baseline file - JSON"""
 
-        catalog_record = CatalogData.objects.get(catalog_key=baselines_key)
-        baselines = catalog_record.baselines_json
+        updated = self.catalogs_updated.get(baselines_key)
+        cached = Baselines._cache.get(baselines_key)
+        if cached is None or cached[0] != updated:
+            baselines_json = CatalogData.objects.values_list('baselines_json', flat=True).get(catalog_key=baselines_key)
+            cached = Baselines._cache[baselines_key] = (updated, baselines_json)
+        baselines = cached[1]
         if baselines:
             return baselines
         else:
@@ -1108,8 +1240,8 @@ class Baselines(object):
         else:
             print("Requested baselines_key not found in baselines_key data file")
             return False
-        if baseline_name in data.keys():
-            return data[baseline_name]['controls']
+        if data and baseline_name in data.keys():
+            return list(data[baseline_name]['controls'])
         else:
             print("Requested baseline name not found in baselines_key data file")
             return False
@@ -1216,6 +1348,22 @@ class Poam(BaseModel):
     #   - On Save be sure to replace any '\r\n' with '\n' added by round-tripping with excel
 
 
+# Invalidate system rollups when statements change. Signals are also sent for
+# each object of a queryset delete and of cascading deletes, which don't call
+# Model.delete. Bulk creates and queryset updates send no signals, so code
+# that uses them calls SystemRollup.invalidate itself.
+
+@receiver([post_save, post_delete], sender=Statement)
+def invalidate_statement_system_rollup(sender, instance, **kwargs):
+    SystemRollup.invalidate([instance.consumer_element_id])
+
+@receiver([post_save, post_delete], sender=Poam)
+def invalidate_poam_system_rollup(sender, instance, **kwargs):
+    # The statement is gone if it is being deleted along with the Poam, in
+    # which case its own signal invalidates the rollup.
+    SystemRollup.invalidate(Statement.objects.filter(id=instance.statement_id).values_list('consumer_element_id', flat=True))
+
+
 class Deployment(auto_prefetch.Model, BaseModel):
     name = models.CharField(max_length=250, help_text="Name of the deployment", unique=False, blank=False, null=False)
     description = models.CharField(max_length=255, help_text="Brief description of the deployment", unique=False,
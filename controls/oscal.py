@@ -1,12 +1,14 @@
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
 import os
 import json
 import yaml
 import re
 from pathlib import Path
 import sys
+import threading
 
 import auto_prefetch
+from django.conf import settings
 from django.db import models
 from django.utils.functional import cached_property
 from controls.utilities import *
@@ -39,21 +41,30 @@ class Catalogs(object):
     CMMC_ver1 = 'CMMC_ver1'
 
     def __init__(self):
-        self.catalog_keys = self._list_catalog_keys()
+        self.catalog_updated = self._list_catalogs_updated()
+        self.catalog_keys = list(self.catalog_updated)
         self.index = self._build_index()
 
-    def _list_catalog_keys(self):
-        return list(CatalogData.objects.order_by('catalog_key').values_list('catalog_key', flat=True).distinct())
+    def _list_catalogs_updated(self):
+        return dict(CatalogData.objects.order_by('catalog_key').values_list('catalog_key', 'updated'))
 
     def _load_catalog_json(self, catalog_key):
-        catalog = Catalog(catalog_key)
-        return catalog._load_catalog_json()
+        return CatalogData.objects.get(catalog_key=catalog_key).catalog_json['catalog']
+
+    def _load_catalog_summary(self, catalog_key):
+        # Use the header of the catalog's snapshot, if it is up to date,
+        # rather than loading the whole catalog.
+        from controls.catalog_snapshot import read_snapshot_header
+        header = read_snapshot_header(catalog_key, self.catalog_updated[catalog_key])
+        if header:
+            return { 'id': header['catalog_id'], 'metadata': header['metadata'] }
+        return self._load_catalog_json(catalog_key)
 
     def _build_index(self):
         """Build a small catalog_index from metadata"""
         index = []
         for catalog_key in self.catalog_keys:
-            catalog = self._load_catalog_json(catalog_key)
+            catalog = self._load_catalog_summary(catalog_key)
             index.append(
                 {'id': catalog['id'], 'catalog_key': catalog_key, 'catalog_key_display': catalog_key.replace("_", " "),
                  'metadata': catalog['metadata']})
@@ -69,26 +80,115 @@ class Catalogs(object):
         """
         return [Catalog.GetInstance(catalog_key=key) for key in self.catalog_keys]
 
+# Matches parameter references in control prose, e.g. "{{ ac-1_prm_1 }}".
+PARAMETER_REFERENCE = re.compile(r"{{ ([^\s{}]+) }}")
+
+def tokenize_parameter_text(text):
+    """Split text into a tuple alternating between literal text and the ids
+       of the parameters referenced between them, starting and ending with
+       literal text."""
+    return tuple(PARAMETER_REFERENCE.split(text))
+
+class CatalogInstanceCache(object):
+    """A size-bounded cache of Catalog instances, one per catalog and set of
+       organization-defined parameter values, that evicts the least recently
+       used instances."""
+
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, create_func):
+        with self.lock:
+            if key in self.entries:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return self.entries[key]
+            self.misses += 1
+
+        value = create_func()
+
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self):
+        with self.lock:
+            instances = list(self.entries.values())
+        lookups = self.hits + self.misses
+        return {
+            "size": len(instances),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": (self.hits / lookups) if lookups else None,
+            "overlay_bytes": sum(instance.get_overlay_size() for instance in instances),
+        }
+
 class Catalog(object):
     """Represent a catalog"""
 
-    # Create a singleton instance of this class per catalog. GetInstance returns
-    # that singleton instance. Instead of doing
+    # The parsed catalog and its indexes, which don't depend on parameter
+    # values, are loaded once per catalog and shared by every instance for
+    # that catalog returned by GetInstance. Each instance is a thin overlay
+    # that applies its parameter values to controls as they are requested.
+    SHARED_ATTRIBUTES = ("oscal", "status", "status_message", "catalog_id", "info",
+                         "groups_by_id", "group_ids_by_prefix", "controls_all", "controls_by_id",
+                         "control_parts_by_name", "control_properties_by_name",
+                         "control_parameters_by_id", "parameters_by_id", "parameters_by_control",
+                         "prose_segments")
+    _bases = {}
+    _bases_lock = threading.Lock()
+
+    # GetInstance returns a shared instance of this class per catalog and set
+    # of parameter values. Instead of doing
     # `cg = Catalog(catalog_key='NIST_SP-800-53_rev4')`,
     # do `cg = Catalog.GetInstance(catalog_key='NIST_SP-800-53_rev4')`.
     @classmethod
     def GetInstance(cls, catalog_key='NIST_SP-800-53_rev4', parameter_values=dict()):
-        # Create a new instance of Catalog() the first time for each
-        # catalog key / parameter combo
-        # this method is called. Keep it in memory indefinitely.
-        # Clear cache only if a catalog itself changes
-
+        # Instances are kept in a least-recently-used cache, sized by
+        # settings.GR_CATALOG_CACHE_SIZE, so that many distinct sets of
+        # parameter values don't grow memory without bound.
         catalog_instance_key = Catalog._catalog_instance_key(catalog_key, parameter_values)
+        return catalog_instances.get(catalog_instance_key,
+            lambda: Catalog(catalog_key=catalog_key, parameter_values=parameter_values,
+                            base=cls._get_base(catalog_key)))
+
+    @classmethod
+    def _get_base(cls, catalog_key):
+        # Return the instance holding the parsed catalog, loading it the first
+        # time the catalog is used.
+        with cls._bases_lock:
+            if catalog_key not in cls._bases:
+                cls._bases[catalog_key] = Catalog(catalog_key=catalog_key)
+            return cls._bases[catalog_key]
 
-        if not hasattr(cls, catalog_instance_key):
-            new_catalog = Catalog(catalog_key=catalog_key, parameter_values=parameter_values)
-            setattr(cls, catalog_instance_key, new_catalog)
-        return getattr(cls, catalog_instance_key)
+    @classmethod
+    def ClearCache(cls, catalog_key=None):
+        # Forget loaded catalogs, e.g. after a catalog itself changes.
+        with cls._bases_lock:
+            if catalog_key is None:
+                cls._bases.clear()
+            else:
+                cls._bases.pop(catalog_key, None)
+        catalog_instances.clear()
+
+    @staticmethod
+    def GetCacheStats():
+        return catalog_instances.stats()
 
     @staticmethod
     def _catalog_instance_key(catalog_key, parameter_values):
@@ -98,11 +198,27 @@ class Catalog(object):
             catalog_instance_key += '_' + str(parameter_values_hash)
         return catalog_instance_key.replace('-', '_')
 
-    def __init__(self, catalog_key='NIST_SP-800-53_rev4', parameter_values=dict()):
+    def __init__(self, catalog_key='NIST_SP-800-53_rev4', parameter_values=dict(), base=None, use_snapshot=True):
         self.catalog_key = catalog_key
         self.catalog_key_display = catalog_key.replace("_", " ")
         self.catalog_path = CATALOG_PATH
         self.catalog_file = catalog_key + "_catalog.json"
+        self.parameter_values = parameter_values
+        # Flattened controls with this instance's parameter values applied,
+        # by control id, computed as they are requested.
+        self.flattened_controls = {}
+        if base is not None:
+            for attr in Catalog.SHARED_ATTRIBUTES:
+                setattr(self, attr, getattr(base, attr))
+            if not parameter_values:
+                # Without parameter values the flattened controls are the
+                # same as the base's, which may come from a snapshot.
+                self.flattened_controls = base.flattened_controls
+            self.from_snapshot = base.from_snapshot
+            return
+        self.from_snapshot = use_snapshot and self._load_snapshot()
+        if self.from_snapshot:
+            return
         try:
             self.oscal = self._load_catalog_json()
             self.status = "ok"
@@ -117,14 +233,60 @@ class Catalog(object):
             self.catalog_id = None
             self.info = {}
             self.info['groups'] = None
-        # Precalculate the flattened versions of controls to improve performance
-        # WARNING TODO: This precalculation along with instance caching of controls
-        # may cause a problem in multi-tenant environment where different tenants have
-        # have different organizational defined parameters.
-        self.parameter_values = parameter_values
-        self.flattened_controls_all_as_dict = self.get_flattened_controls_all_as_dict()
-        self.flattened_controls_all_as_dict_list = self.get_flattened_controls_all_as_dict_list()
+        # Index groups, controls and their parts, properties and parameters once
+        # so that lookups don't scan the catalog.
+        self._build_indexes()
         self.parameters_by_control = self._cache_parameters_by_control()
+        # Control prose as Markdown, split by tokenize_parameter_text, by
+        # (control id, part types).
+        self.prose_segments = {}
+
+    def _load_snapshot(self):
+        """Load the catalog from its compiled snapshot, if it has an up-to-date one"""
+        from controls.catalog_snapshot import get_snapshot_path, read_snapshot_header, read_snapshot_body
+        if not os.path.exists(get_snapshot_path(self.catalog_key)):
+            return False
+        catalog_updated = CatalogData.objects.filter(catalog_key=self.catalog_key).values_list('updated', flat=True).first()
+        header = catalog_updated and read_snapshot_header(self.catalog_key, catalog_updated)
+        if not header:
+            return False
+        body = read_snapshot_body(self.catalog_key, header)
+        self.oscal = body["oscal"]
+        self.status = body["status"]
+        self.status_message = body["status_message"]
+        self.catalog_id = body["catalog_id"]
+        self.info = {}
+        self.info['groups'] = self.get_groups()
+        # The indexes refer to the objects of the catalog, so they are built
+        # again rather than saved in the snapshot.
+        self._build_indexes()
+        self.parameters_by_control = self._cache_parameters_by_control()
+        self.prose_segments = {
+            (control_id, frozenset(part_types)): tuple(segments)
+            for control_id, part_types, segments in body["prose_segments"]
+        }
+        self.flattened_controls = body["flattened_controls"]
+        return True
+
+    def get_snapshot_body(self):
+        """Return the parts of this catalog that are saved in a snapshot"""
+        # Flatten all controls first so that the snapshot includes them and
+        # their tokenized prose.
+        self.get_flattened_controls_all_as_dict()
+        for control in self.controls_all:
+            self.get_control_prose_as_markdown(control, part_types={"guidance"})
+        return {
+            "oscal": self.oscal,
+            "status": self.status,
+            "status_message": self.status_message,
+            "catalog_id": self.catalog_id,
+            "flattened_controls": self.flattened_controls,
+            # JSON has no tuples or sets.
+            "prose_segments": [
+                [control_id, sorted(part_types), list(segments)]
+                for (control_id, part_types), segments in self.prose_segments.items()
+            ],
+        }
 
     def _load_catalog_json(self):
         """Read catalog file - JSON"""
@@ -135,6 +297,56 @@ class Catalog(object):
         oscal = catalog_record.catalog_json['catalog']
         return oscal
 
+    def _build_indexes(self):
+        """Build hash indexes of the groups and controls (including enhancements) in the catalog"""
+        self.groups_by_id = {}
+        self.group_ids_by_prefix = {}
+        self.controls_all = []
+        self.controls_by_id = {}
+        self.control_parts_by_name = {}
+        self.control_properties_by_name = {}
+        self.control_parameters_by_id = {}
+        self.parameters_by_id = {}
+        for group in self.get_groups():
+            self.groups_by_id.setdefault(group['id'], group)
+            self.group_ids_by_prefix.setdefault(group['id'].lower(), group['id'])
+            for control in group.get('controls', []):
+                self._index_control(control)
+                for control_e in control.get('controls', []):
+                    self._index_control(control_e)
+
+    def _index_control(self, control):
+        # The first matching item wins, as with find_dict_by_value.
+        self.controls_all.append(control)
+        control_id = control['id']
+        if control_id in self.controls_by_id:
+            return
+        self.controls_by_id[control_id] = control
+        parts = {}
+        for part in control.get('parts', []):
+            parts.setdefault(part.get('name'), part)
+        self.control_parts_by_name[control_id] = parts
+        properties = {}
+        for prop in control.get('properties', []):
+            properties.setdefault(prop.get('name'), prop['value'])
+        self.control_properties_by_name[control_id] = properties
+        parameters = {}
+        for parameter in control.get('parameters', []):
+            parameters.setdefault(parameter['id'], parameter)
+            self.parameters_by_id.setdefault(parameter['id'], parameter)
+        self.control_parameters_by_id[control_id] = parameters
+
+    def _is_catalog_control(self, control):
+        """Return whether control is one of the (indexed) controls of this catalog"""
+        control_id = control.get('id')
+        return control_id is not None and self.controls_by_id.get(control_id) is control
+
+    def _get_control_index(self, index, control):
+        """Return the entry in index for a control of this catalog, or None if the control isn't indexed"""
+        if self._is_catalog_control(control):
+            return index[control['id']]
+        return None
+
     def find_dict_by_value(self, search_array, search_key, search_value):
         """Return the dictionary in an array of dictionaries with a key matching a value"""
         if search_array is None:
@@ -157,7 +369,7 @@ class Catalog(object):
         return [item['id'] for item in search_collection]
 
     def get_group_title_by_id(self, id):
-        group = self.find_dict_by_value(self.get_groups(), 'id', id)
+        group = self.groups_by_id.get(id)
         if group is None:
             return None
         return group['title']
@@ -166,16 +378,7 @@ class Catalog(object):
         """Return group id given id of a control"""
 
         # For 800-53, 800-171, CMMC, we can match by first few characters of control ID
-        group_ids = self.get_group_ids()
-        if group_ids:
-            for group_id in group_ids:
-                if group_id.lower() == control_id[:2].lower():
-                    return group_id
-        else:
-            return None
-
-        # Group ID was not matched
-        return None
+        return self.group_ids_by_prefix.get(control_id[:2].lower())
 
     def get_controls(self):
         controls = []
@@ -188,30 +391,22 @@ class Catalog(object):
         return [item['id'] for item in search_collection]
 
     def get_controls_all(self):
-        controls = []
-        for group in self.get_groups():
-            for control in group['controls']:
-                controls.append(control)
-                if 'controls' in control:
-                    controls += [control_e for control_e in control['controls']]
-        return controls
+        return list(self.controls_all)
 
     def get_controls_all_ids(self):
-        search_collection = self.get_controls_all()
-        return [item['id'] for item in search_collection]
+        return [item['id'] for item in self.controls_all]
 
     def get_control_by_id(self, control_id):
-        """Return the dictionary in an array of dictionaries with a key matching a value"""
-        search_array = self.get_controls_all()
-        search_key = 'id'
-        search_value = control_id
-        result_dict = next((sub for sub in search_array if sub[search_key] == search_value), None)
-        return result_dict
+        """Return the control (or control enhancement) with the given id"""
+        return self.controls_by_id.get(control_id)
 
     def get_control_property_by_name(self, control, property_name):
         """Return value of a property of a control by name of property"""
         if control is None:
             return None
+        properties = self._get_control_index(self.control_properties_by_name, control)
+        if properties is not None:
+            return properties.get(property_name)
         prop = self.find_dict_by_value(control['properties'], "name", property_name)
         if prop is None:
             return None
@@ -219,6 +414,9 @@ class Catalog(object):
 
     def get_control_part_by_name(self, control, part_name):
         """Return value of a part of a control by name of part"""
+        parts = self._get_control_index(self.control_parts_by_name, control)
+        if parts is not None:
+            return parts.get(part_name)
         if "parts" in control:
             part = self.find_dict_by_value(control['parts'], "name", part_name)
             return part
@@ -245,9 +443,17 @@ class Catalog(object):
 
     def get_control_parameter_label_by_id(self, control, param_id):
         """Return value of a parameter of a control by id of parameter"""
-        param = self.find_dict_by_value(control['parameters'], "id", param_id)
+        parameters = self._get_control_index(self.control_parameters_by_id, control)
+        if parameters is not None:
+            param = parameters.get(param_id)
+        else:
+            param = self.find_dict_by_value(control['parameters'], "id", param_id)
         return param['label']
 
+    def get_control_parameter_by_id(self, param_id):
+        """Return a parameter of any control by id of parameter"""
+        return self.parameters_by_id.get(param_id)
+
     def get_control_prose_as_markdown(self, control_data, part_types={"statement"}, parameter_values=dict()):
         # Concatenate the prose text of all of the 'parts' of this control
         # in Markdown. Filter out the parts that are not wanted.
@@ -261,6 +467,17 @@ class Catalog(object):
         if status == "Withdrawn":
             return "Withdrawn"
 
+        if control_data is not None and self._is_catalog_control(control_data):
+            # The Markdown doesn't depend on parameter values, so it is
+            # split into literal text and parameter references once and
+            # shared by all instances for the catalog.
+            key = (control_data['id'], frozenset(part_types))
+            segments = self.prose_segments.get(key)
+            if segments is None:
+                segments = tokenize_parameter_text(self.format_part_as_markdown(control_data, filter_name=part_types))
+                self.prose_segments[key] = segments
+            return self.render_parameter_text(control_data, segments, parameter_values)
+
         text = self.format_part_as_markdown(control_data, filter_name=part_types)
 
         text_params_replaced = self.substitute_parameter_text(control_data, text, parameter_values)
@@ -340,30 +557,57 @@ class Catalog(object):
         return md
 
     def substitute_parameter_text(self, control, text, parameter_values):
-        # Fill in parameter_values with control parameter labels for any
+        # Replace "{{ parameter_id }}" references in text with the given
+        # parameter values, or with the control's parameter labels for any
         # parameters that are not specified.
-        parameter_values = dict(parameter_values)  # clone so that we don't modify the caller's dict
-
         if control is None:
             return text
         if "parameters" not in control:
             return text
-
-        for parameter in control['parameters']:
-            if parameter["id"] not in parameter_values:
-                parameter_values[parameter["id"]] = f"[{parameter.get('label', parameter['id'])}]"
-
-        for parameter_key, parameter_value in parameter_values.items():
-            text = re.sub(r"{{ " + re.escape(parameter_key) + " }}", parameter_value, text)
-
-        return text
+        return self.render_parameter_text(control, tokenize_parameter_text(text), parameter_values)
+
+    def render_parameter_text(self, control, segments, parameter_values):
+        # Join text split by tokenize_parameter_text, substituting parameter
+        # values. parameter_values may be any mapping, e.g. a ChainMap. Each
+        # reference is looked up once, so this is linear in the size of the
+        # text no matter how many parameter values there are.
+        if len(segments) == 1:
+            return segments[0]
+        if control is None or "parameters" not in control:
+            return "".join(segments[i] if i % 2 == 0 else "{{ " + segments[i] + " }}" for i in range(len(segments)))
+        control_parameters = self._get_control_index(self.control_parameters_by_id, control)
+        if control_parameters is None:
+            control_parameters = { parameter["id"]: parameter for parameter in control["parameters"] }
+        text = []
+        for i, segment in enumerate(segments):
+            if i % 2 == 0:
+                text.append(segment)
+            elif segment in parameter_values:
+                text.append(str(parameter_values[segment]))
+            elif segment in control_parameters:
+                parameter = control_parameters[segment]
+                text.append(f"[{parameter.get('label', parameter['id'])}]")
+            else:
+                # Leave references to unknown parameters as they are.
+                text.append("{{ " + segment + " }}")
+        return "".join(text)
 
     def get_flattened_control_as_dict(self, control):
         """
         Return a control as a simplified, flattened Python dictionary.
         If parameter_values is supplied, it will override any paramters set
-        in the catalog.
+        in the catalog. The dictionary for a control of this catalog is
+        computed once and shared, so callers must not modify it.
         """
+        if control is not None and self._is_catalog_control(control):
+            cl_dict = self.flattened_controls.get(control['id'])
+            if cl_dict is None:
+                cl_dict = self._flatten_control(control)
+                self.flattened_controls[control['id']] = cl_dict
+            return cl_dict
+        return self._flatten_control(control)
+
+    def _flatten_control(self, control):
         if control is None:
             family_id = None
             description = self.get_control_prose_as_markdown(control, part_types={"statement"},
@@ -412,25 +656,39 @@ class Catalog(object):
 
     def get_flattened_controls_all_as_dict(self):
         """Return all controls as a simplified flattened Python dictionary indexed by control ids"""
+        return self.flattened_controls_all_as_dict
+
+    def get_flattened_controls_all_as_dict_list(self):
+        """Return all control dictionary in a nested Python list"""
+        return self.flattened_controls_all_as_dict_list
+
+    @cached_property
+    def flattened_controls_all_as_dict(self):
         # Create an empty dictionary
         cl_all_dict = {}
         # Get all the controls
-        for cl in self.get_controls_all():
+        for cl in self.controls_all:
             # Get flattened control and add to dictionary of controls
             cl_dict = self.get_flattened_control_as_dict(cl)
             cl_all_dict[cl_dict['id']] = cl_dict
         return cl_all_dict
 
-    def get_flattened_controls_all_as_dict_list(self):
-        """Return all control dictionary in a nested Python list"""
-        # Create an empty list
-        cl_all_list = []
-        # Get all the controls
-        for cl in self.get_controls_all():
-            # Get flattened control and add to list of controls
-            cl_dict = self.get_flattened_control_as_dict(cl)
-            cl_all_list.append(cl_dict)
-        return cl_all_list
+    @cached_property
+    def flattened_controls_all_as_dict_list(self):
+        # The same dictionaries as flattened_controls_all_as_dict, so
+        # each control is only rendered once.
+        return [self.get_flattened_control_as_dict(cl) for cl in self.controls_all]
+
+    def get_overlay_size(self):
+        """Return the approximate memory used by this instance's flattened controls, in bytes"""
+        def sizeof(obj):
+            size = sys.getsizeof(obj)
+            if isinstance(obj, dict):
+                size += sum(sizeof(v) for v in obj.values())
+            elif isinstance(obj, list):
+                size += sum(sizeof(v) for v in obj)
+            return size
+        return sizeof(self.flattened_controls)
 
     def _cache_parameters_by_control(self):
         cache = defaultdict(list)
@@ -446,3 +704,4 @@ class Catalog(object):
     def get_parameter_ids_for_control(self, control_id):
         return self.parameters_by_control.get(control_id, [])
 
+catalog_instances = CatalogInstanceCache(getattr(settings, "GR_CATALOG_CACHE_SIZE", 32))
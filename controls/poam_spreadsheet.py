@@ -0,0 +1,162 @@
+# The agency POA&M spreadsheet (local/poams_list.xlsx) shown on a system's
+# summary page.
+#
+# The spreadsheet can have tens of thousands of rows, so it is parsed once
+# each time the file changes (by modification time) into a pandas DataFrame
+# with an index of row positions by CSAM ID.
+#
+# Cell edits are queued and written back by whichever request gets the
+# write lock first, so concurrent edits are applied together in one load and
+# save of the workbook. The workbook is written to a temporary file that
+# replaces the spreadsheet, so readers never see a partially written file.
+# Writers in different processes are serialized by a lock file in the
+# system's temporary directory.
+
+import hashlib
+import os
+import tempfile
+import threading
+
+import pandas
+from openpyxl import load_workbook
+
+try:
+    import fcntl
+except ImportError:
+    # Not available on Windows. Edits are then only serialized within a process.
+    fcntl = None
+
+POAM_SPREADSHEET_PATH = "local/poams_list.xlsx"
+
+# The column names are in the second row of the sheet.
+HEADER_ROW = 2
+
+
+class PoamSpreadsheet(object):
+    """The rows of the POA&M spreadsheet as of a modification time"""
+
+    def __init__(self, path, mtime):
+        self.path = path
+        self.mtime = mtime
+        self.table = pandas.read_excel(path, header=HEADER_ROW - 1)
+        # Row positions by CSAM ID
+        self.rows_by_csam_id = {}
+        if 'CSAM ID' in self.table.columns:
+            self.rows_by_csam_id = self.table.groupby('CSAM ID', sort=False).indices
+
+    def get_rows(self, csam_id):
+        """Return (index, row dict) pairs of the rows for a CSAM ID"""
+        positions = self.rows_by_csam_id.get(csam_id)
+        if positions is None:
+            return []
+        rows = self.table.iloc[positions]
+        return list(zip(rows.index.tolist(), rows.to_dict('records')))
+
+    def set_cell(self, index, column, value):
+        self.table.at[index, column] = value
+
+
+_cache = None
+_cache_lock = threading.Lock()
+_write_lock = threading.Lock()
+_pending_edits = []
+
+
+def get_spreadsheet(path=POAM_SPREADSHEET_PATH):
+    """Return the parsed POA&M spreadsheet, or None if it does not exist"""
+    global _cache
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return None
+    with _cache_lock:
+        if _cache is None or _cache.path != path or _cache.mtime != mtime:
+            _cache = PoamSpreadsheet(path, mtime)
+        return _cache
+
+
+class _Edit(object):
+    """A queued cell edit. error is set if writing it failed."""
+
+    def __init__(self, row, column, value):
+        self.row = row
+        self.column = column
+        self.value = value
+        self.error = None
+
+
+def update_cell(row, column, value, path=POAM_SPREADSHEET_PATH):
+    """Set a cell of the POA&M spreadsheet. row is the (1-based) data row and
+    column is the lowercased column name."""
+    edit = _Edit(row, column, value)
+    with _cache_lock:
+        _pending_edits.append(edit)
+    with _write_lock:
+        with _cache_lock:
+            edits = list(_pending_edits)
+            _pending_edits.clear()
+        if edits:
+            try:
+                _write_edits(path, edits)
+            except Exception as e:
+                # None of the edits were saved. Report the failure to each
+                # request whose edit was in the batch, not only this one.
+                # (Edits of unknown columns fail on their own.)
+                for queued_edit in edits:
+                    queued_edit.error = e
+    # This edit may have been written by another request that held the
+    # write lock, which has finished with it by the time we get the lock.
+    if edit.error is not None:
+        raise edit.error
+
+
+def _get_lock_path(path):
+    # Keep the lock file out of the spreadsheet's directory.
+    path_hash = hashlib.sha256(os.path.abspath(path).encode("utf8")).hexdigest()[:16]
+    return os.path.join(tempfile.gettempdir(), "govready-q-poam-spreadsheet-{}.lock".format(path_hash))
+
+
+def _write_edits(path, edits):
+    global _cache
+    lock_file = open(_get_lock_path(path), "a")
+    try:
+        if fcntl:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        # The version of the file the edits are applied to. Another process
+        # may have changed it since it was parsed into the cache.
+        mtime = os.stat(path).st_mtime_ns
+        workbook = load_workbook(filename=path)
+        sheet = workbook.active
+        column_numbers = {}
+        for cell in next(sheet.iter_rows(min_row=HEADER_ROW, max_row=HEADER_ROW)):
+            if cell.value is not None:
+                column_numbers[str(cell.value).lower()] = cell.column
+        written_edits = []
+        for edit in edits:
+            if edit.column not in column_numbers:
+                # Fail only this edit, not the others queued with it.
+                edit.error = KeyError(edit.column)
+                continue
+            sheet.cell(row=edit.row + HEADER_ROW, column=column_numbers[edit.column]).value = edit.value
+            written_edits.append(edit)
+        if not written_edits:
+            return
+
+        tmp_path = "{}.{}.tmp".format(path, os.getpid())
+        workbook.save(tmp_path)
+        os.replace(tmp_path, path)
+
+        # Apply the edits to the parsed spreadsheet rather than parsing it
+        # again, if it was parsed from the file the edits were applied to.
+        # Otherwise it is parsed again when next read.
+        with _cache_lock:
+            if _cache is not None and _cache.path == path:
+                if _cache.mtime == mtime:
+                    columns = {str(name).lower(): name for name in _cache.table.columns}
+                    for edit in written_edits:
+                        _cache.set_cell(edit.row - 1, columns[edit.column], edit.value)
+                    _cache.mtime = os.stat(path).st_mtime_ns
+                else:
+                    _cache = None
+    finally:
+        lock_file.close()
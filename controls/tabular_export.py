@@ -0,0 +1,148 @@
+# Streaming spreadsheet (XLSX) and CSV exports.
+#
+# An export is a list of Columns and an iterable of rows (lists of values
+# in column order). Rows are written as they are produced, so exports
+# should read their rows from querysets with iter_chunks rather than
+# loading them all first:
+#
+# * CSV rows are written to a StreamingHttpResponse.
+# * XLSX rows are written by an openpyxl write-only workbook, which keeps
+#   only the current row in memory, to a temporary file that is streamed to
+#   the client. Cell styles are shared CellStyle objects rather than new
+#   style objects per cell.
+
+import csv
+import tempfile
+from datetime import datetime
+from itertools import islice
+
+from django.http import FileResponse, StreamingHttpResponse
+from django.utils import timezone
+from openpyxl import Workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles import Border, Font, PatternFill, Side
+from openpyxl.utils import get_column_letter
+
+XLSX_CONTENT_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+class Column(object):
+    """A column of an export. value is a function from an object to the
+    column's value, for rows built by get_rows, and columns without one are
+    left blank. style is the CellStyle of the column's cells in XLSX exports."""
+
+    def __init__(self, name, value=None, width=None, style=None):
+        self.name = name
+        self.value = value or (lambda obj: None)
+        self.width = width
+        self.style = style
+
+
+class CellStyle(object):
+    """Formatting shared by XLSX cells"""
+
+    def __init__(self, font=None, fill=None, border=None, alignment=None):
+        self.font = font
+        self.fill = fill
+        self.border = border
+        self.alignment = alignment
+
+    def apply(self, cell):
+        if self.font is not None:
+            cell.font = self.font
+        if self.fill is not None:
+            cell.fill = self.fill
+        if self.border is not None:
+            cell.border = self.border
+        if self.alignment is not None:
+            cell.alignment = self.alignment
+
+
+THIN_SIDE = Side(border_style="thin", color="444444")
+THIN_BORDER = Border(left=THIN_SIDE, right=THIN_SIDE, bottom=THIN_SIDE, outline=THIN_SIDE)
+HEADER_STYLE = CellStyle(font=Font(color="FFFFFF", bold=True), fill=PatternFill("solid", fgColor="5599FE"),
+                         border=THIN_BORDER)
+
+
+def iter_chunks(queryset, chunk_size=500):
+    """Iterate over a queryset in lists of chunk_size objects, reading it
+    with a server-side cursor where the database supports it"""
+    objects = queryset.iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(objects, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def get_rows(columns, objects):
+    """Iterate over the rows of objects using the columns' value functions"""
+    for obj in objects:
+        yield [column.value(obj) for column in columns]
+
+
+class _Echo(object):
+    """A file-like object for csv.writer that returns what is written"""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(columns, rows, header=True):
+    """Iterate over the lines of a CSV file of rows"""
+    writer = csv.writer(_Echo())
+    if header:
+        yield writer.writerow([column.name for column in columns])
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def csv_response(filename, columns, rows, content_type="text/csv", disposition="attachment"):
+    """Return a response streaming a CSV file of rows"""
+    response = StreamingHttpResponse(iter_csv(columns, rows), content_type=content_type)
+    response["Content-Disposition"] = "{}; filename={}".format(disposition, filename)
+    return response
+
+
+def _xlsx_value(value):
+    # Excel does not support timezones in datetimes.
+    if isinstance(value, datetime) and timezone.is_aware(value):
+        return timezone.localtime(value).replace(tzinfo=None)
+    return value
+
+
+def write_xlsx(f, columns, rows, title=None, header_style=HEADER_STYLE):
+    """Write an XLSX workbook of rows to the file f"""
+    workbook = Workbook(write_only=True)
+    worksheet = workbook.create_sheet(title)
+    for index, column in enumerate(columns, 1):
+        if column.width:
+            worksheet.column_dimensions[get_column_letter(index)].width = column.width
+
+    def make_cell(value, style):
+        if style is None:
+            return _xlsx_value(value)
+        cell = WriteOnlyCell(worksheet, value=_xlsx_value(value))
+        style.apply(cell)
+        return cell
+
+    worksheet.append([make_cell(column.name, header_style) for column in columns])
+    for row in rows:
+        worksheet.append([make_cell(value, column.style) for column, value in zip(columns, row)])
+    workbook.save(f)
+
+
+def xlsx_response(filename, columns, rows, title=None, header_style=HEADER_STYLE,
+                  content_type=XLSX_CONTENT_TYPE, disposition="attachment"):
+    """Return a response streaming an XLSX workbook of rows"""
+    f = tempfile.TemporaryFile()
+    try:
+        write_xlsx(f, columns, rows, title=title, header_style=header_style)
+        f.seek(0)
+    except Exception:
+        f.close()
+        raise
+    # The response closes the file, which deletes it, once it is sent.
+    response = FileResponse(f, content_type=content_type)
+    response["Content-Disposition"] = "{}; filename={}".format(disposition, filename)
+    return response
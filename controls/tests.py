@@ -13,7 +13,7 @@ import os
 import unittest
 from pathlib import PurePath
 import tempfile
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 from django.utils.text import slugify
 from selenium.common.exceptions import WebDriverException, NoSuchElementException, StaleElementReferenceException
 from selenium.webdriver.common.by import By
@@ -23,8 +23,8 @@ from selenium.webdriver.support.ui import WebDriverWait
 
 from controls.models import System
 from controls.models import STATEMENT_SYNCHED, STATEMENT_NOT_SYNCHED, STATEMENT_ORPHANED
-from controls.views import OSCALComponentSerializer, OSCAL_ssp_export
-from siteapp.models import User, Organization, OrganizationalSetting
+from controls.views import OSCALComponentSerializer, OSCAL_ssp_export, ComponentImporter
+from siteapp.models import User, Organization, OrganizationalSetting, Tag
 from siteapp.tests import SeleniumTest, var_sleep, OrganizationSiteFunctionalTests, wait_for_sleep_after
 from system_settings.models import SystemSettings
 from controls.models import *
@@ -34,6 +34,9 @@ from siteapp.models import User, Project, Portfolio
 from system_settings.models import SystemSettings
 
 from urllib.parse import urlparse
+import json
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 
 from guardian.shortcuts import assign_perm
 
@@ -138,6 +141,95 @@ class Oscal80053Tests(SeleniumTest):
         self.assertTrue('Access control policy every 12 parsecs' in description,
                         description)
 
+class CatalogIndexTests(TestCase):
+
+    def test_catalog_indexed_lookups(self):
+        cg = Catalog.GetInstance(Catalogs.NIST_SP_800_53_rev5)
+
+        # Controls and control enhancements are found by id.
+        control = cg.get_control_by_id('ac-2')
+        self.assertEqual(control['title'].upper(), "ACCOUNT MANAGEMENT")
+        self.assertEqual(cg.get_control_by_id('ac-2.1')['id'], 'ac-2.1')
+        self.assertIsNone(cg.get_control_by_id('zz-99'))
+        self.assertEqual(cg.get_controls_all_ids(), [c['id'] for c in cg.get_controls_all()])
+
+        # Groups, properties, parts and parameters.
+        self.assertEqual(cg.get_group_id_by_control_id('ac-2'), 'ac')
+        self.assertEqual(cg.get_group_title_by_id('ac').upper(), "ACCESS CONTROL")
+        self.assertEqual(cg.get_control_property_by_name(control, 'label'), 'AC-2')
+        self.assertEqual(cg.get_control_part_by_name(control, 'statement')['name'], 'statement')
+        self.assertEqual(cg.get_control_parameter_label_by_id(cg.get_control_by_id('ac-1'), 'ac-1_prm_1'),
+                         cg.get_control_parameter_by_id('ac-1_prm_1')['label'])
+
+        # Controls that aren't from the catalog are still searched.
+        copy = dict(control)
+        self.assertEqual(cg.get_control_property_by_name(copy, 'label'), 'AC-2')
+
+class CatalogInstanceCacheTests(TestCase):
+
+    def test_catalog_overlays_share_base(self):
+        cg1 = Catalog.GetInstance(Catalogs.NIST_SP_800_53_rev5, parameter_values={ 'ac-1_prm_1': 'the 12 parsecs team' })
+        cg2 = Catalog.GetInstance(Catalogs.NIST_SP_800_53_rev5, parameter_values={ 'ac-1_prm_1': 'the 13 parsecs team' })
+        self.assertIsNot(cg1, cg2)
+        self.assertIs(cg1.oscal, cg2.oscal)
+        self.assertIn('the 12 parsecs team', cg1.get_flattened_controls_all_as_dict()['ac-1']['description'])
+        self.assertIn('the 13 parsecs team', cg2.get_flattened_control_as_dict(cg2.get_control_by_id('ac-1'))['description'])
+
+        # Controls are flattened once per instance.
+        self.assertIs(cg1.flattened_controls_all_as_dict['ac-1'], cg1.flattened_controls_all_as_dict_list[0])
+
+    def test_catalog_parameter_substitution(self):
+        from collections import ChainMap
+        from controls.oscal import tokenize_parameter_text
+        self.assertEqual(tokenize_parameter_text("a {{ x_prm_1 }} b {{ y }}"), ("a ", "x_prm_1", " b ", "y", ""))
+
+        # Parameter values may come from a ChainMap, as from Project.get_parameter_values.
+        parameter_values = ChainMap({ 'ac-1_prm_1': 'the 12 parsecs team' }, { 'ac-1_prm_1': 'default', 'ac-1_prm_3': 'the CISO' })
+        cg = Catalog.GetInstance(Catalogs.NIST_SP_800_53_rev5, parameter_values=parameter_values)
+        description = cg.get_flattened_control_as_dict(cg.get_control_by_id('ac-1'))['description']
+        self.assertIn('the 12 parsecs team', description)
+        self.assertIn('the CISO', description)
+        self.assertNotIn('{{', description)
+
+        # Parameters without values are replaced by their labels.
+        control = cg.get_control_by_id('ac-2')
+        self.assertEqual(cg.substitute_parameter_text(control, "{{ ac-2_prm_1 }} {{ zz_prm_1 }}", {}),
+                         "[organization-defined attributes (as required)] {{ zz_prm_1 }}")
+
+    def test_catalog_instance_cache_eviction(self):
+        from controls.oscal import CatalogInstanceCache
+        cache = CatalogInstanceCache(2)
+        for key in ("a", "b", "a", "c"):
+            cache.get(key, lambda: Catalog(Catalogs.NIST_SP_800_53_rev5, base=Catalog._get_base(Catalogs.NIST_SP_800_53_rev5)))
+        stats = cache.stats()
+        self.assertEqual((stats["size"], stats["hits"], stats["misses"], stats["evictions"]), (2, 1, 3, 1))
+        self.assertEqual(list(cache.entries), ["a", "c"])
+
+class CatalogSnapshotTests(TestCase):
+
+    def test_catalog_snapshot(self):
+        from django.core.management import call_command
+        from django.test import override_settings
+        with tempfile.TemporaryDirectory() as snapshot_dir, override_settings(GR_CATALOG_SNAPSHOT_DIR=snapshot_dir):
+            call_command('compilecatalogs', catalog=[Catalogs.NIST_SP_800_53_rev5])
+
+            # Listing catalogs reads the snapshot header.
+            index = { item['catalog_key']: item for item in Catalogs().index }
+            self.assertEqual(index[Catalogs.NIST_SP_800_53_rev5]['id'], Catalog(Catalogs.NIST_SP_800_53_rev5, use_snapshot=False).catalog_id)
+
+            # Catalogs load from the snapshot.
+            cg = Catalog.GetInstance(Catalogs.NIST_SP_800_53_rev5, parameter_values={ 'ac-1_prm_1': 'the 12 parsecs team' })
+            self.assertTrue(cg.from_snapshot)
+            self.assertIs(cg.get_control_by_id('ac-2'), cg.controls_by_id['ac-2'])
+            self.assertIn('the 12 parsecs team', cg.get_flattened_controls_all_as_dict()['ac-1']['description'])
+            self.assertEqual(Catalog.GetInstance(Catalogs.NIST_SP_800_53_rev5).get_flattened_controls_all_as_dict(),
+                             Catalog(Catalogs.NIST_SP_800_53_rev5, use_snapshot=False).get_flattened_controls_all_as_dict())
+
+            # Snapshots are ignored once the catalog changes.
+            CatalogData.objects.get(catalog_key=Catalogs.NIST_SP_800_53_rev5).save()
+            Catalog.ClearCache()
+            self.assertFalse(Catalog.GetInstance(Catalogs.NIST_SP_800_53_rev5).from_snapshot)
+
 class StatementTests(TestCase):
 
     def test_statement_id_from_control(self):
@@ -571,6 +663,118 @@ class ElementUnitTests(TestCase):
         self.assertEqual(e.name, "Renamed Element A")
         self.assertEqual(e.description, "Renamed Element A Description")
 
+    def test_import_components_in_bulk(self):
+        # A component library is imported with a number of queries that
+        # does not grow with the number of components.
+        u = User.objects.create(username="Jane", email="jane@example.com", is_superuser=True)
+        Element.objects.create(name="component 0", element_type="system_element")
+        Tag.objects.create(label="existing-tag")
+        app_root = os.path.dirname(os.path.realpath(__file__))
+        with open(os.path.join(app_root, "data/test_data", "test_oscal_component.json")) as f:
+            oscal_json = json.load(f)
+        component = oscal_json["component-definition"]["components"][0]
+        components = []
+        for i in range(200):
+            components.append(dict(component, uuid=str(uuid.uuid4()), title="component {}".format(i % 100), props=[
+                {"name": "tag", "ns": "https://govready.com/ns/oscal", "value": "existing-tag"},
+                {"name": "tag", "ns": "https://govready.com/ns/oscal", "value": "tag-{}".format(i % 2)},
+            ]))
+        components.append(dict(component, uuid=str(uuid.uuid4()), title="no statements", **{"control-implementations": []}))
+        oscal_json["component-definition"]["components"] = components
+
+        with CaptureQueriesContext(connection) as queries:
+            import_record = ComponentImporter().import_components_as_json("library.json", json.dumps(oscal_json))
+        self.assertLess(len(queries), 40)
+
+        # Name collisions get unique names, including within the import.
+        self.assertEqual(Element.objects.filter(import_record=import_record).count(), 200)
+        self.assertFalse(Element.objects.filter(name="no statements").exists())
+        self.assertTrue(Element.objects.filter(name="component 0 (1)", import_record=import_record).exists())
+        self.assertTrue(Element.objects.filter(name="component 0 (2)", import_record=import_record).exists())
+        self.assertTrue(Element.objects.filter(name="component 99 (1)", import_record=import_record).exists())
+
+        e = Element.objects.get(name="component 7")
+        self.assertEqual(set(e.tags.values_list("label", flat=True)), {"existing-tag", "tag-1"})
+        self.assertEqual(len(get_user_perms(u, e)), 4)
+        smts = e.statements(StatementTypeEnum.CONTROL_IMPLEMENTATION_PROTOTYPE.name)
+        self.assertEqual(len(smts), 1)
+        self.assertEqual(list(smts[0].import_record.all()), [import_record])
+        self.assertEqual(import_record.import_record_statements.count(), 200)
+        # The statements' history is created with them.
+        self.assertEqual(Statement.history.filter(id__in=import_record.import_record_statements.values('id'), history_type='+').count(), 200)
+        self.assertEqual(Tag.objects.filter(label__startswith="tag-").count(), 2)
+
+    def test_import_components_in_parallel(self):
+        from contextlib import redirect_stdout
+        from io import StringIO
+        from django.core.management import call_command
+        User.objects.create(username="Jane", email="jane@example.com", is_superuser=True)
+        app_root = os.path.dirname(os.path.realpath(__file__))
+        with open(os.path.join(app_root, "data/test_data", "test_oscal_component.json")) as f:
+            oscal_json = json.load(f)
+        component = oscal_json["component-definition"]["components"][0]
+
+        def write_component(path, title):
+            oscal_json["component-definition"]["components"] = [dict(component, uuid=str(uuid.uuid4()), title=title)]
+            with open(path, "w") as f:
+                json.dump(oscal_json, f)
+
+        def import_components(path, *args):
+            with redirect_stdout(StringIO()) as output:
+                call_command("importcomponents", "--path", path, "--workers", "2", "--batch-size", "2", *args)
+            return output.getvalue()
+
+        with tempfile.TemporaryDirectory() as import_dir:
+            for i in range(5):
+                write_component(os.path.join(import_dir, "{}.json".format(i)), "parallel {}".format(i))
+            output = import_components(import_dir)
+            self.assertIn("Imported 5 components", output)
+            self.assertIn("0 invalid", output)
+            self.assertEqual(Element.objects.filter(name__startswith="parallel ").count(), 5)
+
+        with tempfile.TemporaryDirectory() as import_dir:
+            write_component(os.path.join(import_dir, "0.json"), "before invalid")
+            with open(os.path.join(app_root, "data/test_data", "test_invalid_oscal.json")) as f, \
+                 open(os.path.join(import_dir, "1.json"), "w") as f2:
+                f2.write(f.read())
+            write_component(os.path.join(import_dir, "2.json"), "after invalid")
+
+            # Invalid files are skipped.
+            output = import_components(import_dir, "--no-stopinvalid")
+            self.assertIn("Imported 2 components", output)
+            self.assertIn("1 invalid", output)
+            self.assertEqual(Element.objects.filter(name__in=["before invalid", "after invalid"]).count(), 2)
+
+            # Or the files before the invalid file are imported and the import stops.
+            with self.assertRaises(SystemExit):
+                import_components(import_dir)
+            self.assertEqual(Element.objects.filter(name__startswith="before invalid").count(), 2)
+            self.assertEqual(Element.objects.filter(name__startswith="after invalid").count(), 1)
+
+    def test_component_oscal_export(self):
+        # The OSCAL component definition is streamed with a fixed number of
+        # queries per chunk of statements.
+        e = Element.objects.create(name="OAuth", full_name="OAuth Service", element_type="system_element")
+        e.add_tags([Tag.objects.create(label="oauth").id])
+        Statement.objects.bulk_create([
+            Statement(sid="ac-{}".format(i), sid_class=Catalogs.NIST_SP_800_53_rev5, source=Catalogs.NIST_SP_800_53_rev5,
+                      pid="b", body="Statement {}".format(i), producer_element=e,
+                      statement_type=StatementTypeEnum.CONTROL_IMPLEMENTATION_PROTOTYPE.name)
+            for i in range(1000)
+        ])
+        impl_smts = Statement.objects.filter(producer_element=e)
+        with self.assertNumQueries(6):
+            oscal_string = "".join(OSCALComponentSerializer(e, impl_smts).iter_json())
+        oscal = json.loads(oscal_string)
+        self.assertEqual(oscal_string, json.dumps(oscal, indent=2))
+        component = oscal["component-definition"]["components"][0]
+        self.assertEqual(component["props"][0]["value"], "oauth")
+        control_implementations = component["control-implementations"]
+        self.assertEqual(len(control_implementations), 1000)
+        self.assertEqual([ci["implemented-requirements"][0]["control-id"] for ci in control_implementations[:3]],
+                         ["ac-0.b", "ac-1.b", "ac-2.b"])
+        self.assertEqual(control_implementations[10]["source"], Catalogs.NIST_SP_800_53_rev5)
+
     def test_component_type_state(self):
         e = Element.objects.create(name="New component",  element_type="system")
         self.assertTrue(e.id is not None)
@@ -581,6 +785,40 @@ class ElementUnitTests(TestCase):
         self.assertTrue(e2.component_type == "hardware")
         self.assertTrue(e2.component_state == "disposition")
 
+    def test_assign_baseline_in_bulk(self):
+        # Baselines are assigned to many systems with a fixed number of queries.
+        user = User.objects.create(email='jane@example.com', username="Jane")
+        elements = []
+        for i in range(3):
+            element = Element.objects.create(name="sys_root_element {}".format(i), element_type="system")
+            System.objects.create(root_element=element)
+            element.assign_edit_permissions(user)
+            elements.append(element)
+        other_element = Element.objects.create(name="other_root_element", element_type="system")
+        ElementControl.objects.create(element=elements[0], oscal_ctl_id="zz-1", oscal_catalog_key=Catalogs.NIST_SP_800_53_rev5)
+
+        moderate = elements[1].assign_baseline_controls(user, Catalogs.NIST_SP_800_53_rev5, 'moderate')
+        self.assertEqual(len(moderate['add']), elements[1].controls.count())
+        self.assertEqual(moderate['remove'], [])
+
+        with CaptureQueriesContext(connection) as queries:
+            changed_controls = Element.assign_baseline_controls_in_bulk(user, elements + [other_element], Catalogs.NIST_SP_800_53_rev5, 'high')
+        # (SQLite limits the rows per INSERT.)
+        self.assertLess(len(queries), 15)
+        high = changed_controls[elements[1].id]
+        self.assertEqual(len(high['no_change']) + len(high['remove']), len(moderate['add']))
+        self.assertEqual(elements[1].controls.count(), len(high['add']) + len(high['no_change']))
+        self.assertEqual(changed_controls[elements[0].id]['remove'], ["zz-1=+={}".format(Catalogs.NIST_SP_800_53_rev5)])
+        self.assertEqual(elements[0].controls.count(), elements[1].controls.count())
+        self.assertFalse(changed_controls[other_element.id])
+        self.assertEqual(other_element.controls.count(), 0)
+
+        # Adding a baseline doesn't remove controls.
+        low = elements[2].add_baseline_controls(user, Catalogs.NIST_SP_800_53_rev5, 'low')
+        self.assertEqual(low['remove'], [])
+        self.assertEqual(elements[2].controls.count(), elements[1].controls.count() + len(low['add']))
+        self.assertFalse(elements[2].assign_baseline_controls(user, Catalogs.NIST_SP_800_53_rev5, 'missing'))
+
 class ElementUITests(OrganizationSiteFunctionalTests):
 
     def test_element_create_form(self):
@@ -846,6 +1084,136 @@ class SystemUnitTests(TestCase):
         smt_2_updated = Statement.objects.get(pk=smt_2.id)
         self.assertTrue(smt_2_updated.status, control_status)
 
+    def test_control_implementation_as_dict(self):
+        # A 1,000 control system is built with a constant number of queries.
+        sre = Element.objects.create(name="New Element", full_name="New Element Full Name", element_type="system")
+        s = System.objects.create(root_element=sre)
+        components = [
+            Element.objects.create(name="Component {}".format(i), element_type="system_element")
+            for i in range(2)
+        ]
+        control_ids = ["ac-{}".format(i) for i in range(1000)]
+        ElementControl.objects.bulk_create([
+            ElementControl(element=sre, oscal_ctl_id=control_id, oscal_catalog_key=Catalogs.NIST_SP_800_53_rev5)
+            for control_id in control_ids
+        ])
+        Statement.objects.bulk_create([
+            Statement(sid=control_id, sid_class=Catalogs.NIST_SP_800_53_rev5, pid=pid,
+                      body="Statement for {}\nof {}.".format(control_id, component.name),
+                      statement_type=StatementTypeEnum.CONTROL_IMPLEMENTATION.name, status="Implemented",
+                      producer_element=component, consumer_element=sre)
+            for control_id in control_ids
+            for pid, component in zip(("a", "b"), components)
+        ])
+
+        s = System.objects.select_related("root_element").get(id=s.id)
+        with self.assertNumQueries(2):
+            smts_as_dict = s.control_implementation_as_dict
+        self.assertEqual(len(smts_as_dict), 1000)
+        self.assertEqual(len(smts_as_dict["ac-7"]["control_impl_smts_legacy"]), 2)
+        combined_smt = smts_as_dict["ac-7"]["combined_smt"]
+        self.assertTrue(combined_smt.startswith("<i>Component 0</i><br/>"), combined_smt)
+        self.assertIn("<br/><br/><i>Component 1</i><br/>", combined_smt)
+        self.assertIn("[x] Implemented ", combined_smt)
+        self.assertIn('<span style="color: #888;">[ ] Planned</span>', combined_smt)
+        self.assertIn("Statement for ac-7<br/>of Component 1.", combined_smt)
+
+    def test_system_status_rollups(self):
+        # Status counts are per-system, loaded for many systems in one query,
+        # and recomputed after statements change.
+        systems = []
+        component = Element.objects.create(name="Component", element_type="system_element")
+        for i in range(3):
+            sre = Element.objects.create(name="System {}".format(i), element_type="system")
+            systems.append(System.objects.create(root_element=sre))
+            for control_id, status in (("ac-1", "Implemented"), ("ac-2", "Planned"), ("ac-2", "Planned")):
+                Statement.objects.create(sid=control_id, sid_class=Catalogs.NIST_SP_800_53_rev5, status=status,
+                                         statement_type=StatementTypeEnum.CONTROL_IMPLEMENTATION.name,
+                                         producer_element=component, consumer_element=sre)
+        Statement.objects.create(sid="ac-1", sid_class=Catalogs.NIST_SP_800_53_rev5, status="Open",
+                                 statement_type=StatementTypeEnum.POAM.name, consumer_element=systems[0].root_element)
+
+        SystemRollup.load_for_systems(systems)
+        systems = list(System.objects.filter(id__in=[system.id for system in systems]).order_by('id'))
+        with self.assertNumQueries(1):
+            SystemRollup.load_for_systems(systems)
+            for system in systems:
+                self.assertEqual(system.controls_status_count["Implemented"], 1)
+                self.assertEqual(system.controls_status_count["Planned"], 2)
+                self.assertEqual(system.controls_status_count["Addressed"], 2)
+        self.assertEqual(systems[0].poam_status_counts, {"Open": 1})
+        self.assertEqual(systems[1].poam_status_counts, {})
+        self.assertEqual(systems[1].producer_elements_control_impl_smts_status_dict,
+                         {component: {"Implemented": 1, "Planned": 2}})
+
+        # Changing a statement recomputes only its system's rollup.
+        systems[0].set_component_control_status(component, "Implemented")
+        Statement.objects.filter(consumer_element=systems[1].root_element, sid="ac-1").first().delete()
+        self.assertEqual(SystemRollup.objects.count(), 1)
+        systems = list(System.objects.filter(id__in=[system.id for system in systems]).order_by('id'))
+        self.assertEqual(systems[0].controls_status_count["Implemented"], 3)
+        self.assertEqual(systems[1].controls_status_count["Implemented"], 0)
+        self.assertEqual(systems[1].controls_status_count["Addressed"], 1)
+        self.assertEqual(systems[2].controls_status_count["Implemented"], 1)
+
+    def test_system_rollup_after_component_removed(self):
+        # Removing a component deletes its statements with a queryset
+        # delete, which must also recompute the system's rollup.
+        from siteapp.models import Proposal, Request
+        sre = Element.objects.create(name="System", element_type="system")
+        system = System.objects.create(root_element=sre)
+        component = Element.objects.create(name="Component", element_type="system_element")
+        request = Request.objects.create(system=system, requested_element=component, status="Request")
+        Proposal.objects.create(req=request, requested_element=component, status="Approve")
+        for control_id in ("ac-1", "ac-2"):
+            Statement.objects.create(sid=control_id, sid_class=Catalogs.NIST_SP_800_53_rev5, status="Implemented",
+                                     statement_type=StatementTypeEnum.CONTROL_IMPLEMENTATION.name,
+                                     producer_element=component, consumer_element=sre)
+        self.assertEqual(System.objects.get(id=system.id).controls_status_count["Implemented"], 2)
+
+        Request.objects.get(id=request.id).remove_component()
+        self.assertFalse(SystemRollup.objects.filter(system=system).exists())
+        system = System.objects.get(id=system.id)
+        self.assertEqual(system.controls_status_count["Implemented"], 0)
+        self.assertEqual(system.controls_status_count["Addressed"], 0)
+
+@unittest.skipUnless(connection.features.has_select_for_update, "requires row locks")
+class SystemRollupLockTests(TransactionTestCase):
+    serialized_rollback = True
+
+    def test_statement_saved_while_rollup_computed(self):
+        # A statement saved while a rollup is being computed waits for it to
+        # be stored and then invalidates it, rather than the rollup being
+        # stored with the old counts.
+        import threading
+        import time
+        from unittest.mock import patch
+        sre = Element.objects.create(name="System", element_type="system")
+        system = System.objects.create(root_element=sre)
+        def create_statement(control_id):
+            Statement.objects.create(sid=control_id, sid_class=Catalogs.NIST_SP_800_53_rev5, status="Implemented",
+                                     statement_type=StatementTypeEnum.CONTROL_IMPLEMENTATION.name, consumer_element=sre)
+        create_statement("ac-1")
+
+        computed = threading.Event()
+        compute = SystemRollup.compute
+        def slow_compute(systems):
+            rollups = compute(systems)
+            computed.set()
+            time.sleep(1)
+            return rollups
+        def save_statement():
+            computed.wait()
+            create_statement("ac-2")
+            connection.close()
+
+        thread = threading.Thread(target=save_statement)
+        thread.start()
+        with patch.object(SystemRollup, "compute", slow_compute):
+            SystemRollup.load_for_systems([System.objects.get(id=system.id)])
+        thread.join()
+        self.assertEqual(System.objects.get(id=system.id).controls_status_count["Implemented"], 2)
+
 class SystemUITests(OrganizationSiteFunctionalTests):
 
     def test_deployments_page_exists(self):
@@ -912,6 +1280,103 @@ class PoamUnitTests(TestCase):
         # poam.delete()
         # self.assertTrue(poam.uuid is None)
 
+    def test_poam_export(self):
+        import csv, io
+        from django.test import RequestFactory
+        from django.utils import timezone
+        from openpyxl import load_workbook
+        from controls.views import poam_export
+
+        e = Element.objects.create(name="Export System", element_type="system")
+        s = System.objects.create(root_element=e)
+        for poam_id in range(1, 4):
+            smt = Statement.objects.create(body="Weakness {}".format(poam_id), statement_type="POAM",
+                                           status="Open", consumer_element=e)
+            Poam.objects.create(statement=smt, poam_id=poam_id, weakness_name="Weakness {}".format(poam_id),
+                                scheduled_completion_date=timezone.now())
+        request = RequestFactory().get("/")
+        request.user = User.objects.create(username="Jane", email="jane@example.com", is_superuser=True)
+
+        response = poam_export(request, str(s.id), 'csv')
+        rows = list(csv.reader(io.StringIO(b"".join(response.streaming_content).decode("utf8"))))
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(rows[0][0], "POA&M ID")
+        self.assertEqual(rows[0][-2:], ["Scheduled Completion Date", "URL"])
+        self.assertEqual([row[0] for row in rows[1:]], ["V-1", "V-2", "V-3"])
+
+        response = poam_export(request, str(s.id), 'xlsx')
+        sheet = load_workbook(io.BytesIO(b"".join(response.streaming_content))).active
+        self.assertEqual(sheet.title, "POA&Ms")
+        self.assertEqual([row[0] for row in sheet.iter_rows(values_only=True)], ["POA&M ID", "V-1", "V-2", "V-3"])
+        self.assertEqual(sheet.cell(row=2, column=5).value, "Weakness 1")
+        self.assertTrue(sheet.cell(row=1, column=1).font.bold)
+
+    def test_poam_spreadsheet(self):
+        from openpyxl import Workbook, load_workbook
+        from unittest.mock import patch
+        from controls.poam_spreadsheet import get_spreadsheet, update_cell
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            fn = os.path.join(tmp_dir, "poams_list.xlsx")
+            workbook = Workbook()
+            sheet = workbook.active
+            sheet.append(["POA&M List"])
+            sheet.append(["CSAM ID", "System Name", "POAM ID", "POAM Title", "Status"])
+            sheet.append([101, "System A", "P-1", "Fix AC-2", "Open"])
+            sheet.append([102, "System B", "P-2", "Fix CA-8", "Open"])
+            sheet.append([101, "System A", "P-3", "Fix SI-2", "Closed"])
+            workbook.save(fn)
+
+            # Rows are looked up by CSAM ID.
+            spreadsheet = get_spreadsheet(fn)
+            self.assertEqual([(index, row['POAM ID']) for index, row in spreadsheet.get_rows(101)], [(0, "P-1"), (2, "P-3")])
+            self.assertEqual(spreadsheet.get_rows(999), [])
+            self.assertIs(get_spreadsheet(fn), spreadsheet)
+
+            # Edits are written to the file and to the parsed spreadsheet.
+            update_cell(3, "status", "Open", path=fn)
+            self.assertEqual(load_workbook(fn).active.cell(row=5, column=5).value, "Open")
+            self.assertEqual(get_spreadsheet(fn).get_rows(101)[1][1]['Status'], "Open")
+            self.assertFalse(os.path.exists(fn + ".{}.tmp".format(os.getpid())))
+
+            # The spreadsheet is parsed again when the file changes.
+            workbook = load_workbook(fn)
+            workbook.active.append([102, "System B", "P-4", "Fix AU-2", "Open"])
+            workbook.save(fn)
+            os.utime(fn, ns=(os.stat(fn).st_atime_ns, os.stat(fn).st_mtime_ns + 1000000000))
+            self.assertEqual([row['POAM ID'] for index, row in get_spreadsheet(fn).get_rows(102)], ["P-2", "P-4"])
+
+            # Edits to a file that changed since it was parsed don't update
+            # the stale parse, which is replaced when next read.
+            workbook = load_workbook(fn)
+            workbook.active.append([102, "System B", "P-5", "Fix AU-3", "Open"])
+            workbook.save(fn)
+            os.utime(fn, ns=(os.stat(fn).st_atime_ns, os.stat(fn).st_mtime_ns + 2000000000))
+            update_cell(2, "status", "Closed", path=fn)
+            self.assertEqual([(row['POAM ID'], row['Status']) for index, row in get_spreadsheet(fn).get_rows(102)],
+                             [("P-2", "Closed"), ("P-4", "Open"), ("P-5", "Open")])
+
+            # An edit of an unknown column fails without failing the other
+            # edits written with it.
+            from controls import poam_spreadsheet
+            queued_edit = poam_spreadsheet._Edit(1, "status", "Closed")
+            poam_spreadsheet._pending_edits.append(queued_edit)
+            with self.assertRaises(KeyError):
+                update_cell(1, "missing column", "Closed", path=fn)
+            self.assertIsNone(queued_edit.error)
+            self.assertEqual(load_workbook(fn).active.cell(row=3, column=5).value, "Closed")
+
+            # If the write fails, it fails for every edit in the batch.
+            queued_edit = poam_spreadsheet._Edit(1, "status", "Open")
+            poam_spreadsheet._pending_edits.append(queued_edit)
+            with patch.object(poam_spreadsheet, "load_workbook", side_effect=IOError("disk error")):
+                with self.assertRaises(IOError):
+                    update_cell(2, "status", "Open", path=fn)
+            self.assertIsInstance(queued_edit.error, IOError)
+            self.assertEqual(load_workbook(fn).active.cell(row=3, column=5).value, "Closed")
+
+            # The lock file is not left next to the spreadsheet.
+            self.assertEqual(os.listdir(tmp_dir), ["poams_list.xlsx"])
+
 class OrgParamTests(SeleniumTest):
     """Class for OrgParam Unit Tests"""
 
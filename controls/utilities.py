@@ -1,4 +1,5 @@
 # Utility functions
+import json
 import re
 import sys
 from structlog import get_logger
@@ -148,3 +149,22 @@ def json_serializer(obj):
         return obj.isoformat()
     else:
         return obj
+
+def iter_json_with_list(document, placeholder, items, indent=2):
+    """Yields the JSON of document in chunks, with the list [placeholder] in
+    document replaced by the (possibly lazily generated) items. The output is
+    the same as json.dumps(document, indent=indent) with the list in place,
+    but only one item is held in memory at a time."""
+    text = json.dumps(document, sort_keys=False, indent=indent)
+    at = text.index(json.dumps(placeholder))
+    start = text.rindex("[", 0, at)
+    end = text.index("]", at)
+    item_indent = text[text.rindex("\n", 0, at) + 1:at]
+    end_indent = text[text.rindex("\n", 0, end) + 1:end]
+    yield text[:start]
+    separator = "[\n"
+    for item in items:
+        yield separator + item_indent + json.dumps(item, sort_keys=False, indent=indent).replace("\n", "\n" + item_indent)
+        separator = ",\n"
+    yield "[]" if separator == "[\n" else "\n" + end_indent + "]"
+    yield text[end + 1:]
@@ -25,7 +25,7 @@ from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
 from django.db.models import Q
 from django.db.models.functions import Lower
 from django.http import Http404, HttpResponse, HttpResponseRedirect, HttpResponseForbidden, JsonResponse, \
-    HttpResponseNotAllowed
+    HttpResponseNotAllowed, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
 from django.utils.text import slugify
@@ -35,13 +35,14 @@ from django.views.generic import ListView
 from django.urls import reverse
 from jsonschema import validate
 from jsonschema.exceptions import SchemaError, ValidationError as SchemaValidationError
+from openpyxl.styles import Alignment, Border, PatternFill
 from urllib.parse import quote
 
 from api.siteapp.serializers.tags import SimpleTagSerializer
 from guidedmodules.models import Task, Module, AppVersion, AppSource
 from guidedmodules.app_loading import ModuleDefinitionError
 from siteapp.model_mixins.tags import TagView
-from simple_history.utils import update_change_reason
+from simple_history.utils import bulk_create_with_history, update_change_reason
 
 from siteapp.models import Project, Organization, Folder, Portfolio, Tag, User, Role, Party, Appointment, Request, Proposal
 from siteapp.settings import GOVREADY_URL
@@ -53,6 +54,7 @@ from .forms import ImportOSCALComponentForm, SystemAssessmentResultForm
 from .forms import StatementPoamForm, PoamForm, ElementForm, DeploymentForm, StatementEditForm, ImportSystemForm, ImportProjectForm
 from .models import *
 from .utilities import *
+from .tabular_export import CellStyle, Column, THIN_SIDE, THIN_BORDER, csv_response, get_rows, iter_chunks, xlsx_response
 from integrations.models import Integration
 
 logging.basicConfig()
@@ -759,6 +761,20 @@ def import_record_delete(request, import_record_id):
     response = redirect('/controls/components')
     return response
 
+def natsorted_statement_ids(impl_smts):
+    """Returns the ids of statements naturally sorted by sid"""
+    return [smt_id for smt_id, sid in natsorted(impl_smts.values_list('id', 'sid'), key=lambda row: row[1])]
+
+def iter_statements(ids, chunk_size=500):
+    """Yields the statements with the given ids, in order. Only the ids of
+    all of the statements are held in memory: the statements, with their
+    producer elements, are fetched chunk_size at a time."""
+    for i in range(0, len(ids), chunk_size):
+        chunk = ids[i:i + chunk_size]
+        smts = Statement.objects.select_related('producer_element').in_bulk(chunk)
+        for smt_id in chunk:
+            yield smts[smt_id]
+
 class SystemSecurityPlanSerializer(object):
 
     def __init__(self, system, impl_smts):
@@ -767,6 +783,9 @@ class SystemSecurityPlanSerializer(object):
 
 class OSCALSystemSecurityPlanSerializer(SystemSecurityPlanSerializer):
 
+    # Stands in for the implemented requirements, which are streamed.
+    IMPLEMENTED_REQUIREMENTS = "__implemented_requirements__"
+
     @staticmethod
     def ssp_statement_id_from_control(control_id, part_id):
         if part_id:
@@ -793,7 +812,21 @@ class OSCALSystemSecurityPlanSerializer(SystemSecurityPlanSerializer):
             statements.append(statement_dict)
         return statements
 
-    def as_json(self):
+    def iter_implemented_requirements(self):
+        """
+        Yield an implemented requirement for each control sid group
+        Each group has that controls statements
+        """
+        smts = iter_statements(natsorted_statement_ids(self.impl_smts))
+        for control_id, group in groupby(smts, lambda ismt: ismt.sid):
+            yield {
+                "uuid": str(uuid.uuid4()),
+                "control-id": "{}".format(control_id),
+                "statements":  self.create_statement_dicts(control_id, group)
+            }
+
+    def get_document(self, implemented_requirements):
+        """Build the OSCAL SSP with the given implemented requirements"""
 
         # Build OSCAL SSP
         # Example: https://github.com/usnistgov/oscal-content/tree/master/examples/ssp/json/ssp-example.json
@@ -803,7 +836,8 @@ class OSCALSystemSecurityPlanSerializer(SystemSecurityPlanSerializer):
                               "profile_path",
                               None, None, None))
         orgs = list(Organization.objects.filter(projects=project))  # TODO: orgs need uuids
-        components = Element.objects.filter(statements_produced__in=self.impl_smts).filter(component_state="operational").exclude(element_type='system')
+        components = list(Element.objects.filter(statements_produced__in=self.impl_smts).filter(component_state="operational")
+                          .exclude(element_type='system').distinct().prefetch_related('tags'))
         impl_comps = [{ "component-uuid": str(component.uuid) } for component in components]
         parties = [{"uuid":str(uuid.uuid4()), "type": "organization", "name": org.name} for org in orgs]
         of = {
@@ -833,23 +867,10 @@ class OSCALSystemSecurityPlanSerializer(SystemSecurityPlanSerializer):
                 },
                 "control-implementation": {
                     "description": "",
-                    "implemented-requirements": [], # implemented-requirements
+                    "implemented-requirements": implemented_requirements, # implemented-requirements
                 }
             }
         }
-        # Create a list of dicts that are the implementation requirements
-        # Each element is for each control sid group
-        # Each group has that controls statements
-        for control_id, group in groupby(natsorted(self.impl_smts, key=lambda ismt: ismt.sid),
-                                         lambda ismt: ismt.sid):
-                imp_req_dict = {
-                    "uuid": str(uuid.uuid4()),
-                    "control-id": "{}".format(control_id),
-                    "statements":  self.create_statement_dicts(control_id, group)
-                }  #statements
-
-                of["system-security-plan"]["control-implementation"]["implemented-requirements"].append(imp_req_dict)
-
         # System implementation
         users = project.get_all_participants()# TODO:Need proper user title based on is_member, is_admin, editor_of
         # TODO: party-uuids users don't have uuids not sure what to do other than make a random one
@@ -933,29 +954,30 @@ class OSCALSystemSecurityPlanSerializer(SystemSecurityPlanSerializer):
                 "description": "The description of the authorization boundary would go here."
             }
         }
-        try:
-            # Create a temporary directory and dump the json_object in there.
-            tempdir = tempfile.mkdtemp()
-            path = os.path.join(tempdir, "ssp_object.json")
-            # Use trestle's ComponentDefinition method oscal_read to read the path to json in the temporary folder
-            path_ssp_definition = pathlib.Path(path)
-
-            with open(path, 'w+') as cred:
-                json.dump(of, cred)
-            # Read in temporary file and shape into trestle pydantic SSP definition.
-            trestle_oscal_json = trestlessp.SystemSecurityPlan.oscal_read(path_ssp_definition)
-            # Finally validate that this object is valid by the OSCAL System Security Plan definition
-            trestlessp.SystemSecurityPlan.validate(trestle_oscal_json)
-            # Cleanup
-            shutil.rmtree(tempdir)
-        except Exception as e:
-            logger.error(f"Invalid System Security Plan JSON: {e}")
-            shutil.rmtree(tempdir)
-            return HttpResponse(e)
+        return of
+
+    @staticmethod
+    def validate(of):
+        """Validate the OSCAL SSP against trestle's System Security Plan model, in memory"""
+        return trestlessp.SystemSecurityPlan.parse_obj(of["system-security-plan"])
+
+    def as_json(self, validate=True):
+        of = self.get_document(list(self.iter_implemented_requirements()))
+        if validate:
+            try:
+                self.validate(of)
+            except Exception as e:
+                logger.error(f"Invalid System Security Plan JSON: {e}")
+                return HttpResponse(e)
 
         oscal_string = json.dumps(of, sort_keys=False, indent=2)
         return oscal_string
 
+    def iter_json(self):
+        """Yield the (unvalidated) OSCAL SSP JSON in chunks, streaming the implemented requirements"""
+        of = self.get_document([self.IMPLEMENTED_REQUIREMENTS])
+        return iter_json_with_list(of, self.IMPLEMENTED_REQUIREMENTS, self.iter_implemented_requirements())
+
 class ComponentSerializer(object):
 
     def __init__(self, element, impl_smts):
@@ -982,11 +1004,18 @@ class OSCALComponentSerializer(ComponentSerializer):
         source = src_str
         return source
 
+    # Stands in for the control implementations, which are streamed.
+    CONTROL_IMPLEMENTATIONS = "__control_implementations__"
+
     def as_json(self):
+        return "".join(self.iter_json())
+
+    def iter_json(self):
+        """Yield the OSCAL component definition JSON in chunks, streaming the control implementations"""
         # Build OSCAL
         # Example: https://github.com/usnistgov/OSCAL/blob/master/src/content/ssp-example/json/example-component.json
         comp_uuid = str(self.element.uuid)
-        control_implementations = []
+        control_implementations = [self.CONTROL_IMPLEMENTATIONS]
         props = []
         orgs = list(Organization.objects.all())  # TODO: orgs need uuids, not sure which orgs to use for a component
         parties = [{"uuid": str(uuid.uuid4()), "type": "organization", "name": org.name} for org in orgs]
@@ -1020,16 +1049,24 @@ class OSCALComponentSerializer(ComponentSerializer):
         }
 
         # Add component's tags if they exist
-        if self.element.tags.exists():
-            props.extend([{"name": "tag", "ns": "https://govready.com/ns/oscal", "value": tag.label} for tag in self.element.tags.all()])
+        props.extend([{"name": "tag", "ns": "https://govready.com/ns/oscal", "value": tag.label} for tag in self.element.tags.all()])
 
         # Remove 'metadata.props' key if no metadata.props exist
         if len(props) == 0:
             of['component-definition']['metadata'].pop('props', None)
 
-        # create requirements and organize by source (sid_class)
+        # Statements ordered naturally by sid
+        smt_ids = natsorted_statement_ids(self.impl_smts)
+        # Remove 'control-implementations' key if no implementations exist
+        if len(smt_ids) == 0:
+            of['component-definition']['components'][0].pop('control-implementations', None)
+            return iter([json.dumps(of, sort_keys=False, indent=2)])
+        # Every control implementation's source is that of the last statement.
+        source = self.generate_source(Statement.objects.filter(id=smt_ids[-1]).values_list('source', flat=True)[0] or None)
+        return iter_json_with_list(of, self.CONTROL_IMPLEMENTATIONS, self.iter_control_implementations(smt_ids, source))
 
-        by_class = defaultdict(list)
+    def iter_control_implementations(self, smt_ids, source):
+        # create requirements and organize by source (sid_class)
 
         # work:
         # group stmts by control-id
@@ -1040,9 +1077,9 @@ class OSCALComponentSerializer(ComponentSerializer):
         # - OSCAL implemented_requirements and control_implementations need UUIDs
         #   which we don't have in the db, so we construct them.
 
-        for control_id, group in groupby(natsorted(self.impl_smts, key=lambda ismt: ismt.sid),
-                                         lambda ismt: ismt.sid):
-
+        for control_id, group in groupby(iter_statements(smt_ids), lambda ismt: ismt.sid):
+            requirements = []
+            seen = set()
             for smt in group:
                 statement_id = self.statement_id_from_control(control_id, smt.pid)
                 statement_req = {
@@ -1051,23 +1088,17 @@ class OSCALComponentSerializer(ComponentSerializer):
                     "control-id": statement_id,
                 }
                 # key-value by sid a.k.a control id for each requirement
-                if statement_req not in by_class[smt.sid]:
-                    by_class[smt.sid].append(statement_req)
+                key = (statement_req["uuid"], statement_req["description"], statement_id)
+                if key not in seen:
+                    seen.add(key)
+                    requirements.append(statement_req)
 
-        for sid_class, requirements in by_class.items():
-            control_implementation = {
+            yield {
                 "uuid":str(uuid4()),# TODO: Not sure if this should implemented or just generated here.
-                "source": self.generate_source(smt.source if smt.source else None),
-                "description": f"This is a partial implementation of the {sid_class} catalog, focusing on the control enhancement {requirements[0].get('control-id')}.",
+                "source": source,
+                "description": f"This is a partial implementation of the {control_id} catalog, focusing on the control enhancement {requirements[0].get('control-id')}.",
                 "implemented-requirements": [req for req in requirements]
             }
-            control_implementations.append(control_implementation)
-        # Remove 'control-implementations' key if no implementations exist
-        if len(control_implementations) == 0:
-            of['component-definition']['components'][0].pop('control-implementations', None)
-
-        oscal_string = json.dumps(of, sort_keys=False, indent=2)
-        return oscal_string
 
 class OpenControlComponentSerializer(ComponentSerializer):
 
@@ -1100,6 +1131,9 @@ class OpenControlComponentSerializer(ComponentSerializer):
 
 class ComponentImporter(object):
 
+    # Rows per INSERT when bulk creating components and statements.
+    BATCH_SIZE = 500
+
     def import_components_as_json(self, import_name, json_object, request=None, existing_import_record=False, stopinvalid=True):
         """Imports Components from a JSON object
 
@@ -1114,35 +1148,23 @@ class ComponentImporter(object):
         """
         issues = []
         try:
-            # Create a temporary directory and dump the json_object in there.
-            tempdir = tempfile.mkdtemp()
-            path = os.path.join(tempdir, "object.json")
-            # Use trestle's ComponentDefinition method oscal_read to read the path to json in the temporary folder
-            path_component_definition = pathlib.Path(path)
             oscal_json = json.loads(json_object)
-            with open(path, 'w+') as cred:
-                json.dump(oscal_json, cred)
-            # Read in temporary file and shape into trestle pydantic Component definition.
-            trestle_oscal_json = trestlecomponent.ComponentDefinition.oscal_read(path_component_definition)
-            # Finally validate that this object is valid by the component definition
-            trestlecomponent.ComponentDefinition.validate(trestle_oscal_json)
-            # Cleanup
-            shutil.rmtree(tempdir)
+            self.validate_component_definition(oscal_json)
         except Exception as e:
+            error = e.__context__ or e
             logger.error(e)
             logger.warning(
                 event="error_importing_component",
-                object={"object": "component", "name": import_name, "error": {e.__context__}}
+                object={"object": "component", "name": import_name, "error": {error}}
                 )
-            issues.append({"object": "component", "name": import_name, "error": {e.__context__}})
-            shutil.rmtree(tempdir)
+            issues.append({"object": "component", "name": import_name, "error": {error}})
             # Check a component uploaded to form
             if request and request.POST.get("json_content") is not None:
                 if stopinvalid:
-                    messages.add_message(request, messages.ERROR, f"IMPORT HALTED. Invalid Component JSON: {e.__context__}")
+                    messages.add_message(request, messages.ERROR, f"IMPORT HALTED. Invalid Component JSON: {error}")
                     return HttpResponse(e)
                 else:
-                    messages.add_message(request, messages.INFO, f"IMPORT CONTINUED WITH POSSIBLE ERROR. Invalid Component JSON: {e.__context__}")
+                    messages.add_message(request, messages.INFO, f"IMPORT CONTINUED WITH POSSIBLE ERROR. Invalid Component JSON: {error}")
             else:
                 if stopinvalid:
                     print("\nNOTICE - ISSUES DURING COMPONENT IMPORT\n")
@@ -1166,6 +1188,22 @@ class ComponentImporter(object):
         new_import_record = self.create_import_record(import_name, created_components, existing_import_record=existing_import_record)
         return new_import_record
 
+    def validate_component_definition(self, oscal_json):
+        """Validates OSCAL JSON as a component definition
+
+        @type oscal_json: dict
+        @param oscal_json: OSCAL component definition JSON object
+        @rtype: trestle ComponentDefinition
+        @returns: The parsed component definition
+        """
+        # Like trestle's ComponentDefinition.oscal_read, but without writing
+        # the object to a file for trestle to read back.
+        if not isinstance(oscal_json, dict) or len(oscal_json) != 1:
+            raise ValueError("Invalid OSCAL file structure, the component definition must have a single top level key wrapping it.")
+        if 'component-definition' not in oscal_json:
+            raise ValueError("Provided OSCAL file does not have top level key: component-definition")
+        return trestlecomponent.ComponentDefinition.parse_obj(oscal_json['component-definition'])
+
     def create_import_record(self, import_name, components, existing_import_record=False):
         """Associates components and statements to an import record
 
@@ -1181,25 +1219,94 @@ class ComponentImporter(object):
         import_record = ImportRecord.objects.filter(name=import_name).last()
         if import_record is None or not existing_import_record:
             import_record = ImportRecord.objects.create(name=import_name)
+        component_ids = [component.id for component in components]
+        Element.objects.filter(id__in=component_ids).update(import_record=import_record)
         for component in components:
-            statements = Statement.objects.filter(producer_element=component)
-            for statement in statements:
-                statement.import_record.add(import_record)
-                #statement.save()
             component.import_record = import_record
-            component.save()
+        StatementImportRecord = Statement.import_record.through
+        statement_ids = Statement.objects.filter(producer_element_id__in=component_ids).values_list('id', flat=True)
+        StatementImportRecord.objects.bulk_create([
+            StatementImportRecord(statement_id=statement_id, importrecord_id=import_record.id)
+            for statement_id in statement_ids
+        ], batch_size=self.BATCH_SIZE, ignore_conflicts=True)
 
         return import_record
 
-    def create_components(self, oscal_json, user_owner=None):
-        """Creates Elements (Components) from valid OSCAL JSON"""
-        components_created = []
-        components = oscal_json['component-definition']['components']
-        for component in components:
-            new_component = self.create_component(component, user_owner)
-            if new_component is not None:
-                components_created.append(new_component)
+    def create_components(self, oscal_json, user_owner=None, private=False):
+        """Creates Elements (Components) from valid OSCAL JSON
 
+        Components, their statements and tags and their owner's permissions
+        are created in bulk. Components without control implementation
+        statements are skipped.
+        """
+        # Find unique names for the new components with one query.
+        taken_names = set(Element.objects.values_list('name', flat=True))
+        new_components = []
+        for component_json in oscal_json['component-definition']['components']:
+            statements = []
+            for control_element in component_json.get('control-implementations', None) or []:
+                catalog = oscalize_catalog_key(control_element.get('source', None))
+                statements.extend(self.build_control_implementation_statements(catalog, control_element))
+            # If there are no valid statements in the json object
+            if not statements:
+                logger.info(f"The Component {component_json['title']} will not be created as there were no valid statements provided.")
+                continue
+
+            component_name = component_json['title']
+            while component_name in taken_names:
+                component_name = increment_element_name(component_name)
+            taken_names.add(component_name)
+
+            new_component = Element(
+                name=component_name,
+                description=component_json['description'] if 'description' in component_json else 'Description missing',
+                # Components uploaded to the Component Library are all system_element types
+                element_type="system_element",
+                uuid=component_json['uuid'] if 'uuid' in component_json else uuid.uuid4(),
+                component_type=component_json['type'] if 'type' in component_json else "software",
+                private=private
+            )
+            new_components.append((new_component, statements, self.get_component_tags(component_json)))
+        if not new_components:
+            return []
+
+        with transaction.atomic():
+            Element.objects.bulk_create([component for component, statements, tags in new_components], batch_size=self.BATCH_SIZE)
+            # Not every database returns primary keys from a bulk insert, so
+            # reload the components by their (unique) names.
+            created = Element.objects.in_bulk([component.name for component, statements, tags in new_components], field_name='name')
+            components_created = [created[component.name] for component, statements, tags in new_components]
+
+            new_statements = []
+            for component, (_, statements, tags) in zip(components_created, new_components):
+                for statement in statements:
+                    statement.producer_element = component
+                new_statements.extend(statements)
+            # Statements are versioned, so their history is created with them
+            # as Statement.save would. (Elements have no history.)
+            bulk_create_with_history(new_statements, Statement, batch_size=self.BATCH_SIZE)
+
+            component_tags = [(component, tags) for component, (_, statements, tags) in zip(components_created, new_components) if tags]
+            if component_tags:
+                labels = set().union(*[tags for component, tags in component_tags])
+                existing_labels = set(Tag.objects.filter(label__in=labels).values_list('label', flat=True))
+                Tag.objects.bulk_create([Tag(label=label) for label in labels - existing_labels])
+                tag_ids = dict(Tag.objects.filter(label__in=labels).values_list('label', 'id'))
+                ElementTag = Element.tags.through
+                ElementTag.objects.bulk_create([
+                    ElementTag(element_id=component.id, tag_id=tag_ids[label])
+                    for component, tags in component_tags
+                    for label in tags
+                ], batch_size=self.BATCH_SIZE)
+
+            if user_owner:
+                Element.assign_owner_permissions_in_bulk(user_owner, components_created)
+
+        logger.info(
+            event="new_elements with user as owner",
+            object={"object": "element", "count": len(components_created)},
+            user={"id": user_owner.id, "username": user_owner.username} if user_owner else None
+        )
         return components_created
 
     def create_component(self, component_json, user_owner=None, private=False):
@@ -1211,66 +1318,26 @@ class ComponentImporter(object):
         @rtype: Element
         @returns: Element object if created, None otherwise
         """
+        components_created = self.create_components({'component-definition': {'components': [component_json]}},
+                                                     user_owner, private=private)
+        return components_created[0] if components_created else None
 
-        component_name = component_json['title']
-        
-        while Element.objects.filter(name=component_name).count() > 0:
-            component_name = increment_element_name(component_name)
-
-        new_component = Element.objects.create(
-            name=component_name,
-            description=component_json['description'] if 'description' in component_json else 'Description missing',
-            # Components uploaded to the Component Library are all system_element types
-            element_type="system_element",
-            uuid=component_json['uuid'] if 'uuid' in component_json else uuid.uuid4(),
-            component_type=component_json['type'] if 'type' in component_json else "software",
-            private=private
-        )
-
-        logger.info(f"Component {new_component.name} created with UUID {new_component.uuid}.")
-        if user_owner:
-            new_component.assign_owner_permissions(user_owner)
-            logger.info(
-                event="new_element with user as owner",
-                object={"object": "element", "id": new_component.id, "name":new_component.name},
-                user={"id": user_owner.id, "username": user_owner.username}
-            )
-
-        component_props = component_json.get('props', None)
-        if component_props:
-            desired_tags = set([prop['value'] for prop in component_props if prop['name'] == 'tag' and 'ns' in prop and prop['ns'] == "https://govready.com/ns/oscal"])
-            existing_tags = Tag.objects.filter(label__in=desired_tags).values('id', 'label')
-            tags_to_create = desired_tags.difference(set([tag['label'] for tag in existing_tags]))
-            new_tags = Tag.objects.bulk_create([Tag(label=tag) for tag in tags_to_create])
-            all_tag_ids = [tag.id for tag in new_tags] + [tag['id'] for tag in existing_tags]
-            new_component.add_tags(all_tag_ids)
-            new_component.save()
-        created_statements = []
-        control_implementation_statements = component_json.get('control-implementations', None)
-        # If there data exists the OSCAL component's control-implementations key
-        if control_implementation_statements:
-            for control_element in control_implementation_statements:
-                catalog = oscalize_catalog_key(control_element.get('source', None))
-                created_statements = self.create_control_implementation_statements(catalog, control_element, new_component)
-        # If there are no valid statements in the json object
-        if created_statements == []:
-            logger.info(f"The Component {new_component.name} will be deleted as there were no valid statements provided.")
-            new_component.delete()
-            new_component = None
-
-        return new_component
+    def get_component_tags(self, component_json):
+        """Returns the set of GovReady tag labels in a component's props"""
+        component_props = component_json.get('props', None) or []
+        return set([prop['value'] for prop in component_props if prop['name'] == 'tag' and 'ns' in prop and prop['ns'] == "https://govready.com/ns/oscal"])
 
-    def create_control_implementation_statements(self, catalog_key, control_element, parent_component):
-        """Creates a Statement from a JSON dict implemented-requirements
+    def build_control_implementation_statements(self, catalog_key, control_element, parent_component=None):
+        """Builds (unsaved) Statements from a JSON dict implemented-requirements
 
         @type catalog_key: str
         @param catalog_key: Catalog of the control statements
         @type control_element: dict
         @param control_element: Implemented controls
-        @type parent_component: str
-        @param parent_component: UUID of parent component
-        @rtype: dict
-        @returns: New statement objects created
+        @type parent_component: Element
+        @param parent_component: Component producing the statements
+        @rtype: list
+        @returns: New statement objects
         """
 
         new_statements = []
@@ -1289,9 +1356,23 @@ class ComponentImporter(object):
                 status=implemented_control['status'] if 'status' in implemented_control else None,
                 producer_element=parent_component,
             )
-            logger.info(f"New statement with UUID {new_statement.uuid} being created.")
             new_statements.append(new_statement)
-        statements_created = Statement.objects.bulk_create(new_statements)
+        return new_statements
+
+    def create_control_implementation_statements(self, catalog_key, control_element, parent_component):
+        """Creates a Statement from a JSON dict implemented-requirements
+
+        @type catalog_key: str
+        @param catalog_key: Catalog of the control statements
+        @type control_element: dict
+        @param control_element: Implemented controls
+        @type parent_component: str
+        @param parent_component: UUID of parent component
+        @rtype: dict
+        @returns: New statement objects created
+        """
+        new_statements = self.build_control_implementation_statements(catalog_key, control_element, parent_component)
+        statements_created = Statement.objects.bulk_create(new_statements, batch_size=self.BATCH_SIZE)
         return statements_created
 
 def add_selected_components(system, import_record):
@@ -1938,12 +2019,9 @@ def system_element_download_oscal_json(request, system_id, element_id):
         element = Element.objects.get(id=element_id)
         # Get the impl_smts contributed by this component to system
         impl_smts = Statement.objects.filter(producer_element=element)
-    print(f"component library statements {len(impl_smts)}")
-    response = HttpResponse(content_type="application/json")
+    response = StreamingHttpResponse(OSCALComponentSerializer(element, impl_smts).iter_json(), content_type="application/json")
     filename = str(PurePath(slugify(element.name)).with_suffix('.json'))
     response['Content-Disposition'] = f'attachment; filename="{filename}"'
-    body = OSCALComponentSerializer(element, impl_smts).as_json()
-    response.write(body)
 
     return response
 
@@ -1951,16 +2029,27 @@ def system_element_download_oscal_json(request, system_id, element_id):
 def OSCAL_ssp_export(*args, **kwargs):
     """
     Exporting a system security plan in OSCAL json version 1.0.0
+
+    The SSP is streamed without validation unless ?validate=true is given,
+    in which case it is built and validated in memory first.
     """
     system_id = kwargs.get('system_id', 1)
     # Retrieve identified System
     system = System.objects.get(id=system_id)
     impl_smts = Statement.objects.filter(consumer_element=system.root_element, statement_type=StatementTypeEnum.CONTROL_IMPLEMENTATION.name)
-    oscal_string = OSCALSystemSecurityPlanSerializer(system, impl_smts).as_json()
+    serializer = OSCALSystemSecurityPlanSerializer(system, impl_smts)
     # File name construction and JSON response
     filename = "{}_OSCAL_{}.json".format(system.root_element.name.replace(" ", "_"),
                                                            datetime.now().strftime("%Y-%m-%d-%H-%M"))
-    resp = HttpResponse(oscal_string, content_type="application/json")
+    request = args[0] if args else None
+    if getattr(request, "GET", {}).get("validate", "").lower() in ("true", "1"):
+        oscal_string = serializer.as_json()
+        if isinstance(oscal_string, HttpResponse):
+            # Invalid
+            return oscal_string
+        resp = HttpResponse(oscal_string, content_type="application/json")
+    else:
+        resp = StreamingHttpResponse(serializer.iter_json(), content_type="application/json")
     resp["content-disposition"] = "attachment; filename=%s" % quote(filename)
     return resp
 
@@ -1979,294 +2068,48 @@ def controls_selected_export_xacta_xslx(request, system_id):
 
         # Retrieve any related Implementation Statements
         impl_smts = system.root_element.statements_consumed.all()
-        impl_smts_by_sid = {}
-        for smt in impl_smts:
-            if smt.sid in impl_smts_by_sid:
-                impl_smts_by_sid[smt.sid].append(smt)
-            else:
-                impl_smts_by_sid[smt.sid] = [smt]
-
-        for control in controls:
-            if control.oscal_ctl_id in impl_smts_by_sid:
-                setattr(control, 'impl_smts', impl_smts_by_sid[control.oscal_ctl_id])
-            else:
-                setattr(control, 'impl_smts', None)
-
-        from openpyxl import Workbook
-        from openpyxl.styles import Border, Side, PatternFill, Font, Alignment
-        from tempfile import NamedTemporaryFile
-
-        wb = Workbook()
-        ws = wb.active
-        # create alignment style
-        wrap_alignment = Alignment(wrap_text=True)
-        ws.title = "Controls_Implementation"
-
-        # Add in field name row
-        # Paragraph/ReqID
-        c = ws.cell(row=1, column=1, value="Paragraph/ReqID")
-        c.fill = PatternFill("solid", fgColor="5599FE")
-        c.font = Font(color="FFFFFF", bold=True)
-        c.border = Border(left=Side(border_style="thin", color="444444"), right=Side(border_style="thin", color="444444"),
-                          bottom=Side(border_style="thin", color="444444"),
-                          outline=Side(border_style="thin", color="444444"))
 
-        # Stated Requirement (Control statement/Requirement)
-        c = ws.cell(row=1, column=2, value="Title")
-        c.fill = PatternFill("solid", fgColor="5599FE")
-        c.font = Font(color="FFFFFF", bold=True)
-        ws.column_dimensions['B'].width = 30
-        c.border = Border(right=Side(border_style="thin", color="444444"), bottom=Side(border_style="thin", color="444444"),
-                          outline=Side(border_style="thin", color="444444"))
-
-        # Private Implementation
-        c = ws.cell(row=1, column=3, value="Private Implementation")
-        c.fill = PatternFill("solid", fgColor="5599FE")
-        c.font = Font(color="FFFFFF", bold=True)
-        ws.column_dimensions['C'].width = 80
-        c.border = Border(right=Side(border_style="thin", color="444444"), bottom=Side(border_style="thin", color="444444"),
-                          outline=Side(border_style="thin", color="444444"))
-
-        # Public Implementation
-        c = ws.cell(row=1, column=4, value="Public Implementation")
-        c.fill = PatternFill("solid", fgColor="5599FE")
-        c.font = Font(color="FFFFFF", bold=True)
-        ws.column_dimensions['D'].width = 80
-        c.border = Border(right=Side(border_style="thin", color="444444"), bottom=Side(border_style="thin", color="444444"),
-                          outline=Side(border_style="thin", color="444444"))
-
-        # Notes
-        c = ws.cell(row=1, column=5, value="Notes")
-        ws.column_dimensions['E'].width = 60
-        c.fill = PatternFill("solid", fgColor="5599FE")
-        c.font = Font(color="FFFFFF", bold=True)
-        c.border = Border(right=Side(border_style="thin", color="444444"), bottom=Side(border_style="thin", color="444444"),
-                          outline=Side(border_style="thin", color="444444"))
-
-        # Status ["Implemented", "Planned"]
-        c = ws.cell(row=1, column=6, value="Status")
-        ws.column_dimensions['F'].width = 15
-        c.fill = PatternFill("solid", fgColor="5599FE")
-        c.font = Font(color="FFFFFF", bold=True)
-        c.border = Border(right=Side(border_style="thin", color="444444"), bottom=Side(border_style="thin", color="444444"),
-                          outline=Side(border_style="thin", color="444444"))
-
-        # Expected Completion (expected implementation)
-        c = ws.cell(row=1, column=7, value="Expected Completion")
-        ws.column_dimensions['G'].width = 20
-        c.fill = PatternFill("solid", fgColor="5599FE")
-        c.font = Font(color="FFFFFF", bold=True)
-        c.border = Border(right=Side(border_style="thin", color="444444"), bottom=Side(border_style="thin", color="444444"),
-                          outline=Side(border_style="thin", color="444444"))
-
-        # Class ["Management", "Operational", "Technical",
-        c = ws.cell(row=1, column=8, value="Class")
-        ws.column_dimensions['H'].width = 15
-        c.fill = PatternFill("solid", fgColor="5599FE")
-        c.font = Font(color="FFFFFF", bold=True)
-        c.border = Border(right=Side(border_style="thin", color="444444"), bottom=Side(border_style="thin", color="444444"),
-                          outline=Side(border_style="thin", color="444444"))
-
-        # Priority ["p0", "P1", "P2", "P3"]
-        c = ws.cell(row=1, column=9, value="Priority")
-        ws.column_dimensions['I'].width = 15
-        c.fill = PatternFill("solid", fgColor="5599FE")
-        c.font = Font(color="FFFFFF", bold=True)
-        c.border = Border(right=Side(border_style="thin", color="444444"), bottom=Side(border_style="thin", color="444444"),
-                          outline=Side(border_style="thin", color="444444"))
-
-        # Responsible Entities
-        c = ws.cell(row=1, column=10, value="Responsible Entities")
-        ws.column_dimensions['J'].width = 20
-        c.fill = PatternFill("solid", fgColor="5599FE")
-        c.font = Font(color="FFFFFF", bold=True)
-        c.border = Border(right=Side(border_style="thin", color="444444"), bottom=Side(border_style="thin", color="444444"),
-                          outline=Side(border_style="thin", color="444444"))
-
-        # Control Owner(s)
-        c = ws.cell(row=1, column=11, value="Control Owner(s)")
-        ws.column_dimensions['K'].width = 15
-        c.fill = PatternFill("solid", fgColor="5599FE")
-        c.font = Font(color="FFFFFF", bold=True)
-        c.border = Border(right=Side(border_style="thin", color="444444"), bottom=Side(border_style="thin", color="444444"),
-                          outline=Side(border_style="thin", color="444444"))
-
-        # Type ["System-Specific", "Hybrid", "Inherited", "Common", "blank"]
-        c = ws.cell(row=1, column=12, value="Type")
-        ws.column_dimensions['L'].width = 15
-        c.fill = PatternFill("solid", fgColor="5599FE")
-        c.font = Font(color="FFFFFF", bold=True)
-        c.border = Border(right=Side(border_style="thin", color="444444"), bottom=Side(border_style="thin", color="444444"),
-                          outline=Side(border_style="thin", color="444444"))
-
-        # Inherited From
-        c = ws.cell(row=1, column=13, value="Inherited From")
-        ws.column_dimensions['M'].width = 20
-        c.fill = PatternFill("solid", fgColor="5599FE")
-        c.font = Font(color="FFFFFF", bold=True)
-        c.border = Border(right=Side(border_style="thin", color="444444"), bottom=Side(border_style="thin", color="444444"),
-                          outline=Side(border_style="thin", color="444444"))
-
-        # Provide As ["Do Not Share", "blank"]
-        c = ws.cell(row=1, column=14, value="Provide As")
-        ws.column_dimensions['N'].width = 15
-        c.fill = PatternFill("solid", fgColor="5599FE")
-        c.font = Font(color="FFFFFF", bold=True)
-        c.border = Border(right=Side(border_style="thin", color="444444"), bottom=Side(border_style="thin", color="444444"),
-                          outline=Side(border_style="thin", color="444444"))
-
-        # Evaluation Status ["Evaluated", "Expired", "Not Evaluated", "Unknown", "blank"]
-        c = ws.cell(row=1, column=15, value="Evaluation Status")
-        ws.column_dimensions['O'].width = 15
-        c.fill = PatternFill("solid", fgColor="5599FE")
-        c.font = Font(color="FFFFFF", bold=True)
-        c.border = Border(right=Side(border_style="thin", color="444444"), bottom=Side(border_style="thin", color="444444"),
-                          outline=Side(border_style="thin", color="444444"))
-
-        # Control Origination
-        c = ws.cell(row=1, column=16, value="Control Origination")
-        ws.column_dimensions['P'].width = 15
-        c.fill = PatternFill("solid", fgColor="5599FE")
-        c.font = Font(color="FFFFFF", bold=True)
-        c.border = Border(right=Side(border_style="thin", color="444444"), bottom=Side(border_style="thin", color="444444"),
-                          outline=Side(border_style="thin", color="444444"))
+        control_style = CellStyle(fill=PatternFill("solid", fgColor="FFFF99"),
+                                  alignment=Alignment(vertical='top', wrapText=True),
+                                  border=THIN_BORDER)
+        impl_style = CellStyle(alignment=Alignment(vertical='top', wrapText=True),
+                               border=Border(right=THIN_SIDE, bottom=THIN_SIDE, outline=THIN_SIDE))
+        xacta_columns = [
+            Column("Paragraph/ReqID", lambda control: control.get_flattened_oscal_control_as_dict()['id_display'].upper(), style=control_style),
+            Column("Title", lambda control: control.get_flattened_oscal_control_as_dict()['title'], 30, control_style),
+            Column("Private Implementation", lambda control: control.impl_smts_combined, 80, impl_style),
+            Column("Public Implementation", width=80),
+            Column("Notes", width=60),
+            Column("Status", width=15),  # ["Implemented", "Planned"]
+            Column("Expected Completion", width=20),
+            Column("Class", width=15),  # ["Management", "Operational", "Technical"]
+            Column("Priority", width=15),  # ["p0", "P1", "P2", "P3"]
+            Column("Responsible Entities", width=20),
+            Column("Control Owner(s)", width=15),
+            Column("Type", width=15),  # ["System-Specific", "Hybrid", "Inherited", "Common", "blank"]
+            Column("Inherited From", width=20),
+            Column("Provide As", width=15),  # ["Do Not Share", "blank"]
+            Column("Evaluation Status", width=15),  # ["Evaluated", "Expired", "Not Evaluated", "Unknown", "blank"]
+            Column("Control Origination", width=15),
+            Column("History", width=15),
+        ]
 
-        # History
-        c = ws.cell(row=1, column=17, value="History")
-        ws.column_dimensions['Q'].width = 15
-        c.fill = PatternFill("solid", fgColor="5599FE")
-        c.font = Font(color="FFFFFF", bold=True)
-        c.border = Border(right=Side(border_style="thin", color="444444"), bottom=Side(border_style="thin", color="444444"),
-                          outline=Side(border_style="thin", color="444444"))
-
-        for row in range(2, len(controls) + 1):
-            control = controls[row - 2]
-
-            # Paragraph/ReqID
-            c = ws.cell(row=row, column=1, value=control.get_flattened_oscal_control_as_dict()['id_display'].upper())
-            c.fill = PatternFill("solid", fgColor="FFFF99")
-            c.alignment = Alignment(vertical='top', wrapText=True)
-            c.border = Border(left=Side(border_style="thin", color="444444"),
-                              right=Side(border_style="thin", color="444444"),
-                              bottom=Side(border_style="thin", color="444444"),
-                              outline=Side(border_style="thin", color="444444"))
-
-            # Title
-            c = ws.cell(row=row, column=2, value=control.get_flattened_oscal_control_as_dict()['title'])
-            c.fill = PatternFill("solid", fgColor="FFFF99")
-            c.alignment = Alignment(vertical='top', wrapText=True)
-            c.border = Border(right=Side(border_style="thin", color="444444"),
-                              bottom=Side(border_style="thin", color="444444"),
-                              outline=Side(border_style="thin", color="444444"))
-
-            # Private Implementation
-            smt_combined = ""
-            if control.impl_smts:
-                for smt in control.impl_smts:
-                    smt_combined += smt.body
-            c = ws.cell(row=row, column=3, value=smt_combined)
-            c.alignment = Alignment(vertical='top', wrapText=True)
-            c.border = Border(right=Side(border_style="thin", color="444444"),
-                              bottom=Side(border_style="thin", color="444444"),
-                              outline=Side(border_style="thin", color="444444"))
-
-            # Public Implementation
-            c.alignment = Alignment(vertical='top', wrapText=True)
-            c.border = Border(right=Side(border_style="thin", color="444444"),
-                              bottom=Side(border_style="thin", color="444444"),
-                              outline=Side(border_style="thin", color="444444"))
-
-            # Notes
-            c = ws.cell(row=1, column=5, value="Notes")
-            c.border = Border(right=Side(border_style="thin", color="444444"),
-                              bottom=Side(border_style="thin", color="444444"),
-                              outline=Side(border_style="thin", color="444444"))
-
-            # Status ["Implemented", "Planned"]
-            c = ws.cell(row=1, column=6, value="Status")
-            c.border = Border(right=Side(border_style="thin", color="444444"),
-                              bottom=Side(border_style="thin", color="444444"),
-                              outline=Side(border_style="thin", color="444444"))
-
-            # Expected Completion (expected implementation)
-            c = ws.cell(row=1, column=7, value="Expected Completion")
-            c.border = Border(right=Side(border_style="thin", color="444444"),
-                              bottom=Side(border_style="thin", color="444444"),
-                              outline=Side(border_style="thin", color="444444"))
-
-            # Class ["Management", "Operational", "Technical",
-            c = ws.cell(row=1, column=8, value="Class")
-            c.border = Border(right=Side(border_style="thin", color="444444"),
-                              bottom=Side(border_style="thin", color="444444"),
-                              outline=Side(border_style="thin", color="444444"))
-
-            # Priority ["p0", "P1", "P2", "P3"]
-            c = ws.cell(row=1, column=9, value="Priority")
-            c.border = Border(right=Side(border_style="thin", color="444444"),
-                              bottom=Side(border_style="thin", color="444444"),
-                              outline=Side(border_style="thin", color="444444"))
-
-            # Responsible Entities
-            c = ws.cell(row=1, column=10, value="Responsible Entities")
-            c.border = Border(right=Side(border_style="thin", color="444444"),
-                              bottom=Side(border_style="thin", color="444444"),
-                              outline=Side(border_style="thin", color="444444"))
-
-            # Control Owner(s)
-            c = ws.cell(row=1, column=11, value="Control Owner(s)")
-            c.border = Border(right=Side(border_style="thin", color="444444"),
-                              bottom=Side(border_style="thin", color="444444"),
-                              outline=Side(border_style="thin", color="444444"))
-
-            # Type ["System-Specific", "Hybrid", "Inherited", "Common", "blank"]
-            c = ws.cell(row=1, column=12, value="Type")
-            c.border = Border(right=Side(border_style="thin", color="444444"),
-                              bottom=Side(border_style="thin", color="444444"),
-                              outline=Side(border_style="thin", color="444444"))
-
-            # Inherited From
-            c = ws.cell(row=1, column=13, value="Inherited From")
-            c.border = Border(right=Side(border_style="thin", color="444444"),
-                              bottom=Side(border_style="thin", color="444444"),
-                              outline=Side(border_style="thin", color="444444"))
-
-            # Provide As ["Do Not Share", "blank"]
-            c = ws.cell(row=1, column=14, value="Provide As")
-            c.border = Border(right=Side(border_style="thin", color="444444"),
-                              bottom=Side(border_style="thin", color="444444"),
-                              outline=Side(border_style="thin", color="444444"))
-
-            # Evaluation Status ["Evaluated", "Expired", "Not Evaluated", "Unknown", "blank"]
-            c = ws.cell(row=1, column=15, value="Evaluation Status")
-            c.border = Border(right=Side(border_style="thin", color="444444"),
-                              bottom=Side(border_style="thin", color="444444"),
-                              outline=Side(border_style="thin", color="444444"))
-
-            # Control Origination
-            c = ws.cell(row=1, column=16, value="Control Origination")
-            c.border = Border(right=Side(border_style="thin", color="444444"),
-                              bottom=Side(border_style="thin", color="444444"),
-                              outline=Side(border_style="thin", color="444444"))
-
-            # History
-            c = ws.cell(row=1, column=17, value="History")
-            c.border = Border(right=Side(border_style="thin", color="444444"),
-                              bottom=Side(border_style="thin", color="444444"),
-                              outline=Side(border_style="thin", color="444444"))
-
-        with NamedTemporaryFile() as tmp:
-            wb.save(tmp.name)
-            tmp.seek(0)
-            stream = tmp.read()
-            blob = stream
+        def rows():
+            for chunk in iter_chunks(controls):
+                # Combine the implementation statements of this chunk of controls
+                impl_smts_combined = defaultdict(str)
+                for sid, body in impl_smts.filter(sid__in=set(control.oscal_ctl_id for control in chunk)).values_list('sid', 'body'):
+                    impl_smts_combined[sid] += body
+                for control in chunk:
+                    control.impl_smts_combined = impl_smts_combined.get(control.oscal_ctl_id, "")
+                yield from get_rows(xacta_columns, chunk)
 
         mime_type = "application/octet-stream"
         filename = "{}_control_implementations-{}.xlsx".format(system.root_element.name.replace(" ", "_"),
                                                                datetime.now().strftime("%Y-%m-%d-%H-%M"))
 
-        resp = HttpResponse(blob, mime_type)
-        resp['Content-Disposition'] = 'inline; filename=' + filename
-        return resp
+        return xlsx_response(filename, xacta_columns, rows(), title="Controls_Implementation",
+                             content_type=mime_type, disposition='inline')
     else:
         # User does not have permission to this system
         raise Http404
@@ -3471,140 +3314,48 @@ def poam_export(request, system_id, format='xlsx'):
     # Retrieve related selected POA&Ms if user has permission on system
     if request.user.has_perm('view_system', system):
 
-        if format == 'xlsx':
-            from openpyxl import Workbook
-            from openpyxl.styles import Border, Side, PatternFill, Font, Alignment
-            from tempfile import NamedTemporaryFile
-
-            wb = Workbook()
-            ws = wb.active
-            # create alignment style
-            wrap_alignment = Alignment(wrap_text=True)
-            ws.title = "POA&Ms"
-        else:
-            import csv, io
-            csv_buffer = io.StringIO(newline='\n')
-            csv_writer = csv.writer(csv_buffer)
-
-        poam_fields = [
-            {'var_name': 'poam_id', 'name': 'POA&M ID', 'width': 8},
-            {'var_name': 'poam_group', 'name': 'POA&M Group', 'width': 16},
-            {'var_name': 'weakness_name', 'name': 'Weakness Name', 'width': 24},
-            {'var_name': 'controls', 'name': 'Controls', 'width': 16},
-            {'var_name': 'body', 'name': 'Description', 'width': 60},
-            {'var_name': 'status', 'name': 'Status', 'width': 8},
-            {'var_name': 'risk_rating_original', 'name': 'Risk Rating Original', 'width': 16},
-            {'var_name': 'risk_rating_adjusted', 'name': 'Risk Rating Adjusted', 'width': 16},
-            {'var_name': 'weakness_detection_source', 'name': 'Weakness Detection Source', 'width': 24},
-            {'var_name': 'weakness_source_identifier', 'name': 'Weakness Source Identifier', 'width': 24},
-            {'var_name': 'remediation_plan', 'name': 'Remediation Plan', 'width': 60},
-            {'var_name': 'milestones', 'name': 'Milestones', 'width': 60},
-            {'var_name': 'milestone_changes', 'name': 'Milestone Changes', 'width': 30},
-            {'var_name': 'scheduled_completion_date', 'name': 'Scheduled Completion Date', 'width': 18},
+        cell_style = CellStyle(fill=PatternFill("solid", fgColor="FFFFFF"),
+                               alignment=Alignment(vertical='top', horizontal='left', wrapText=True),
+                               border=Border(right=THIN_SIDE, bottom=THIN_SIDE, outline=THIN_SIDE))
+
+        def poam_field(var_name):
+            return lambda poam_smt: getattr(poam_smt.poam, var_name)
+
+        def poam_url(poam_smt):
+            return settings.SITE_ROOT_URL + "/systems/{}/poams/{}/edit".format(system_id, poam_smt.id)
+
+        poam_columns = [
+            Column('POA&M ID', lambda poam_smt: "V-{}".format(poam_smt.poam.poam_id), 8),
+            Column('POA&M Group', poam_field('poam_group'), 16),
+            Column('Weakness Name', poam_field('weakness_name'), 24),
+            Column('Controls', poam_field('controls'), 16),
+            Column('Description', lambda poam_smt: poam_smt.body, 60),
+            Column('Status', lambda poam_smt: poam_smt.status, 8),
+            Column('Risk Rating Original', poam_field('risk_rating_original'), 16),
+            Column('Risk Rating Adjusted', poam_field('risk_rating_adjusted'), 16),
+            Column('Weakness Detection Source', poam_field('weakness_detection_source'), 24),
+            Column('Weakness Source Identifier', poam_field('weakness_source_identifier'), 24),
+            Column('Remediation Plan', poam_field('remediation_plan'), 60),
+            Column('Milestones', poam_field('milestones'), 60),
+            Column('Milestone Changes', poam_field('milestone_changes'), 30),
+            Column('Scheduled Completion Date', poam_field('scheduled_completion_date'), 18),
+            Column('URL', poam_url, 60),
         ]
-
-        # create header row
-        column = 0
-        ord_zeroth_column = ord('A') - 1
-        csv_row = []
-
-        for poam_field in poam_fields:
-            column += 1
-            if format == 'xlsx':
-                c = ws.cell(row=1, column=column, value=poam_field['name'])
-                c.fill = PatternFill("solid", fgColor="5599FE")
-                c.font = Font(color="FFFFFF", bold=True)
-                c.border = Border(left=Side(border_style="thin", color="444444"),
-                                  right=Side(border_style="thin", color="444444"),
-                                  bottom=Side(border_style="thin", color="444444"),
-                                  outline=Side(border_style="thin", color="444444"))
-                ws.column_dimensions[chr(ord_zeroth_column + column)].width = poam_field['width']
-            else:
-                csv_row.append(poam_field['name'])
-        # Add column for URL
-        if format == 'xlsx':
-            c = ws.cell(row=1, column=column, value="URL")
-            c.fill = PatternFill("solid", fgColor="5599FE")
-            c.font = Font(color="FFFFFF", bold=True)
-            c.border = Border(left=Side(border_style="thin", color="444444"),
-                              right=Side(border_style="thin", color="444444"),
-                              bottom=Side(border_style="thin", color="444444"),
-                              outline=Side(border_style="thin", color="444444"))
-            ws.column_dimensions[chr(ord_zeroth_column + column)].width = 60
-        else:
-            csv_row.append('URL')
-
-        if format != 'xlsx':
-            csv_writer.writerow(csv_row)
+        for column in poam_columns:
+            column.style = cell_style
 
         # Retrieve POA&Ms and create POA&M rows
-        poam_smts = system.root_element.statements_consumed.filter(statement_type="POAM").order_by('id')
-        poam_smts_by_sid = {}
-        row = 1
-        for poam_smt in poam_smts:
-            csv_row = []
-            row += 1
-
-            # Loop through fields
-            column = 0
-            for poam_field in poam_fields:
-                column += 1
-                if format == 'xlsx':
-                    if poam_field['var_name'] in ['body', 'status']:
-                        c = ws.cell(row=row, column=column, value=getattr(poam_smt, poam_field['var_name']))
-                    else:
-                        if poam_field['var_name'] == 'poam_id':
-                            c = ws.cell(row=row, column=column,
-                                        value="V-{}".format(getattr(poam_smt.poam, poam_field['var_name'])))
-                        else:
-                            c = ws.cell(row=row, column=column, value=getattr(poam_smt.poam, poam_field['var_name']))
-                    c.fill = PatternFill("solid", fgColor="FFFFFF")
-                    c.alignment = Alignment(vertical='top', horizontal='left', wrapText=True)
-                    c.border = Border(right=Side(border_style="thin", color="444444"),
-                                      bottom=Side(border_style="thin", color="444444"),
-                                      outline=Side(border_style="thin", color="444444"))
-                else:
-                    if poam_field['var_name'] in ['body', 'status']:
-                        csv_row.append(getattr(poam_smt, poam_field['var_name']))
-                    else:
-                        if poam_field['var_name'] == 'poam_id':
-                            csv_row.append("V-{}".format(getattr(poam_smt.poam, poam_field['var_name'])))
-                        else:
-                            csv_row.append(getattr(poam_smt.poam, poam_field['var_name']))
-
-            # Add URL column
-            poam_url = settings.SITE_ROOT_URL + "/systems/{}/poams/{}/edit".format(system_id, poam_smt.id)
-            if format == 'xlsx':
-                c = ws.cell(row=row, column=column, value=poam_url)
-                c.fill = PatternFill("solid", fgColor="FFFFFF")
-                c.alignment = Alignment(vertical='top', horizontal='left', wrapText=True)
-                c.border = Border(right=Side(border_style="thin", color="444444"),
-                                  bottom=Side(border_style="thin", color="444444"),
-                                  outline=Side(border_style="thin", color="444444"))
-            else:
-                csv_row.append(poam_url)
-
-            if format != 'xlsx':
-                csv_writer.writerow(csv_row)
-
-        if format == 'xlsx':
-            with NamedTemporaryFile() as tmp:
-                wb.save(tmp.name)
-                tmp.seek(0)
-                stream = tmp.read()
-                blob = stream
-        else:
-            blob = csv_buffer.getvalue()
-            csv_buffer.close()
+        poam_smts = system.root_element.statements_consumed.filter(statement_type="POAM").select_related('poam').order_by('id')
+        rows = get_rows(poam_columns, poam_smts.iterator(chunk_size=500))
 
         # Determine filename based on system name
         system_name = system.root_element.name.replace(" ", "_") + "_" + system_id
         filename = "{}_poam_export-{}.{}".format(system_name, datetime.now().strftime("%Y-%m-%d-%H-%M"), format)
         mime_type = "application/octet-stream"
 
-        resp = HttpResponse(blob, mime_type)
-        resp['Content-Disposition'] = 'inline; filename=' + filename
-        return resp
+        if format == 'xlsx':
+            return xlsx_response(filename, poam_columns, rows, title="POA&Ms", content_type=mime_type, disposition='inline')
+        return csv_response(filename, poam_columns, rows, content_type=mime_type, disposition='inline')
     else:
         # User does not have permission to this system
         raise Http404
@@ -7,7 +7,7 @@ from jsonfield import JSONField
 
 from .models import \
 	AppSource, AppVersion, Module, ModuleQuestion, ModuleAsset, \
-	Task, TaskAnswer, TaskAnswerHistory, \
+	Task, TaskStateCacheEntry, DocumentExportJob, TaskAnswer, TaskAnswerHistory, \
 	InstrumentationEvent, AppInput
 
 class AppSourceSpecWidget(forms.Widget):
@@ -292,6 +292,21 @@ class TaskAdmin(admin.ModelAdmin):
     def organization_and_project(self, obj):
         return obj.project.organization_and_title()
 
+class TaskStateCacheEntryAdmin(admin.ModelAdmin):
+    list_display = ('id', 'task', 'key', 'version', 'size', 'updated')
+    raw_id_fields = ('task',)
+    readonly_fields = ('task', 'key', 'version', 'size', 'updated')
+    search_fields = ('task__project__organization__name', 'key')
+    formfield_overrides = {
+        JSONField: {'widget': JSONEditorWidget(attrs={'style': 'height: 20em; width: 650px; margin-left: 160px;'})},
+    }
+
+class DocumentExportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'task', 'document_id', 'download_format', 'status', 'created', 'finished_at')
+    list_filter = ('status', 'download_format')
+    raw_id_fields = ('task', 'requested_by')
+    readonly_fields = ('task', 'document_id', 'download_format', 'answers_version', 'requested_by', 'created', 'finished_at')
+
 class TaskAnswerAdmin(admin.ModelAdmin):
     list_display = ('id', 'question', 'task', '_project', 'created')
     raw_id_fields = ('task',)
@@ -340,6 +355,8 @@ admin.site.register(Module, ModuleAdmin)
 admin.site.register(ModuleQuestion, ModuleQuestionAdmin)
 admin.site.register(ModuleAsset, ModuleAssetAdmin)
 admin.site.register(Task, TaskAdmin)
+admin.site.register(TaskStateCacheEntry, TaskStateCacheEntryAdmin)
+admin.site.register(DocumentExportJob, DocumentExportJobAdmin)
 admin.site.register(TaskAnswer, TaskAnswerAdmin)
 admin.site.register(TaskAnswerHistory, TaskAnswerHistoryAdmin)
 admin.site.register(InstrumentationEvent, InstrumentationEventAdmin)
@@ -18,6 +18,7 @@ from .models import AppSource, AppVersion, AppInput, ModuleAsset, \
                     Module, ModuleQuestion, Task, \
                     extract_catalog_metadata
 
+from .module_logic import invalidate_module_plan
 from .validate_module_specification import \
     validate_module, \
     ValidationError as ModuleValidationError
@@ -259,6 +260,9 @@ def update_module(m, spec, log_status):
             except ProtectedError:
                 raise IncompatibleUpdate("Module {} cannot be updated because question {}, which has been removed, has already been answered.".format(m.module_name, q.key))
 
+    # The Module's compiled plan is now out of date.
+    invalidate_module_plan(m)
+
     # If we're updating a Module in-place, clear out any cached state on its Tasks.
     for t in Task.objects.filter(module=m):
         t.on_answer_changed()
@@ -280,7 +284,8 @@ def update_question(m, definition_order, spec, log_status):
         defaults=field_values)
 
     if isnew:
-        pass # print("Added", repr(q))
+        # print("Added", repr(q))
+        invalidate_module_plan(m)
     else:
         # Don't need to update the database (and we can avoid
         # bumping the .updated date) if the question's specification
@@ -290,6 +295,7 @@ def update_question(m, definition_order, spec, log_status):
             for k, v in field_values.items():
                 setattr(q, k, v)
             q.save(update_fields=field_values.keys())
+            invalidate_module_plan(m)
 
     return q
 
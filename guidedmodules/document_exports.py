@@ -0,0 +1,117 @@
+# Background conversion of output documents to PDF, DOCX, and other formats
+# that require an external program (wkhtmltopdf, pandoc). Conversions are
+# run as DocumentExportJobs on a small pool of worker threads so that slow
+# conversions don't tie up web requests.
+
+import hashlib
+import os
+import os.path
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+
+from structlog import get_logger
+
+logger = get_logger()
+
+# Output formats that are converted in the background.
+BACKGROUND_EXPORT_FORMATS = ("pdf", "docx", "odt")
+
+executor = None
+executor_lock = threading.Lock()
+
+def get_executor():
+    # Create the worker pool on first use so that processes that never
+    # export a document (e.g. management commands) don't start threads.
+    global executor
+    with executor_lock:
+        if executor is None:
+            executor = ThreadPoolExecutor(max_workers=settings.GR_EXPORT_WORKERS,
+                                          thread_name_prefix="document-export")
+        return executor
+
+def submit_job(job_id):
+    # Run the job on the worker pool, or in this thread if the pool is
+    # disabled.
+    if settings.GR_EXPORT_WORKERS <= 0:
+        run_job(job_id, close_connection=False)
+        return
+    get_executor().submit(run_job, job_id)
+
+def run_job(job_id, close_connection=True):
+    from .models import DocumentExportJob
+    try:
+        job = DocumentExportJob.objects.filter(id=job_id).first()
+        if job is not None:
+            job.run()
+    except Exception as e:
+        logger.error(event="document_export_job", msg="Unhandled error in document export job {}: {}".format(job_id, e))
+    finally:
+        # Worker threads get their own database connection. Close it
+        # so connections aren't leaked when the pool's threads exit.
+        if close_connection:
+            connection.close()
+
+# How long a task's pending prerender blocks new ones, in case a worker
+# exits without clearing it.
+PRERENDER_PENDING_SECONDS = 10 * 60
+
+def get_prerender_cache_key(task_id):
+    return "prerender_documents_{}".format(task_id)
+
+def submit_prerender(task_id):
+    # Render a Task's output documents the way downloads use them (HTML
+    # with data: URLs, which PDF and DOCX are converted from) on the worker
+    # pool, so that later downloads find them in the Task's cached state.
+    # Skipped if the pool is disabled, since rendering in the requesting
+    # thread would only slow down the request. Every view of a finished task
+    # asks for this, so a task has at most one pending prerender.
+    if settings.GR_EXPORT_WORKERS <= 0:
+        return
+    if not cache.add(get_prerender_cache_key(task_id), True, PRERENDER_PENDING_SECONDS):
+        return
+    get_executor().submit(prerender_documents, task_id)
+
+def prerender_documents(task_id, close_connection=True):
+    from .models import Task
+    try:
+        task = Task.objects.filter(id=task_id).first()
+        if task is not None:
+            task.prerender_output_documents(("html",), use_data_urls=True)
+    except Exception as e:
+        logger.error(event="prerender_output_documents", msg="Unhandled error rendering documents of task {}: {}".format(task_id, e))
+    finally:
+        cache.delete(get_prerender_cache_key(task_id))
+        if close_connection:
+            connection.close()
+
+def get_reference_document_path(template):
+    # Return a filesystem path to the reference document used by pandoc.
+    # template is either a path (str) or a FieldFile of a ProjectAsset.
+    # Asset files live in database storage, so rather than writing them to a
+    # new temporary file on every export, keep one copy on disk per distinct
+    # content hash.
+    if isinstance(template, str):
+        return template
+
+    content_hash = getattr(template.instance, "content_hash", None)
+    if not content_hash:
+        template.open("rb")
+        content_hash = hashlib.sha256(template.read()).hexdigest()
+
+    ext = os.path.splitext(template.name)[1] or ".docx"
+    path = os.path.join(settings.GR_EXPORT_CACHE_DIR, "reference-" + content_hash + ext)
+    if not os.path.exists(path):
+        os.makedirs(settings.GR_EXPORT_CACHE_DIR, exist_ok=True)
+        template.open("rb")
+        content = template.read()
+        # Write to a temporary name and rename so that concurrent exports
+        # never see a partially-written file.
+        tmp_path = "{}.{}.{}.tmp".format(path, os.getpid(), threading.get_ident())
+        with open(tmp_path, "wb") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    return path
@@ -436,7 +436,9 @@ class Command(BaseCommand):
         self.generate_task_outputs(project.root_task, outdir)
 
     def generate_task_outputs(self, task, path):
-        # Generate this task's output documents.
+        # Generate this task's output documents. Render them concurrently
+        # first so that the downloads below are cache hits.
+        task.prerender_output_documents(("html", "markdown"), use_data_urls=True)
         for i, doc in enumerate(task.render_output_documents()):
             self.save_output_document(task, i, doc, path)
 
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from guidedmodules.models import TaskAnswer
+
+class Command(BaseCommand):
+    help = 'Recomputes the current answer pointer of every TaskAnswer from its answer history.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--task', type=int, action='append', help='Only update the answers of the Task with this ID. May be given more than once.')
+
+    def handle(self, *args, **options):
+        taskanswers = TaskAnswer.objects.all()
+        if options['task']:
+            taskanswers = taskanswers.filter(task_id__in=options['task'])
+        count = TaskAnswer.update_current_answers(taskanswers)
+        print("Updated {} TaskAnswers.".format(count))
@@ -0,0 +1,36 @@
+# Generated by Django 3.2.19 on 2026-10-18 20:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def clear_cached_state(apps, schema_editor):
+    # Cached values computed before dependencies were recorded would
+    # never be invalidated, so clear them all.
+    Task = apps.get_model('guidedmodules', 'Task')
+    Task.objects.update(cached_state=None)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guidedmodules', '0061_auto_20220101_0405'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TaskStateDependency',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text='The cached_state key of the value.', max_length=128)),
+                ('question_key', models.CharField(blank=True, help_text="The key of the question whose answer was read, or empty if the value depends on all of the source Task's answers.", max_length=100)),
+                ('source_task', models.ForeignKey(help_text='The Task whose answers were read when computing the value.', on_delete=django.db.models.deletion.CASCADE, related_name='state_dependents', to='guidedmodules.task')),
+                ('task', models.ForeignKey(help_text='The Task whose cached state holds a value with this dependency.', on_delete=django.db.models.deletion.CASCADE, related_name='state_dependencies', to='guidedmodules.task')),
+            ],
+            options={
+                'unique_together': {('task', 'key', 'source_task', 'question_key')},
+                'index_together': {('source_task', 'question_key')},
+            },
+        ),
+        migrations.RunPython(clear_cached_state, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 3.2.19 on 2026-10-18 20:43
+
+from django.db import migrations, models
+import django.db.models.deletion
+import jsonfield.fields
+
+
+def delete_dependencies(apps, schema_editor):
+    # The values that the recorded dependencies belong to are in
+    # the cached_state field being removed.
+    TaskStateDependency = apps.get_model('guidedmodules', 'TaskStateDependency')
+    TaskStateDependency.objects.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guidedmodules', '0062_taskstatedependency'),
+    ]
+
+    operations = [
+        migrations.RunPython(delete_dependencies, migrations.RunPython.noop),
+        migrations.RemoveField(
+            model_name='task',
+            name='cached_state',
+        ),
+        migrations.AlterField(
+            model_name='taskstatedependency',
+            name='key',
+            field=models.CharField(help_text='The key of the cached value, see TaskStateCacheEntry.', max_length=128),
+        ),
+        migrations.CreateModel(
+            name='TaskStateCacheEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(help_text="The key of the cached value, e.g. 'title' or 'is_finished'.", max_length=128)),
+                ('version', models.PositiveIntegerField(help_text='The Task.STATE_CACHE_VERSION that the value was computed with.')),
+                ('value', jsonfield.fields.JSONField(blank=True, help_text='The cached value.')),
+                ('size', models.PositiveIntegerField(help_text='The size of the cached value in bytes, when serialized.')),
+                ('updated', models.DateTimeField(auto_now=True, help_text='When the value was computed.')),
+                ('task', models.ForeignKey(help_text='The Task that this cached value was computed for.', on_delete=django.db.models.deletion.CASCADE, related_name='state_cache', to='guidedmodules.task')),
+            ],
+            options={
+                'unique_together': {('task', 'key')},
+            },
+        ),
+    ]
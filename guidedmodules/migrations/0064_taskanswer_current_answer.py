@@ -0,0 +1,43 @@
+# Generated by Django 3.2.19 on 2026-10-18 20:48
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models.functions import Coalesce
+
+
+def backfill_current_answers(apps, schema_editor):
+    # Same as TaskAnswer.update_current_answers(), which is also available
+    # as the backfill_current_answers management command.
+    TaskAnswer = apps.get_model('guidedmodules', 'TaskAnswer')
+    TaskAnswerHistory = apps.get_model('guidedmodules', 'TaskAnswerHistory')
+    latest = TaskAnswerHistory.objects \
+        .filter(taskanswer=models.OuterRef('pk')) \
+        .order_by('-id')
+    TaskAnswer.objects.update(
+        current_answer=models.Subquery(latest.values('id')[:1]),
+        current_answer_cleared=Coalesce(models.Subquery(latest.values('cleared')[:1]), models.Value(False)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('guidedmodules', '0063_taskstatecacheentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='taskanswer',
+            name='current_answer',
+            field=models.ForeignKey(blank=True, help_text='The most recent TaskAnswerHistory of this TaskAnswer, i.e. its current answer, or null if it has no history.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='guidedmodules.taskanswerhistory'),
+        ),
+        migrations.AddField(
+            model_name='taskanswer',
+            name='current_answer_cleared',
+            field=models.BooleanField(default=False, help_text="A copy of the current answer's cleared flag."),
+        ),
+        migrations.AlterIndexTogether(
+            name='taskanswer',
+            index_together={('task', 'current_answer_cleared')},
+        ),
+        migrations.RunPython(backfill_current_answers, migrations.RunPython.noop),
+    ]
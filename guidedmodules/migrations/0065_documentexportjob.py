@@ -0,0 +1,38 @@
+# Generated by Django 3.2.19 on 2026-10-18 20:55
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('guidedmodules', '0064_taskanswer_current_answer'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DocumentExportJob',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('updated', models.DateTimeField(auto_now=True, db_index=True, null=True)),
+                ('document_id', models.CharField(help_text='The id of the output document.', max_length=256)),
+                ('download_format', models.CharField(help_text='The format the document is being exported to.', max_length=32)),
+                ('answers_version', models.CharField(help_text='The Task.get_answers_version() of the project when the job was queued.', max_length=64)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('finished', 'Finished'), ('failed', 'Failed')], db_index=True, default='queued', max_length=16)),
+                ('file', models.FileField(blank=True, help_text='The exported document.', null=True, upload_to='guidedmodules/document-exports')),
+                ('filename', models.CharField(blank=True, help_text='The suggested filename of the exported document.', max_length=256)),
+                ('mime_type', models.CharField(blank=True, help_text='The MIME type of the exported document.', max_length=128)),
+                ('error', models.TextField(blank=True, help_text='The error message if the export failed.')),
+                ('finished_at', models.DateTimeField(blank=True, help_text='When the export finished or failed.', null=True)),
+                ('requested_by', models.ForeignKey(blank=True, help_text='The user who first requested the export.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('task', models.ForeignKey(help_text='The Task whose output document is being exported.', on_delete=django.db.models.deletion.CASCADE, related_name='export_jobs', to='guidedmodules.task')),
+            ],
+            options={
+                'unique_together': {('task', 'document_id', 'download_format', 'answers_version')},
+            },
+        ),
+    ]
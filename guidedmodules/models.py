@@ -7,6 +7,7 @@ from django.utils.functional import cached_property
 from structlog import get_logger
 
 from django.db import models, transaction
+from django.db.models.functions import Coalesce
 from django.utils import timezone
 from django.conf import settings
 
@@ -14,11 +15,14 @@ from jsonfield import JSONField
 from copy import deepcopy
 from collections import OrderedDict
 import uuid
+import datetime
+import threading
 
 from api.base.models import BaseModel
 from siteapp.enums.assets import AssetTypeEnum
 from guidedmodules.enums.inputs import InputTypeEnum
-from .module_logic import ModuleAnswers, render_content
+from .module_logic import ModuleAnswers, render_content, render_output_documents_concurrently, track_task_dependencies, \
+    is_tracking_task_dependencies, record_task_dependency, record_task_dependencies
 from .answer_validation import validator
 from siteapp.models import User, Organization, Project, ProjectMembership
 from guardian.shortcuts import (assign_perm, get_objects_for_user,
@@ -652,8 +656,6 @@ class Task(BaseModel):
     notes = models.TextField(blank=True, help_text="Notes set by the user about why they are completing this task.")
     deleted_at = models.DateTimeField(blank=True, null=True, db_index=True,
                                       help_text="If 'deleted' by a user, the date & time the Task was deleted.")
-    cached_state = JSONField(blank=True, default=None,
-                             help_text="Cached value storing whether the Task is finished, its computed title, and other state that depends on question answers.")
     extra = JSONField(blank=True, help_text="Additional information stored with this object.")
     invitation_history = models.ManyToManyField('siteapp.Invitation', blank=True,
                                                 help_text="The history of accepted invitations that had this Task as a target.")
@@ -735,7 +737,7 @@ class Task(BaseModel):
             return "/error/image/asset_path[" + asset_path + "]/path-is-not-an-asset."
         with self.module.app.get_asset(asset_path) as f:
             try:
-                return image_to_dataurl(f, max_image_size)
+                return image_to_dataurl(f, max_image_size, content_hash=self.module.app.asset_paths[asset_path])
             except:
                 # image processing error
                 print("ERROR: '" + "{}".format(
@@ -749,63 +751,50 @@ class Task(BaseModel):
         # Efficiently get the current answer to every question of each of the tasks.
         #
         # Since we track the history of answers to each question, we need to get the most
-        # recent answer for each question. It's fastest if we pre-load the complete history
-        # of every question rather than making a separate database call for each question
-        # to find its most recent answer. See TaskAnswer.get_current_answer().
+        # recent answer for each question. Only the most recent TaskAnswerHistory of
+        # each TaskAnswer is fetched, by joining on TaskAnswer.current_answer, so that
+        # the cost does not grow with the length of the history.
         #
         # Return a generator that yields tuples of (Task, ModuleQuestion, TaskAnswerHistory).
         # Among tuples for a particular Task, the tuples are in order of ModuleQuestion.definition_order.
+        tasks = list(tasks)
+
+        # Batch load the current answers of the tasks. If the most recent answer is
+        # marked as cleared, then treat as if it had not been there at all.
+        current_answers = { }
+        for taskanswer in TaskAnswer.objects \
+                .select_related('question', 'current_answer') \
+                .filter(task__in=tasks, current_answer__isnull=False, current_answer_cleared=False):
+            ansh = taskanswer.current_answer
+            ansh.taskanswer = taskanswer
+            current_answers[(taskanswer.task_id, taskanswer.question_id)] = ansh
+
+        # Batch load all of the ModuleQuestions, grouped by Module.
+        questions = { }
+        for question in ModuleQuestion.objects.prefetch_related('answer_type_module__questions').select_related('module') \
+            .filter(module__in={task.module_id for task in tasks}) \
+            .order_by("definition_order"):
+            questions.setdefault(question.module_id, []).append(question)
 
-        # Batch load all of the current answers of the tasks.
-        current_answers = {}
-        history = TaskAnswerHistory.objects \
-            .select_related('taskanswer', 'taskanswer__question') \
-            .filter(taskanswer__task__in=tasks) \
-            .order_by('-id')
-
-        tasks_ = {task.id: task for task in
-                  Task.objects.select_related('module', 'project').filter(
-                      id__in=history.values_list("taskanswer__task_id", flat=True))}
-        questions = {question.id: question for question in
-                     ModuleQuestion.objects.select_related('module').filter(
-                         id__in=history.values_list('taskanswer__question_id', flat=True))}
-
-        for ansh in history:
-            current_answers.setdefault(
-                (tasks_.get(ansh.taskanswer.task_id), questions.get(ansh.taskanswer.question_id)), ansh)
-
-        # Batch load all of the ModuleQuestions.
-        questions = ModuleQuestion.objects.prefetch_related('answer_type_module__questions').select_related('module') \
-            .filter(module__in={task.module for task in tasks}) \
-            .order_by("definition_order")
         # Iterate over the tasks and their questions in order...
         for task in tasks:
-            for question in questions:
-                # Skip if this question is not for this task.
-                if question.module != task.module: continue
-
-                # Get the latest TaskAnswerHistory instance, if there is any.
-
-                answer = current_answers.get((task, question), None)
-
-                # If the answer is marked as cleared, then treat as if it had
-                # not been there at all.
-                if answer and answer.cleared:
-                    answer = None
-
-                # Yield.
-                yield (task, question, answer)
+            for question in questions.get(task.module_id, []):
+                # Yield with the latest TaskAnswerHistory instance, if there is any.
+                yield (task, question, current_answers.get((task.id, question.id)))
 
     def get_current_answer_records(self):
         for task, question, answer in \
                 Task.get_all_current_answer_records([self]):
             yield (question, answer)
 
-    def get_answers(self):
-        # Return a ModuleAnswers instance that wraps this Task and its Pythonic answer values.
-        # The dict of answers is ordered to preserve the question definition order.
-        answertuples = OrderedDict()
-        for q, a in self.get_current_answer_records():
+    @staticmethod
+    def get_all_answers(tasks):
+        # Return a dict mapping the ID of each of the tasks to a ModuleAnswers instance
+        # that wraps the Task and its Pythonic answer values, loading the answers of
+        # all of the tasks at once. The dicts of answers are ordered to preserve the
+        # question definition order.
+        answertuples = { task.id: OrderedDict() for task in tasks }
+        for task, q, a in Task.get_all_current_answer_records(tasks):
             # Get the value of that answer.
             if a is not None:
                 is_answered = True
@@ -813,8 +802,24 @@ class Task(BaseModel):
             else:
                 is_answered = False
                 value = None
-            answertuples[q.key] = (q, is_answered, a, value)
-        return ModuleAnswers(self.module, self, answertuples)
+            answertuples[task.id][q.key] = (q, is_answered, a, value)
+        return { task.id: ModuleAnswers(task.module, task, answertuples[task.id]) for task in tasks }
+
+    def get_answers(self):
+        # Return a ModuleAnswers instance that wraps this Task and its Pythonic answer values.
+        # Within Task.load_dashboard_state, the answers were already loaded.
+        if getattr(self, "_prefetched_answers", None) is not None:
+            return self._prefetched_answers
+        return Task.get_all_answers([self])[self.id]
+
+    def _get_answers_with_extended_info(self):
+        # Within Task.load_dashboard_state, impute answers once for all of
+        # the values that are computed from them.
+        if getattr(self, "_prefetched_answers", None) is not None:
+            if getattr(self, "_prefetched_extended_answers", None) is None:
+                self._prefetched_extended_answers = self._prefetched_answers.with_extended_info()
+            return self._prefetched_extended_answers
+        return self.get_answers().with_extended_info()
 
     def get_answer(self, question_key_path):
         """Return the answer from for a question from dotted task path"""
@@ -839,20 +844,91 @@ class Task(BaseModel):
     def can_transfer_owner(self):
         return not self.project.is_account_project
 
+    # The Task's computed state (whether it is finished, its computed title,
+    # and other state that depends on question answers) is cached in
+    # TaskStateCacheEntry records, one per key, so that values are read and
+    # written individually. Values loaded from the database are also kept
+    # on the Task instance.
+
+    # Bump when the format of cached values changes. Entries stored with
+    # another version are treated as cache misses.
+    STATE_CACHE_VERSION = 1
+
+    @property
+    def _loaded_state(self):
+        if "_loaded_state_" not in self.__dict__:
+            self._loaded_state_ = {}
+        return self._loaded_state_
+
+    @property
+    def cached_state(self):
+        # Return all of the cached values of this Task as a dict, or None
+        # if nothing is cached.
+        Task.load_cached_state([self])
+        return dict(self._loaded_state) or None
+
+    @staticmethod
+    def load_cached_state(tasks, keys=None):
+        # Load the cached values of many Tasks at once, e.g. for listing
+        # pages that show the progress of many Tasks, so that reading them
+        # with _get_cached_state does not need a query per Task. If keys is
+        # given, only load those values. Tasks whose entries were prefetched
+        # (prefetch_related("state_cache")) are loaded from those.
+        tasks = list(tasks)
+        values = {}
+        unfetched_tasks = []
+        for task in tasks:
+            prefetched = getattr(task, "_prefetched_objects_cache", {}).get("state_cache")
+            if prefetched is None:
+                unfetched_tasks.append(task)
+                continue
+            for entry in prefetched:
+                if entry.version == Task.STATE_CACHE_VERSION and (keys is None or entry.key in keys):
+                    values.setdefault(task.id, {})[entry.key] = entry.value
+        if unfetched_tasks:
+            entries = TaskStateCacheEntry.objects \
+                .filter(task__in=unfetched_tasks, version=Task.STATE_CACHE_VERSION)
+            if keys is not None:
+                entries = entries.filter(key__in=keys)
+            for task_id, key, value in entries.values_list("task_id", "key", "value"):
+                values.setdefault(task_id, {})[key] = value
+        for task in tasks:
+            task._loaded_state.update(values.get(task.id, {}))
+
     def _get_cached_state(self, key, refresh_func):
-        # Initialize the cached_state field if it is null.
-        if not isinstance(self.cached_state, dict):
-            self.cached_state = {}
+        # Return a cached value, fetching it from the database if
+        # it isn't loaded on this instance yet.
+        if key not in self._loaded_state:
+            entry = TaskStateCacheEntry.objects \
+                .filter(task=self, key=key, version=Task.STATE_CACHE_VERSION) \
+                .only("value").first()
+            if entry is not None:
+                self._loaded_state[key] = entry.value
 
         # Handle a cache miss --- call refresh_func() and
-        # then save it to cached_state (and save to the db).
-
-        if key not in self.cached_state:
-            self.cached_state[key] = refresh_func()
-            self.save(update_fields=["cached_state"])
+        # then save it to the cache (and save to the db).
+        # Record which Tasks and questions the value read so
+        # that it is only invalidated when one of those answers
+        # changes. See Task.clear_state.
+
+        if key not in self._loaded_state:
+            with track_task_dependencies() as dependencies:
+                record_task_dependency(self)
+                value = refresh_func()
+            self._loaded_state[key] = value
+            TaskStateCacheEntry.set_value(self, key, value)
+            TaskStateDependency.set_dependencies(self, key, dependencies)
+
+        # On a cache hit while another cached value is being
+        # computed, the other value inherits this value's
+        # dependencies.
+        elif is_tracking_task_dependencies():
+            record_task_dependencies(
+                TaskStateDependency.objects.filter(task=self, key=key)
+                .values_list("source_task_id", "question_key"))
 
         # Return cached value.
-        return self.cached_state[key]
+        return self._loaded_state[key]
 
     def is_started(self):
         return self.answers.exists()
@@ -864,7 +940,7 @@ class Task(BaseModel):
             # finished.
             try:
                 # Fetch all questions and run impute conditions
-                answers = self.get_answers().with_extended_info()
+                answers = self._get_answers_with_extended_info()
             except Exception:
                 # If there is an error evaluating imputed conditions,
                 # just say the task is unfinished.
@@ -897,7 +973,7 @@ class Task(BaseModel):
             # and the total number of questions. For module-type questions
             # that are answered, recursively add the questions of the inner module.
             try:
-                answers = self.get_answers().with_extended_info()
+                answers = self._get_answers_with_extended_info()
             except Exception:
                 # If there is an error evaluating imputed conditions,
                 # just say the task is empty.
@@ -922,54 +998,97 @@ class Task(BaseModel):
 
         return self._get_cached_state("progress_percent_tuple", compute_progress_percent)
 
+    @staticmethod
+    def load_dashboard_state(tasks, output_document_ids=()):
+        # Compute the state that project listing pages show for many Tasks
+        # together: the title, whether the Task is finished, its progress,
+        # and the text of the output documents with the given IDs. Values
+        # that are already cached are loaded in one query. The answers of
+        # the Tasks with missing values are loaded at once and imputed once
+        # per Task for all of its missing values. The values are stored in
+        # the Tasks' cached state, so later calls to title, is_finished,
+        # get_progress_percent_tuple and render_output_documents are hits,
+        # on this page load and on the next.
+        from django.db.models import prefetch_related_objects
+        from .module_logic import get_output_document_cache_key
+        tasks = [task for task in tasks if task is not None]
+        prefetch_related_objects(tasks, "module") # one Module instance (and module plan) per module
+
+        task_keys = { }
+        for task in tasks:
+            keys = ["is_finished", "progress_percent_tuple"]
+            if not task.title_override and "instance-name" in task.module.spec:
+                keys.append("title")
+            for index, document in enumerate(task.module.spec.get("output", [])):
+                if document.get("id") in output_document_ids:
+                    keys.append(get_output_document_cache_key(index, "text"))
+            task_keys[task.id] = keys
+        Task.load_cached_state(tasks, { key for keys in task_keys.values() for key in keys })
+
+        missing = [task for task in tasks
+                   if any(key not in task._loaded_state for key in task_keys[task.id])]
+        if not missing:
+            return
+        answers = Task.get_all_answers(missing)
+        for task in missing:
+            task._prefetched_answers = answers[task.id]
+            try:
+                task.title
+                task.is_finished()
+                task.get_progress_percent_tuple()
+                for document in task.render_output_documents():
+                    if document.get("id") in output_document_ids:
+                        document["text"]
+            finally:
+                task._prefetched_answers = None
+                task._prefetched_extended_answers = None
+
     # This method is called any time an answer to any of this Task's questions
     # is changed, or for questions that are answered by sub-tasks, and if any
-    # of their answers changed too, recursively.
-    def on_answer_changed(self):
-        Task.clear_state({self})
+    # of their answers changed too, recursively. question_keys, if given, are
+    # the keys of the questions whose answers changed.
+    def on_answer_changed(self, question_keys=None):
+        Task.clear_state({self}, question_keys=question_keys)
 
-    # Do the work of clearing the cached_state of a set of Tasks.
-    # * Clear the Tasks' cached_state field and bump their 'updated' time so
+    # Do the work of clearing the cached state of a set of Tasks.
+    # * Clear the Tasks' cached values and bump their 'updated' time so
     #   anyone waiting for changes to the tasks knows a change ocurred.
-    # * Do the same for any Tasks that these Tasks are a current answer of a question to.
-    # * Since templates can peek up to the project and see anything within it,
-    #   then any Task in the same project must also have their cache cleared.
-    #   TODO: It would be nice to know whether or not the cached_state is actually
-    #   based on project-level information because most Tasks might not peek
-    #   up and Tasks that don't do not need to have their cached_state cleared
-    #   in this case.
+    # * Clear the cached values of other Tasks that read the answers that
+    #   changed, and bump those Tasks' 'updated' time too. This includes
+    #   Tasks that these Tasks are a current answer of a question to and
+    #   Tasks whose templates peek up to the project or organization. The
+    #   reads are recorded when the values are computed (see
+    #   _get_cached_state), and since a value inherits the dependencies of
+    #   the cached values it reads, a single lookup finds every dependent
+    #   value.
+    # If question_keys is given, only values that read those questions of
+    # the Tasks (or that read all of their answers) are invalidated in
+    # other Tasks.
     @staticmethod
-    def clear_state(tasks):
-        tasks = set(tasks)
-        target_tasks = tasks
-        while target_tasks:
-            new_tasks = set()
-
-            # Add Tasks whose current answers include any of these Tasks. First
-            # find TaskAnswerHistory records that reference the tasks....
-            ans = TaskAnswerHistory.objects.filter(answered_by_task__in=target_tasks) \
-                .select_related("taskanswer__task")
-
-            # Then find the IDs of the *current* answers of any of those questions.
-            curans = list(TaskAnswer.objects \
-                          .filter(id__in={a.taskanswer.id for a in ans}) \
-                          .annotate(current_answer_id=models.Max('answer_history__id')) \
-                          .values_list('current_answer_id', flat=True))
-
-            # And filter so we only have current answers remaining.
-            ans = ans.filter(id__in=curans)
-
-            # Add Tasks in the same Project as any of the Tasks seen so far.
-            for task in Task.objects.filter(project__in={t.project_id for t in target_tasks}):
-                new_tasks.add(task)
-
-            new_tasks -= tasks
-            tasks |= new_tasks
-            target_tasks = new_tasks
-
-        # Clear cached_state
-        tasks_qs = Task.objects.filter(id__in={t.id for t in tasks})
-        tasks_qs.update(cached_state=None, updated=timezone.now())
+    def clear_state(tasks, question_keys=None):
+        tasks = list(tasks)
+        task_ids = {t.id for t in tasks}
+
+        dependencies = TaskStateDependency.objects.filter(source_task_id__in=task_ids)
+        if question_keys is not None:
+            dependencies = dependencies.filter(question_key__in=set(question_keys) | {""})
+        dependent_values = TaskStateCacheEntry.objects.filter(models.Exists(
+            dependencies.filter(task=models.OuterRef("task"), key=models.OuterRef("key"))))
+        task_ids |= set(dependent_values.values_list("task_id", flat=True))
+
+        # Delete the cached values, then the dependencies of values that are no
+        # longer cached.
+        TaskStateCacheEntry.objects.filter(task_id__in={t.id for t in tasks}).delete()
+        dependent_values.delete()
+        TaskStateDependency.objects.filter(task_id__in=task_ids) \
+            .filter(~models.Exists(TaskStateCacheEntry.objects.filter(
+                task=models.OuterRef("task"), key=models.OuterRef("key")))) \
+            .delete()
+        Task.objects.filter(id__in=task_ids).update(updated=timezone.now())
+
+        # Forget values loaded on the instances we were given.
+        for task in tasks:
+            task._loaded_state.clear()
 
     def get_status_display(self):
         # Is this task done?
@@ -1140,7 +1259,8 @@ class Task(BaseModel):
 
     # COMPUTED PROPERTIES
 
-    IS_COMPUTING_TITLE = False
+    # Per-thread flag, since output documents may be rendered concurrently.
+    COMPUTING_TITLE = threading.local()
 
     @property
     def title(self):
@@ -1154,27 +1274,21 @@ class Task(BaseModel):
             return self.module.spec["title"]
 
         # Render the instance-name template if its rendered value is not cached.
-        if self.cached_state is None:
-            self.cached_state = {}
-        if "title" not in self.cached_state:
-
-            if Task.IS_COMPUTING_TITLE:
+        def compute_title():
+            if getattr(Task.COMPUTING_TITLE, "active", False):
                 # Hopefully this never occurs, but rendering the instance-name
                 # template could end up causing the task's title to be computed.
                 raise RuntimeError("Infinite recursion!")
 
-            Task.IS_COMPUTING_TITLE = True
+            Task.COMPUTING_TITLE.active = True
             try:
-                title = self.render_simple_string(
+                return self.render_simple_string(
                     "instance-name", self.module.spec["title"],
                     is_computing_title=True).strip()
             finally:
-                Task.IS_COMPUTING_TITLE = False
-
-            self.cached_state["title"] = title
-            self.save(update_fields=["cached_state"])
+                Task.COMPUTING_TITLE.active = False
 
-        return self.cached_state["title"]
+        return self._get_cached_state("title", compute_title)
 
     def render_introduction(self):
         # Project tasks have an introduction field.
@@ -1211,9 +1325,56 @@ class Task(BaseModel):
 
     def render_output_documents(self, answers=None, use_data_urls=False):
         if answers is None:
-            answers = self.get_answers()
+            # Lazy-load the answers so that they aren't loaded if the
+            # documents are already cached.
+            answers = ModuleAnswers(self.module, self, None)
         return answers.render_output(use_data_urls=use_data_urls)
 
+    def prerender_output_documents(self, output_formats=("html",), answers=None, use_data_urls=False):
+        # Render the output documents in the given formats concurrently so that
+        # they are cached for later requests, and return them.
+        return render_output_documents_concurrently(
+            self.render_output_documents(answers=answers, use_data_urls=use_data_urls),
+            output_formats)
+
+    def get_answers_version(self):
+        # Return a string that changes whenever anything this Task's output
+        # documents read changes, so that exports made from it can be reused
+        # until then:
+        # * any answer in the project, since documents can read answers from
+        #   anywhere in it. TaskAnswerHistory ids only increase, so the latest
+        #   one identifies the state of the project's answers.
+        # * the module's spec, which holds the document templates.
+        # * the system's statements and selected controls, the catalogs and
+        #   the organization's control parameters.
+        # * the project's DOCX export template.
+        # Counts are included along with the latest updates so that deletions
+        # change the version too.
+        import hashlib
+        from controls.models import ElementControl, Statement, System
+        from controls.oscal import CatalogData
+        from siteapp.models import OrganizationalSetting, ProjectAsset
+        latest_and_count = dict(latest=models.Max("updated"), count=models.Count("id"))
+
+        latest_answer = TaskAnswerHistory.objects.filter(taskanswer__task__project=self.project_id)\
+            .aggregate(latest=models.Max("id"))["latest"]
+        inputs = [
+            latest_answer,
+            Module.objects.filter(id=self.module_id).values_list("updated", flat=True).first(),
+            CatalogData.objects.aggregate(latest=models.Max("updated"))["latest"],
+            OrganizationalSetting.objects.filter(organization__projects=self.project_id).aggregate(**latest_and_count),
+            ProjectAsset.objects.filter(project=self.project_id, asset_type=AssetTypeEnum.SSP_EXPORT.name, default=True)\
+                .values_list("content_hash", flat=True).first(),
+        ]
+        root_element_id = System.objects.filter(projects=self.project_id).values_list("root_element_id", flat=True).first()
+        if root_element_id is not None:
+            inputs += [
+                Statement.objects.filter(consumer_element=root_element_id).aggregate(**latest_and_count),
+                ElementControl.objects.filter(element=root_element_id).aggregate(**latest_and_count),
+            ]
+        digest = hashlib.sha256(repr(inputs).encode("utf8")).hexdigest()[:40]
+        return "{}.{}".format(self.module_id, digest)
+
     def download_output_document(self, document_id, download_format, answers=None):
         # Map output format to:
         # 1) pandoc format name
@@ -1338,14 +1499,11 @@ class Task(BaseModel):
             # odt and some other formats cannot pipe to stdout, so we always
             # generate a temporary file.
             import tempfile, os.path, subprocess  # nosec
+            from .document_exports import get_reference_document_path
+            template = get_reference_document_path(template)
             with tempfile.TemporaryDirectory() as tempdir:
                 # convert from HTML to something else, writing to a temporary file
                 outfn = os.path.join(tempdir, filename)
-                if not isinstance(template, str):
-                    template_path = os.path.join(tempdir, template.name.split('/')[-1])
-                    with open(template_path, 'wb+') as f:
-                        f.write(template.file.read())
-                    template = template_path
                 # Append '# nosec' to line below to tell Bandit to ignore the low risk problem
                 # with not specifying the entire path to pandoc.
 
@@ -1412,13 +1570,13 @@ class Task(BaseModel):
 
         # Optimize for the sub-task already existing. Query directly for
         # the most recent TaskAnswerHistory record.
-        ansh = TaskAnswerHistory.objects \
-            .filter(taskanswer__task=self, **{"taskanswer__question" + k: v for k, v in qfilter.items()}) \
-            .order_by('-id') \
+        ans = TaskAnswer.objects \
+            .select_related("question", "current_answer") \
+            .filter(task=self, current_answer__isnull=False, **{"question" + k: v for k, v in qfilter.items()}) \
             .first()
+        ansh = ans.current_answer if ans else None
         if ansh:
             # This question is answered.
-            ans = ansh.taskanswer
             q = ans.question
 
         else:
@@ -1467,22 +1625,24 @@ class Task(BaseModel):
             # Create a new TaskAnswerHistory instance. We never modify
             # existing instances!
             prev_ansh = ansh
-            ansh = TaskAnswerHistory.objects.create(
-                taskanswer=ans,
-                answered_by=user,
-                stored_value=None)
-
-            # For "module-set"-type questions, copy in the previous set
-            # of answers.
-            if prev_ansh:
-                for t in prev_ansh.answered_by_task.all():
-                    ansh.answered_by_task.add(t)
-
-            # Add the new task.
-            ansh.answered_by_task.add(task)
+            with transaction.atomic():
+                ansh = TaskAnswerHistory.objects.create(
+                    taskanswer=ans,
+                    answered_by=user,
+                    stored_value=None)
+
+                # For "module-set"-type questions, copy in the previous set
+                # of answers.
+                if prev_ansh:
+                    for t in prev_ansh.answered_by_task.all():
+                        ansh.answered_by_task.add(t)
+
+                # Add the new task.
+                ansh.answered_by_task.add(task)
+                ans.set_current_answer(ansh)
 
             # Mark that the Task has had an answer changed.
-            self.on_answer_changed()
+            self.on_answer_changed([q.key])
 
             return task
 
@@ -1727,6 +1887,216 @@ class Task(BaseModel):
         return did_update_any_questions
 
 
+class TaskStateCacheEntry(models.Model):
+    task = models.ForeignKey(Task, related_name="state_cache", on_delete=models.CASCADE,
+                             help_text="The Task that this cached value was computed for.")
+    key = models.CharField(max_length=128, help_text="The key of the cached value, e.g. 'title' or 'is_finished'.")
+    version = models.PositiveIntegerField(help_text="The Task.STATE_CACHE_VERSION that the value was computed with.")
+    value = JSONField(blank=True, help_text="The cached value.")
+    size = models.PositiveIntegerField(help_text="The size of the cached value in bytes, when serialized.")
+    updated = models.DateTimeField(auto_now=True, help_text="When the value was computed.")
+
+    class Meta:
+        unique_together = [('task', 'key')]
+
+    def __repr__(self):
+        # For debugging.
+        return "<TaskStateCacheEntry %s[%s] %d bytes>" % (self.task_id, self.key, self.size)
+
+    @staticmethod
+    def set_value(task, key, value):
+        import json
+        from django.core.serializers.json import DjangoJSONEncoder
+        from django.db import IntegrityError
+        size = len(json.dumps(value, cls=DjangoJSONEncoder).encode("utf8"))
+        try:
+            with transaction.atomic():
+                TaskStateCacheEntry.objects.update_or_create(
+                    task=task, key=key,
+                    defaults={ "version": Task.STATE_CACHE_VERSION, "value": value, "size": size })
+        except IntegrityError:
+            # Another process stored the value at the same time.
+            pass
+
+    @staticmethod
+    def get_total_size(tasks=None):
+        # Return the total size in bytes of the cached values, optionally
+        # just for the given Tasks.
+        entries = TaskStateCacheEntry.objects.all()
+        if tasks is not None:
+            entries = entries.filter(task__in=tasks)
+        return entries.aggregate(size=models.Sum("size"))["size"] or 0
+
+
+class TaskStateDependency(models.Model):
+    task = models.ForeignKey(Task, related_name="state_dependencies", on_delete=models.CASCADE,
+                             help_text="The Task whose cached state holds a value with this dependency.")
+    key = models.CharField(max_length=128, help_text="The key of the cached value, see TaskStateCacheEntry.")
+    source_task = models.ForeignKey(Task, related_name="state_dependents", on_delete=models.CASCADE,
+                                    help_text="The Task whose answers were read when computing the value.")
+    question_key = models.CharField(max_length=100, blank=True,
+                                    help_text="The key of the question whose answer was read, or empty if the value depends on all of the source Task's answers.")
+
+    class Meta:
+        unique_together = [('task', 'key', 'source_task', 'question_key')]
+        index_together = [('source_task', 'question_key')]
+
+    def __repr__(self):
+        # For debugging.
+        return "<TaskStateDependency %s[%s] <- %d.%s>" % (self.task_id, self.key, self.source_task_id, self.question_key or "*")
+
+    @staticmethod
+    def set_dependencies(task, key, dependencies):
+        # Replace the recorded dependencies of a cached value with the
+        # (task_id, question_key) pairs recorded while computing it.
+        TaskStateDependency.objects.filter(task=task, key=key).delete()
+        TaskStateDependency.objects.bulk_create([
+            TaskStateDependency(task=task, key=key, source_task_id=source_task_id, question_key=question_key)
+            for source_task_id, question_key in dependencies
+        ], ignore_conflicts=True)
+
+
+class DocumentExportJob(BaseModel):
+    # A request to convert an output document into a downloadable file,
+    # run in the background by guidedmodules.document_exports. Jobs are
+    # shared by all requests for the same document in the same format
+    # while the project's answers are unchanged.
+
+    STATUS_QUEUED = "queued"
+    STATUS_RUNNING = "running"
+    STATUS_FINISHED = "finished"
+    STATUS_FAILED = "failed"
+    STATUS_CHOICES = [
+        (STATUS_QUEUED, "Queued"),
+        (STATUS_RUNNING, "Running"),
+        (STATUS_FINISHED, "Finished"),
+        (STATUS_FAILED, "Failed"),
+    ]
+
+    # Jobs that were queued or running for longer than this were probably
+    # lost when a process exited, and are run again when re-requested.
+    STALE_AFTER = datetime.timedelta(minutes=10)
+
+    UPLOAD_TO = "guidedmodules/document-exports"
+
+    task = models.ForeignKey(Task, related_name="export_jobs", on_delete=models.CASCADE,
+                             help_text="The Task whose output document is being exported.")
+    document_id = models.CharField(max_length=256, help_text="The id of the output document.")
+    download_format = models.CharField(max_length=32, help_text="The format the document is being exported to.")
+    answers_version = models.CharField(max_length=64, help_text="The Task.get_answers_version() of the project when the job was queued.")
+    requested_by = models.ForeignKey(User, blank=True, null=True, related_name="+", on_delete=models.SET_NULL,
+                                     help_text="The user who first requested the export.")
+    status = models.CharField(max_length=16, choices=STATUS_CHOICES, default=STATUS_QUEUED, db_index=True)
+    file = models.FileField(upload_to=UPLOAD_TO, blank=True, null=True, help_text="The exported document.")
+    filename = models.CharField(max_length=256, blank=True, help_text="The suggested filename of the exported document.")
+    mime_type = models.CharField(max_length=128, blank=True, help_text="The MIME type of the exported document.")
+    error = models.TextField(blank=True, help_text="The error message if the export failed.")
+    finished_at = models.DateTimeField(blank=True, null=True, help_text="When the export finished or failed.")
+
+    class Meta:
+        unique_together = [('task', 'document_id', 'download_format', 'answers_version')]
+
+    def __repr__(self):
+        # For debugging.
+        return "<DocumentExportJob %s %s/%s %s>" % (self.id, self.document_id, self.download_format, self.status)
+
+    @staticmethod
+    def enqueue(task, document_id, download_format, user=None):
+        # Get the job for this document and the current state of the project's
+        # answers, starting it if it isn't already queued or finished.
+        from django.db import IntegrityError
+        from .document_exports import submit_job
+        key = {
+            "task": task,
+            "document_id": document_id,
+            "download_format": download_format,
+            "answers_version": task.get_answers_version(),
+        }
+        try:
+            with transaction.atomic():
+                job, is_new = DocumentExportJob.objects.get_or_create(**key, defaults={ "requested_by": user })
+        except IntegrityError:
+            # Another request created the job at the same time.
+            job, is_new = DocumentExportJob.objects.get(**key), False
+
+        if not is_new:
+            # Re-run failed jobs and jobs that were lost, but only if no
+            # other request has already restarted it.
+            retry = DocumentExportJob.objects.filter(id=job.id)\
+                .filter(models.Q(status=DocumentExportJob.STATUS_FAILED)
+                        | models.Q(status__in=(DocumentExportJob.STATUS_QUEUED, DocumentExportJob.STATUS_RUNNING),
+                                   updated__lt=timezone.now() - DocumentExportJob.STALE_AFTER))\
+                .update(status=DocumentExportJob.STATUS_QUEUED, error="", updated=timezone.now())
+            if not retry:
+                return job
+
+        # The workers use their own database connections, so they can only see
+        # the job once this request's transaction has committed. Outside of a
+        # transaction the job is submitted immediately.
+        transaction.on_commit(lambda: submit_job(job.id))
+        job.refresh_from_db()
+        return job
+
+    def run(self):
+        # Claim the job so that it is only run once even if it was submitted
+        # more than once.
+        if not DocumentExportJob.objects.filter(id=self.id, status=DocumentExportJob.STATUS_QUEUED)\
+                .update(status=DocumentExportJob.STATUS_RUNNING, updated=timezone.now()):
+            return
+        self.status = DocumentExportJob.STATUS_RUNNING
+
+        from django.core.files.base import ContentFile
+        try:
+            blob, filename, mime_type = self.task.download_output_document(self.document_id, self.download_format)
+            if isinstance(blob, str):
+                blob = blob.encode("utf8")
+        except Exception as e:
+            logger.error(event="document_export_job",
+                         object={"object": "task", "id": self.task_id},
+                         msg="Document export failed: {}".format(e))
+            self.status = DocumentExportJob.STATUS_FAILED
+            self.error = "Problem processing document request." if isinstance(e, ValueError) else "The document could not be generated."
+            self.finished_at = timezone.now()
+            self.save()
+            return
+
+        self.file.save(filename, ContentFile(blob), save=False)
+        self.filename = filename
+        self.mime_type = mime_type
+        self.status = DocumentExportJob.STATUS_FINISHED
+        self.finished_at = timezone.now()
+        self.save()
+
+        # Remove exports of this document made from older answers.
+        for job in DocumentExportJob.objects.filter(task=self.task_id, document_id=self.document_id,
+                                                    download_format=self.download_format,
+                                                    created__lt=self.created)\
+                                            .exclude(status__in=(DocumentExportJob.STATUS_QUEUED, DocumentExportJob.STATUS_RUNNING)):
+            job.delete()
+
+    def delete(self, *args, **kwargs):
+        if self.file:
+            self.file.delete(save=False)
+        return super().delete(*args, **kwargs)
+
+    def get_absolute_url(self):
+        from django.urls import reverse
+        return reverse("document_export_status", args=[self.id])
+
+    def get_download_url(self):
+        from django.urls import reverse
+        return reverse("download_document_export", args=[self.id])
+
+    def get_status_dict(self):
+        return {
+            "id": self.id,
+            "status": self.status,
+            "status_url": self.get_absolute_url(),
+            "download_url": self.get_download_url() if self.status == DocumentExportJob.STATUS_FINISHED else None,
+            "error": self.error or None,
+        }
+
+
 class TaskAnswer(BaseModel):
     task = models.ForeignKey(Task, on_delete=models.CASCADE, related_name="answers",
                              help_text="The Task that this TaskAnswer is a part of.")
@@ -1736,8 +2106,14 @@ class TaskAnswer(BaseModel):
     notes = models.TextField(blank=True, help_text="Notes entered by editors working on this question.")
     extra = JSONField(blank=True, help_text="Additional information stored with this object.")
 
+    current_answer = models.ForeignKey('TaskAnswerHistory', blank=True, null=True, related_name="+", on_delete=models.SET_NULL,
+                                       help_text="The most recent TaskAnswerHistory of this TaskAnswer, i.e. its current answer, or null if it has no history.")
+    current_answer_cleared = models.BooleanField(default=False,
+                                                 help_text="A copy of the current answer's cleared flag.")
+
     class Meta:
         unique_together = [('task', 'question')]
+        index_together = [('task', 'current_answer_cleared')]
 
     def __str__(self):
         # For the admin.
@@ -1752,17 +2128,44 @@ class TaskAnswer(BaseModel):
         return self.task.get_absolute_url_to_question(self.question)
 
     def get_current_answer(self):
-        # The current answer is the one with the highest primary key.
-        return self.answer_history \
+        # The current answer is the one with the highest primary key,
+        # which current_answer points to.
+        if self.current_answer_id is None:
+            return None
+        return TaskAnswerHistory.objects \
             .prefetch_related("answered_by_task__module__questions") \
-            .order_by('-id') \
+            .filter(id=self.current_answer_id) \
             .first()
 
     def has_answer(self):
-        ans = self.get_current_answer()
-        if ans and not ans.cleared:
-            return True
-        return False
+        return self.current_answer_id is not None and not self.current_answer_cleared
+
+    def set_current_answer(self, answer):
+        # Point current_answer at a newly created TaskAnswerHistory and kick
+        # the TaskAnswer's updated field. The update is a single statement
+        # that never moves the pointer back to an older record, so concurrent
+        # saves leave it at the most recent one.
+        TaskAnswer.objects \
+            .filter(id=self.id) \
+            .filter(models.Q(current_answer=None) | models.Q(current_answer_id__lt=answer.id)) \
+            .update(current_answer=answer, current_answer_cleared=answer.cleared, updated=timezone.now())
+        self.current_answer = answer
+        self.current_answer_cleared = answer.cleared
+
+    @staticmethod
+    def update_current_answers(taskanswers=None):
+        # Recompute current_answer and current_answer_cleared from the
+        # answer history, for databases that were populated without going
+        # through save_answer/clear_answer. Returns the number of TaskAnswers
+        # updated.
+        if taskanswers is None:
+            taskanswers = TaskAnswer.objects.all()
+        latest = TaskAnswerHistory.objects \
+            .filter(taskanswer=models.OuterRef('pk')) \
+            .order_by('-id')
+        return taskanswers.update(
+            current_answer=models.Subquery(latest.values('id')[:1]),
+            current_answer_cleared=Coalesce(models.Subquery(latest.values('cleared')[:1]), models.Value(False)))
 
     def get_history(self):
         from discussion.models import reldate
@@ -1843,18 +2246,19 @@ class TaskAnswer(BaseModel):
             # as cleared.
             return False
 
-        # Store a new TaskAnswerHistory record with the cleared flag set.
-        TaskAnswerHistory.objects.create(
-            taskanswer=self,
-            answered_by=user,
-            stored_value=None,
-            answered_by_file=None,
-            cleared=True)
-
-        # Kick the TaskAnswer's updated fields and the Task to mark that the
-        # answer has changed.
-        self.save(update_fields=[])
-        self.task.on_answer_changed()
+        # Store a new TaskAnswerHistory record with the cleared flag set
+        # and kick the TaskAnswer's updated fields.
+        with transaction.atomic():
+            answer = TaskAnswerHistory.objects.create(
+                taskanswer=self,
+                answered_by=user,
+                stored_value=None,
+                answered_by_file=None,
+                cleared=True)
+            self.set_current_answer(answer)
+
+        # Kick the Task to mark that the answer has changed.
+        self.task.on_answer_changed([self.question.key])
         return True
 
     def save_answer(self,
@@ -1896,22 +2300,22 @@ class TaskAnswer(BaseModel):
             return False
 
         # The answer is new or changing. Create a new record for it.
-        answer = TaskAnswerHistory.objects.create(
-            taskanswer=self,
-            answered_by=user,
-            answered_by_method=method,
-            stored_value=value,
-            stored_encoding=value_encoding,
-            answered_by_file=answered_by_file,
-            skipped_reason=skipped_reason,
-            unsure=unsure)
-        for t in answered_by_tasks:
-            answer.answered_by_task.add(t)
-
-        # Kick the Task and TaskAnswer's updated field and let the Task know that
-        # its answers have changed.
-        self.save(update_fields=[])
-        self.task.on_answer_changed()
+        with transaction.atomic():
+            answer = TaskAnswerHistory.objects.create(
+                taskanswer=self,
+                answered_by=user,
+                answered_by_method=method,
+                stored_value=value,
+                stored_encoding=value_encoding,
+                answered_by_file=answered_by_file,
+                skipped_reason=skipped_reason,
+                unsure=unsure)
+            for t in answered_by_tasks:
+                answer.answered_by_task.add(t)
+            self.set_current_answer(answer)
+
+        # Let the Task know that its answers have changed.
+        self.task.on_answer_changed([self.question.key])
 
         # Return True to indicate we saved something.
         return True
@@ -2076,7 +2480,7 @@ class TaskAnswerHistory(BaseModel):
 
     def is_latest(self):
         # Is this the most recent --- the current --- answer for a TaskAnswer.
-        return self.taskanswer.get_current_answer() == self
+        return self.taskanswer.current_answer_id == self.id
 
     def is_skipped(self):
         # A skipped question is one whose answer is None,
@@ -2469,15 +2873,30 @@ class InstrumentationEvent(BaseModel):
         ]
 
 
-def image_to_dataurl(f, size):
+def image_to_dataurl(f, size, content_hash=None):
     from PIL import Image
     from io import BytesIO
     import base64
+    import hashlib
+    from django.core.cache import cache
+
     if isinstance(f, Image.Image):
         # If a PIL.Image is passed in, then use it.
         im = f.copy()
     else:
         # Either a bytes stream (e.g. BytesIO) or a bytes string are passed in.
+        # Resizing and encoding the same image again is expensive, so cache the
+        # data URL by the hash of the image content, which the caller may
+        # already know (e.g. for ModuleAssets).
+        if content_hash is None:
+            if not isinstance(f, bytes):
+                f = f.read()
+            content_hash = hashlib.sha256(f).hexdigest()
+        cache_key = "image_dataurl_{}_{}".format(content_hash, size)
+        dataurl = cache.get(cache_key)
+        if dataurl is not None:
+            return dataurl
+
         # If a string, convert to a stream. Then load using PIL.Image.open.
         if isinstance(f, bytes):
             f = BytesIO(f)
@@ -2485,4 +2904,7 @@ def image_to_dataurl(f, size):
     im.thumbnail((size, size))
     buf = BytesIO()
     im.save(buf, "png")
-    return "data:image/png;base64," + base64.b64encode(buf.getvalue()).decode("ascii")
+    dataurl = "data:image/png;base64," + base64.b64encode(buf.getvalue()).decode("ascii")
+    if not isinstance(f, Image.Image):
+        cache.set(cache_key, dataurl, None)
+    return dataurl
@@ -12,12 +12,14 @@ from siteapp.settings import GOVREADY_URL
 
 def get_jinja2_template_vars(template):
     from jinja2 import meta, TemplateSyntaxError
-    env = SandboxedEnvironment()
-    try:
-        expr = env.parse(template)
-    except TemplateSyntaxError as e:
-        raise Exception("expression {} is invalid: {}".format(template, e))
-    return set(meta.find_undeclared_variables(expr))
+    def parse():
+        env = get_jinja2_environment()
+        try:
+            expr = env.parse(template)
+        except TemplateSyntaxError as e:
+            raise Exception("expression {} is invalid: {}".format(template, e))
+        return frozenset(meta.find_undeclared_variables(expr))
+    return set(template_cache.get(("vars", template_cache.hash(template)), parse))
 
 
 class Jinja2Environment(SandboxedEnvironment):
@@ -42,7 +44,87 @@ class Jinja2Environment(SandboxedEnvironment):
         # Call default operator logic.
         return SandboxedEnvironment.call_binop(self, context, operator, left, right)
 
-def walk_module_questions(module, callback):
+
+class CompiledTemplateCache:
+    """A size-bounded cache of compiled Jinja2 templates and expressions
+       (and other values derived only from template source) that evicts
+       the least recently used entries. Keys should include a hash of the
+       template source from hash()."""
+
+    def __init__(self, maxsize):
+        from collections import OrderedDict
+        import threading
+        self.maxsize = maxsize
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def hash(source):
+        import hashlib
+        return hashlib.sha1(source.encode("utf8")).hexdigest() # nosec - not used for security
+
+    def get(self, key, compile_func):
+        # Return the cached value, or call compile_func to create it. If
+        # compile_func raises an exception, nothing is cached.
+        with self.lock:
+            if key in self.entries:
+                self.hits += 1
+                self.entries.move_to_end(key)
+                return self.entries[key]
+            self.misses += 1
+
+        value = compile_func()
+
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self):
+        return {
+            "size": len(self.entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+template_cache = CompiledTemplateCache(getattr(settings, "GR_TEMPLATE_CACHE_SIZE", 2000))
+
+# Rendered HTML after URL rewriting, which is larger, is kept separately
+# so that it doesn't evict compiled templates.
+rendered_html_cache = CompiledTemplateCache(getattr(settings, "GR_RENDERED_HTML_CACHE_SIZE", 200))
+
+jinja2_environments = { }
+
+def get_jinja2_environment(autoescape=False, undefined=None):
+    # Environments hold no per-render state, so a single Jinja2Environment
+    # is shared for each configuration.
+    import jinja2
+    undefined = undefined or jinja2.Undefined
+    key = (autoescape, undefined)
+    if key not in jinja2_environments:
+        jinja2_environments[key] = Jinja2Environment(autoescape=autoescape, undefined=undefined)
+    return jinja2_environments[key]
+
+def get_compiled_template(source, autoescape=False, undefined=None):
+    # Compile a Jinja2 template, or get it from the cache. Raises
+    # jinja2.TemplateSyntaxError if the template is invalid.
+    env = get_jinja2_environment(autoescape, undefined)
+    return template_cache.get(
+        ("template", autoescape, env.undefined, template_cache.hash(source)),
+        lambda : env.from_string(source))
+
+def walk_module_questions(module, callback, precomputed_states=None):
     # Walks the questions in depth-first order following the dependency
     # tree connecting questions. If a question is a dependency of multiple
     # questions, it is walked only once.
@@ -55,52 +137,54 @@ def walk_module_questions(module, callback):
     #    of the callback calls on its dependencies.
     # 3) A set of ModuleQuestion instances that this question depends on,
     #    so that the callback doesn't have to compute it (again) itself.
+    #
+    # precomputed_states, if given, maps question keys to the state dict
+    # that a previous walk returned for that question. Those questions
+    # (and so also the questions they depend on) are not walked again.
+    #
+    # Returns a dict mapping each question key to the state dict that
+    # the walk computed for it.
 
     # Remember each question that is processed so we only process each
     # question at most once. Cache the state that it gives.
-    processed_questions = { }
-
-    # Pre-load all of the dependencies between questions in this module
-    # and get the questions that are not depended on by any question,
-    # which is where the dependency chains start.
-    dependencies, root_questions = get_all_question_dependencies(module)
-
-    # Local function that processes a single question.
-    def walk_question(q, stack):
-        # If we've seen this question already as a dependency of another
-        # question, then return its state dict from last time.
-        if q.key in processed_questions:
-            return processed_questions[q.key]
-
-        # Prevent infinite recursion.
-        if q.key in stack:
-            raise ValueError("Cyclical dependency in questions: " + "->".join(stack + [q.key]))
-
-        # Execute recursively on the questions it depends on,
-        # in module definition order rather than in a random
-        # order.
+    processed_questions = dict(precomputed_states or { })
+
+    # Pre-load all of the dependencies between questions in this module.
+    # The module plan has the order in which to visit the questions: a
+    # depth-first walk from the questions that are not depended on by any
+    # question, which is where the dependency chains start, so that every
+    # question comes after the questions it depends on.
+    plan = get_module_plan(module)
+    if plan["cycle"]:
+        raise ValueError(plan["cycle"])
+    dependencies, _ = get_all_question_dependencies(module)
+    questions = { q.key: q for q in dependencies }
+
+    for key in plan["order"]:
+        # If we've seen this question already, e.g. in a previous walk,
+        # skip it.
+        if key in processed_questions:
+            continue
+        q = questions[key]
+
+        # Merge the state of the questions it depends on, in module
+        # definition order rather than in a random order.
         state = { }
         deps = list(dependencies[q])
         deps.sort(key = lambda q : q.definition_order)
         for qq in deps:
-            state.update(walk_question(qq, stack+[q.key]))
+            state.update(processed_questions[qq.key])
 
         # Run the callback and get its state.
         state = callback(q, state, dependencies[q])
-        # Remember the state in case we encounter it later.
-        processed_questions[q.key] = dict(state) # clone
 
-        # Return the state to the caller.
-        return state
+        # Remember the state for the questions that depend on it.
+        processed_questions[q.key] = dict(state) # clone
 
-    # Walk the dependency root questions in document order.
-    root_questions = list(root_questions)
-    root_questions.sort(key = lambda q : q.definition_order)
-    for q in root_questions:
-        walk_question(q, [])
+    return processed_questions
 
 
-def evaluate_module_state(current_answers, parent_context=None):
+def evaluate_module_state(current_answers, parent_context=None, previous_state=None, changed_keys=None):
     # Compute the next question to ask the user, given the user's
     # answers to questions so far, and all imputed answers up to
     # that point.
@@ -108,6 +192,31 @@ def evaluate_module_state(current_answers, parent_context=None):
     # To figure this out, we walk the dependency tree of questions
     # until we arrive at questions that have no unanswered dependencies.
     # Such questions can be put forth to the user.
+    #
+    # If previous_state (a ModuleAnswers previously returned by this
+    # function for the same Module) and changed_keys (the keys of the
+    # questions whose answers changed since then) are given, only the
+    # changed questions and the questions that depend on them, directly
+    # or indirectly, are re-evaluated. The result is the same as a full
+    # evaluation.
+
+    # Imputed answers and question states can depend on any of the
+    # Task's answers.
+    record_task_dependency(current_answers.task)
+
+    # Determine which questions must be re-evaluated and which can keep
+    # their state from the previous evaluation.
+    precomputed_states = None
+    if previous_state is not None and changed_keys is not None \
+        and getattr(previous_state, "question_states", None) is not None \
+        and previous_state.module.id == current_answers.module.id:
+        affected = get_dependent_questions(current_answers.module,
+            set(changed_keys) | get_volatile_questions(current_answers.module))
+        precomputed_states = {
+            key: state
+            for key, state in previous_state.question_states.items()
+            if key not in affected
+        }
 
     # Build a list of ModuleQuestion that the are not unanswerable
     # because they are imputed or unavailable to the user. These
@@ -131,6 +240,17 @@ def evaluate_module_state(current_answers, parent_context=None):
     # Build a list of questions whose answers were imputed.
     was_imputed = set()
 
+    if precomputed_states is not None:
+        # Start from the previous evaluation's results for the questions
+        # that are not being re-evaluated. The answertuples are copied in
+        # full to preserve the walk order. Entries for affected questions
+        # are overwritten by the walk below.
+        answerable = { q for q in previous_state.answerable if q.key in precomputed_states }
+        can_answer = { q for q in previous_state.can_answer if q.key in precomputed_states }
+        unanswered = { q for q in previous_state.unanswered if q.key in precomputed_states }
+        was_imputed = { key for key in previous_state.was_imputed if key in precomputed_states }
+        answertuples.update(previous_state.answertuples)
+
     # Create some reusable context for evaluating impute conditions --- really only
     # so that we can pass down project and organization values. Everything else is
     # cleared from the context's cache for each question because each question sees
@@ -211,7 +331,8 @@ def evaluate_module_state(current_answers, parent_context=None):
         return state
 
     # Walk the dependency tree.
-    walk_module_questions(current_answers.module, walker)
+    question_states = walk_module_questions(current_answers.module, walker,
+        precomputed_states=precomputed_states)
 
     # There may be multiple routes through the tree of questions,
     # so we'll prefer the question that is defined first in the spec.
@@ -233,6 +354,7 @@ def evaluate_module_state(current_answers, parent_context=None):
     ret.unanswered = unanswered
     ret.can_answer = can_answer
     ret.answerable = answerable
+    ret.question_states = question_states
     return ret
 
 
@@ -459,96 +581,104 @@ def render_content(content, answers, output_format, source,
 
             if not isinstance(template_body, str): raise ValueError("Template %s has incorrect type: %s" % (source, type(template_body)))
 
-            # We don't want CommonMark to mess up template tags, however. If
-            # there are symbols which have meaning both to Jinaj2 and CommonMark,
-            # then they may get ruined by CommonMark because they may be escaped.
-            # For instance:
-            #
-            #    {% hello "*my friend*" %}
-            #
-            # would become
-            #
-            #    {% hello "<em>my friend</em>" %}
-            #
-            # and
-            #
-            #    [my link]({{variable_holding_url}})
-            #
-            # would become a link whose target is
-            #
-            #    %7B%7Bvariable_holding_url%7D%7D
-            #
-            # And that's not good!
-            #
-            # Do a simple lexical pass over the template and replace template
-            # tags with special codes that CommonMark will ignore. Then we'll
-            # put back the strings after the CommonMark has been rendered into
-            # HTML, so that the template tags end up in their appropriate place.
-            #
-            # Since CommonMark will clean up Unicode in URLs, e.g. in link and
-            # image URLs, by %-encoding non-URL-safe characters, we have to
-            # also override CommonMark's URL escaping function at
-            # https://github.com/rtfd/CommonMark-py/blob/master/CommonMark/common.py#L71
-            # to not %-encode our special codes. Unfortunately urllib.parse.quote's
-            # "safe" argument does not handle non-ASCII characters.
-            from commonmark import inlines
-            def urlencode_special(uri):
-                import urllib.parse
-                return "".join(
-                    urllib.parse.quote(c, safe="/@:+?=&()%#*,") # this is what CommonMark does
-                    if c not in "\uE000\uE001" else c # but keep our special codes
-                    for c in uri)
-            inlines.normalize_uri = urlencode_special
-
-            substitutions = []
-            import re
-            def replace(m):
-                # Record the substitution.
-                index = len(substitutions)
-                substitutions.append(m.group(0))
-                return "\uE000%d\uE001" % index # use Unicode private use area code points
-            template_body = re.sub(r"{%[\w\W]*?%}|{{.*?}}", replace, template_body)
-
-            # Use our CommonMark Tables parser & renderer.
-            from commonmark_extensions.tables import \
-                ParserWithTables as CommonMarkParser, \
-                RendererWithTables as CommonMarkHtmlRenderer
-
-            # Subclass the renderer to control the output a bit.
-            class q_renderer(CommonMarkHtmlRenderer):
-                def __init__(self):
-                    # Our module templates are currently trusted, so we can keep
-                    # safe mode off, and we're making use of that. Safe mode is
-                    # off by default, but I'm making it explicit. If we ever
-                    # have untrusted template content, we will need to turn
-                    # safe mode on.
-                    super().__init__(options={ "safe": False })
-
-                def heading(self, node, entering):
-                    # Generate <h#> tags with one level down from
-                    # what would be normal since they should not
-                    # conflict with the page <h1>.
-                    if entering and demote_headings:
-                        node.level += 1
-                    super().heading(node, entering)
-
-                def code_block(self, node, entering):
-                    # Suppress info strings because with variable substitution
-                    # untrusted content could land in the <code> class attribute
-                    # without a language- prefix.
-                    node.info = None
-                    super().code_block(node, entering)
-
-                def make_table_node(self, node):
-                    return "<table class='table'>"
+            # The conversion depends only on the template, so the result
+            # is cached with the compiled templates.
+            def markdown_to_html(template_body):
+                # We don't want CommonMark to mess up template tags, however. If
+                # there are symbols which have meaning both to Jinaj2 and CommonMark,
+                # then they may get ruined by CommonMark because they may be escaped.
+                # For instance:
+                #
+                #    {% hello "*my friend*" %}
+                #
+                # would become
+                #
+                #    {% hello "<em>my friend</em>" %}
+                #
+                # and
+                #
+                #    [my link]({{variable_holding_url}})
+                #
+                # would become a link whose target is
+                #
+                #    %7B%7Bvariable_holding_url%7D%7D
+                #
+                # And that's not good!
+                #
+                # Do a simple lexical pass over the template and replace template
+                # tags with special codes that CommonMark will ignore. Then we'll
+                # put back the strings after the CommonMark has been rendered into
+                # HTML, so that the template tags end up in their appropriate place.
+                #
+                # Since CommonMark will clean up Unicode in URLs, e.g. in link and
+                # image URLs, by %-encoding non-URL-safe characters, we have to
+                # also override CommonMark's URL escaping function at
+                # https://github.com/rtfd/CommonMark-py/blob/master/CommonMark/common.py#L71
+                # to not %-encode our special codes. Unfortunately urllib.parse.quote's
+                # "safe" argument does not handle non-ASCII characters.
+                from commonmark import inlines
+                def urlencode_special(uri):
+                    import urllib.parse
+                    return "".join(
+                        urllib.parse.quote(c, safe="/@:+?=&()%#*,") # this is what CommonMark does
+                        if c not in "\uE000\uE001" else c # but keep our special codes
+                        for c in uri)
+                inlines.normalize_uri = urlencode_special
+
+                substitutions = []
+                import re
+                def replace(m):
+                    # Record the substitution.
+                    index = len(substitutions)
+                    substitutions.append(m.group(0))
+                    return "\uE000%d\uE001" % index # use Unicode private use area code points
+                template_body = re.sub(r"{%[\w\W]*?%}|{{.*?}}", replace, template_body)
+
+                # Use our CommonMark Tables parser & renderer.
+                from commonmark_extensions.tables import \
+                    ParserWithTables as CommonMarkParser, \
+                    RendererWithTables as CommonMarkHtmlRenderer
+
+                # Subclass the renderer to control the output a bit.
+                class q_renderer(CommonMarkHtmlRenderer):
+                    def __init__(self):
+                        # Our module templates are currently trusted, so we can keep
+                        # safe mode off, and we're making use of that. Safe mode is
+                        # off by default, but I'm making it explicit. If we ever
+                        # have untrusted template content, we will need to turn
+                        # safe mode on.
+                        super().__init__(options={ "safe": False })
+
+                    def heading(self, node, entering):
+                        # Generate <h#> tags with one level down from
+                        # what would be normal since they should not
+                        # conflict with the page <h1>.
+                        if entering and demote_headings:
+                            node.level += 1
+                        super().heading(node, entering)
+
+                    def code_block(self, node, entering):
+                        # Suppress info strings because with variable substitution
+                        # untrusted content could land in the <code> class attribute
+                        # without a language- prefix.
+                        node.info = None
+                        super().code_block(node, entering)
+
+                    def make_table_node(self, node):
+                        return "<table class='table'>"
+
+                template_body = q_renderer().render(CommonMarkParser().parse(template_body))
+                # Put the Jinja2 template tags back that we removed prior to running
+                # the CommonMark renderer.
+                def replace(m):
+                    return substitutions[int(m.group(1))]
+                template_body = re.sub("\uE000(\d+)\uE001", replace, template_body)
+                return template_body
 
             template_format = "html"
-            template_body = q_renderer().render(CommonMarkParser().parse(template_body))
-            # Put the Jinja2 template tags back that we removed prior to running
-            # the CommonMark renderer.
-            def replace(m):
-                return substitutions[int(m.group(1))]
-            template_body = re.sub("\uE000(\d+)\uE001", replace, template_body)
+            template_body = template_cache.get(
+                ("markdown", demote_headings, template_cache.hash(template_body)),
+                lambda : markdown_to_html(template_body))
 
         elif output_format in ("text", "markdown"):
             # Pass through the markdown markup unchanged.
@@ -570,9 +700,6 @@ def render_content(content, answers, output_format, source,
         from collections import OrderedDict
 
         import jinja2
-        env = Jinja2Environment(
-            autoescape=True,
-            undefined=jinja2.StrictUndefined) # see below - we defined any undefined variables
         context = dict(additional_context) # clone
         if answers:
             def escapefunc(question, task, has_answer, answerobj, value):
@@ -829,11 +956,10 @@ def render_content(content, answers, output_format, source,
         # we handle it ourselves, we do so using the __html__ method on
         # RenderedAnswer, which relies on autoescaping logic. This also lets
         # the template writer disable autoescaping with "|safe".
-        env = Jinja2Environment(
-            autoescape=True,
-            undefined=jinja2.StrictUndefined) # see below - we defined any undefined variables
         try:
-            template = env.from_string(template_body)
+            template = get_compiled_template(template_body,
+                autoescape=True,
+                undefined=jinja2.StrictUndefined) # see below - we defined any undefined variables
         except jinja2.TemplateSyntaxError as e:
             raise ValueError("There was an error loading the Jinja2 template %s: %s, line %d" % (source, str(e), e.lineno))
 
@@ -940,19 +1066,31 @@ def render_content(content, answers, output_format, source,
                         return "javascript:alert('Invalid link.');"
                     return url
 
-                import html5lib
-                dom = html5lib.HTMLParser().parseFragment(output)
-                for node in dom.iter():
-                    if node.get("href"):
-                        node.set("href", rewrite_url(node.get("href")))
-                    if node.get("src"):
-                        node.set("src", rewrite_url(node.get("src"), allow_dataurl=(node.tag == "{http://www.w3.org/1999/xhtml}img")))
-                output = html5lib.serialize(dom, quote_attr_values="always", omit_optional_tags=False, alphabetical_attributes=True)
-
-                # But the p's within p's fix gives us a lot of empty p's.
-                output = output.replace("<p></p>", "")
-
-                return output
+                def rewrite_html():
+                    import html5lib
+                    dom = html5lib.HTMLParser().parseFragment(output)
+                    for node in dom.iter():
+                        if node.get("href"):
+                            node.set("href", rewrite_url(node.get("href")))
+                        if node.get("src"):
+                            node.set("src", rewrite_url(node.get("src"), allow_dataurl=(node.tag == "{http://www.w3.org/1999/xhtml}img")))
+                    ret = html5lib.serialize(dom, quote_attr_values="always", omit_optional_tags=False, alphabetical_attributes=True)
+
+                    # But the p's within p's fix gives us a lot of empty p's.
+                    return ret.replace("<p></p>", "")
+
+                # The rewrite only depends on the rendered output, which
+                # changes with the answers, and on the Task and its app's
+                # static assets. Memoize it since the same documents are
+                # rendered repeatedly.
+                assets = answers.task.module.app.asset_paths if answers and answers.task else None
+                return rendered_html_cache.get(
+                    ("rewrite",
+                     answers.task.id if answers and answers.task else None,
+                     rendered_html_cache.hash(repr(sorted(assets.items()))) if assets else None,
+                     use_data_urls,
+                     rendered_html_cache.hash(output)),
+                    rewrite_html)
 
         raise ValueError("Cannot render %s to %s." % (template_format, output_format))
 
@@ -1139,17 +1277,142 @@ class HtmlAnswerRenderer:
         )
 
 
-def clear_module_question_cache():
+def clear_module_question_cache(module=None):
+    # Clear the in-process caches. If a Module is given, its questions
+    # have changed, so also invalidate its shared module plan.
     if hasattr(get_all_question_dependencies, 'cache'):
         del get_all_question_dependencies.cache
+    if hasattr(get_module_plan, 'cache'):
+        del get_module_plan.cache
+    if module is not None:
+        invalidate_module_plan(module)
+
+
+def get_module_plan_version(module):
+    # The plan of a Module is rebuilt whenever the Module is updated.
+    # invalidate_module_plan bumps the Module's updated time when only
+    # its questions change.
+    return module.updated.isoformat() if module.updated else ""
+
+def get_module_plan_cache_key(module):
+    return "module_plan_{}".format(module.id)
+
+def get_module_plan(module):
+    # Returns the compiled execution plan of a Module, a dict holding:
+    #
+    # * version: the Module version the plan was built for
+    # * questions: the question keys in definition order
+    # * dependencies: a mapping from question keys to a list of
+    #   (edge type, question key) tuples that the question depends on
+    # * root_questions: the keys of questions that no question depends on
+    # * order: the keys of the questions in the order walk_module_questions
+    #   visits them, which is a topological order of the dependencies
+    # * cycle: None, or the path of a cyclical dependency found while
+    #   computing the order
+    # * volatile: the keys of questions whose prompt or impute conditions
+    #   refer to template variables that are not questions in the Module
+    #
+    # Building the plan requires parsing every prompt and impute condition,
+    # so plans are stored in the cache backend where they are shared by all
+    # processes, plus an in-process cache.
+    version = get_module_plan_version(module)
+
+    # Initialize cache, query cache.
+    if not hasattr(get_module_plan, 'cache'):
+        get_module_plan.cache = { }
+    plan = get_module_plan.cache.get(module.id)
+    if plan is not None and plan["version"] == version:
+        return plan
+
+    # Query the shared cache.
+    from django.core.cache import cache
+    plan = cache.get(get_module_plan_cache_key(module))
+    if plan is None or plan["version"] != version:
+        plan = build_module_plan(module, version)
+        cache.set(get_module_plan_cache_key(module), plan, None)
+
+    get_module_plan.cache[module.id] = plan
+    return plan
+
+def build_module_plan(module, version):
+    questions = list(module.questions.order_by("definition_order").values_list("key", "spec"))
+    question_keys = { key for key, spec in questions }
+    definition_order = { key: i for i, (key, spec) in enumerate(questions) }
+
+    # Compute all of the dependencies of all of the questions. Template
+    # variables that are not questions make the question volatile.
+    dependencies = { }
+    volatile = set()
+    for key, spec in questions:
+        dependencies[key] = []
+        for edge_type, qid in get_question_spec_dependencies_with_type(spec):
+            if qid in question_keys:
+                dependencies[key].append((edge_type, qid))
+            elif edge_type != "ask-first":
+                volatile.add(key)
+
+    # Find the questions that are at the root of the dependency tree.
+    is_dependency_of_something = { qid for deps in dependencies.values() for _, qid in deps }
+    root_questions = [key for key, spec in questions if key not in is_dependency_of_something]
+
+    # Compute the order in which walk_module_questions visits the questions:
+    # depth-first from the root questions, dependencies before the questions
+    # that depend on them, in definition order.
+    order = []
+    visited = set()
+    def visit(key, stack):
+        if key in visited:
+            return
+        if key in stack:
+            raise ValueError("Cyclical dependency in questions: " + "->".join(stack + [key]))
+        deps = sorted({ qid for _, qid in dependencies[key] }, key=lambda qid : definition_order[qid])
+        for qid in deps:
+            visit(qid, stack+[key])
+        visited.add(key)
+        order.append(key)
+    try:
+        for key in root_questions:
+            visit(key, [])
+        cycle = None
+    except ValueError as e:
+        order = None
+        cycle = str(e)
+
+    return {
+        "version": version,
+        "questions": [key for key, spec in questions],
+        "dependencies": dependencies,
+        "root_questions": root_questions,
+        "order": order,
+        "cycle": cycle,
+        "volatile": sorted(volatile),
+    }
+
+def invalidate_module_plan(module):
+    # Called when the questions of a Module are changed. Bump the Module's
+    # updated time, which is the plan version, so that every process
+    # rebuilds the plan, and drop the stale plan from the shared cache.
+    from django.core.cache import cache
+    from django.utils import timezone
+    module.updated = timezone.now()
+    type(module).objects.filter(id=module.id).update(updated=module.updated)
+    cache.delete(get_module_plan_cache_key(module))
+    if hasattr(get_module_plan, 'cache'):
+        get_module_plan.cache.pop(module.id, None)
 
 
 def get_all_question_dependencies(module):
+    # Returns a tuple of a dict mapping each ModuleQuestion of the module
+    # to the set of ModuleQuestions it depends on, and the set of
+    # ModuleQuestions that no question depends on, using the module plan.
+    plan = get_module_plan(module)
+
     # Initialize cache, query cache.
     if not hasattr(get_all_question_dependencies, 'cache'):
         get_all_question_dependencies.cache = { }
-    if module.id in get_all_question_dependencies.cache:
-        return get_all_question_dependencies.cache[module.id]
+    cached = get_all_question_dependencies.cache.get(module.id)
+    if cached is not None and cached[0] == plan["version"]:
+        return cached[1]
 
     # Pre-load all of the questions by their key so that the dependency
     # evaluation is fast.
@@ -1157,26 +1420,50 @@ def get_all_question_dependencies(module):
     for q in module.questions.all():
         all_questions[q.key] = q
 
-    # Compute all of the dependencies of all of the questions.
+    # Turn the keys in the plan into ModuleQuestion instances.
     dependencies = {
-        q: get_question_dependencies(q, get_from_question_id=all_questions)
+        q: { all_questions[qid] for _, qid in plan["dependencies"].get(q.key, []) if qid in all_questions }
         for q in all_questions.values()
     }
-
-    # Find the questions that are at the root of the dependency tree.
-    is_dependency_of_something = set()
-    for deps in dependencies.values():
-        is_dependency_of_something |= deps
-    root_questions = { q for q in dependencies if q not in is_dependency_of_something }
+    root_questions = { all_questions[key] for key in plan["root_questions"] if key in all_questions }
 
     ret = (dependencies, root_questions)
 
-    # Save to in-memory (in-process) cache. Never in debugging.
-    if not settings.DEBUG:
-        get_all_question_dependencies.cache[module.id] = ret
+    # Save to in-memory (in-process) cache.
+    get_all_question_dependencies.cache[module.id] = (plan["version"], ret)
 
     return ret
 
+def get_dependent_questions(module, question_keys):
+    # Returns the set of keys of the questions in question_keys plus
+    # the keys of all questions that depend on them, directly or
+    # indirectly, following the edges in the module plan.
+    plan = get_module_plan(module)
+
+    # Reverse the dependency edges.
+    dependents = { }
+    for key, deps in plan["dependencies"].items():
+        for _, qid in deps:
+            dependents.setdefault(qid, set()).add(key)
+
+    # Find the transitive closure.
+    ret = set(question_keys)
+    stack = list(ret)
+    while stack:
+        for key in dependents.get(stack.pop(), ()):
+            if key not in ret:
+                ret.add(key)
+                stack.append(key)
+    return ret
+
+def get_volatile_questions(module):
+    # Returns the set of keys of the questions whose prompt or impute
+    # conditions refer to template variables that are not other questions
+    # in the module, such as project, organization, or system. Their state
+    # can change without any answer in the module changing, so they are
+    # always re-evaluated during an incremental evaluation.
+    return set(get_module_plan(module)["volatile"])
+
 def get_question_dependencies(question, get_from_question_id=None):
     return set(edge[1] for edge in get_question_dependencies_with_type(question, get_from_question_id))
 
@@ -1192,15 +1479,27 @@ def get_question_dependencies_with_type(question, get_from_question_id=None):
 
     # Returns a set of ModuleQuestion instances that this question is dependent on
     # as a list of edges that are tuples of (edge_type, question obj).
+    ret = get_question_spec_dependencies_with_type(question.spec)
+
+    # Turn IDs into ModuleQuestion instances.
+    return [ (edge_type, get_from_question_id[qid])
+         for (edge_type, qid) in ret
+         if qid in get_from_question_id
+       ]
+
+def get_question_spec_dependencies_with_type(spec):
+    # Returns the template variables that a question specification refers
+    # to as a list of edges that are tuples of (edge_type, variable name).
+    # Variables that are question IDs are dependencies of the question.
     ret = []
 
     # All questions mentioned in prompt text become dependencies.
-    for qid in get_jinja2_template_vars(question.spec.get("prompt", "")):
+    for qid in get_jinja2_template_vars(spec.get("prompt", "")):
         ret.append(("prompt", qid))
 
     # All questions mentioned in the impute conditions become dependencies.
     # And when impute values are expressions, then similarly for those.
-    for rule in question.spec.get("impute", []):
+    for rule in spec.get("impute", []):
         if "condition" in rule:
             for qid in get_jinja2_template_vars(
                     r"{% if (" + rule["condition"] + r") %}...{% endif %}"
@@ -1218,32 +1517,18 @@ def get_question_dependencies_with_type(question, get_from_question_id=None):
                 ret.append(("impute-value", qid))
 
     # Other dependencies can just be listed.
-    for qid in question.spec.get("ask-first", []):
+    for qid in spec.get("ask-first", []):
         ret.append(("ask-first", qid))
 
-    # Turn IDs into ModuleQuestion instances.
-    return [ (edge_type, get_from_question_id[qid])
-         for (edge_type, qid) in ret
-         if qid in get_from_question_id
-       ]
-
-jinja2_expression_compile_cache = { }
+    return ret
 
 def compile_jinja2_expression(expr):
-    # If the expression has already been compiled and is in the cache,
-    # return the compiled expression.
-    if expr in jinja2_expression_compile_cache:
-        return jinja2_expression_compile_cache[expr]
-
-    # The expression is not in the cache. Compile it.
-    env = Jinja2Environment()
-    compiled = env.compile_expression(expr)
-
-    # Save it to the cache.
-    jinja2_expression_compile_cache[expr] = compiled
-
-    # Return it.
-    return compiled
+    # Compile the expression, or return the compiled expression if it
+    # is already in the cache.
+    env = get_jinja2_environment()
+    return template_cache.get(
+        ("expression", template_cache.hash(expr)),
+        lambda : env.compile_expression(expr))
 
 def run_impute_conditions(conditions, context):
     # Check if any of the impute conditions are met based on
@@ -1251,7 +1536,7 @@ def run_impute_conditions(conditions, context):
     # the imputed value. Be careful about values like 0 that
     # are false-y --- must check for "is None" to know if
     # something was imputed or not.
-    env = Jinja2Environment()
+    import jinja2
     for rule in conditions:
         if "condition" in rule:
             condition_func = compile_jinja2_expression(rule["condition"])
@@ -1280,9 +1565,8 @@ def run_impute_conditions(conditions, context):
                     # RenderedProject, RenderedOrganization
                     value = value.as_raw_value()
             elif rule.get("value-mode", "raw") == "template":
-                env = Jinja2Environment(autoescape=True)
                 try:
-                    template = env.from_string(rule["value"])
+                    template = get_compiled_template(rule["value"], autoescape=True)
                 except jinja2.TemplateSyntaxError as e:
                     raise ValueError("There was an error loading the template %s: %s" % (rule["value"], str(e)))
                 value = template.render(context)
@@ -1326,10 +1610,14 @@ class ModuleAnswers(object):
             self.answers_dict = { q.key: value for q, is_ans, ansobj, value in self.answertuples.values() if is_ans }
         return self.answers_dict
 
-    def with_extended_info(self, parent_context=None):
+    def with_extended_info(self, parent_context=None, previous_state=None, changed_keys=None):
         # Return a new ModuleAnswers instance that has imputed values added
         # and information about the next question(s) and unanswered questions.
-        return evaluate_module_state(self, parent_context=parent_context)
+        # If previous_state is a ModuleAnswers returned by an earlier call and
+        # changed_keys lists the questions whose answers changed since then,
+        # only the affected questions are re-evaluated.
+        return evaluate_module_state(self, parent_context=parent_context,
+            previous_state=previous_state, changed_keys=changed_keys)
 
     def get(self, question_key):
         return self.answertuples[question_key][2]
@@ -1420,11 +1708,7 @@ class ModuleAnswers(object):
                         doc_name = "'%s' output document '%s'" % (self.module_answers.module.module_name, doc_name)
 
                         # Try to render it.
-                        task_cache_entry = "output_r1_{}_{}_{}".format(
-                            self.index,
-                            entry,
-                            1 if self.use_data_urls else 0,
-                        )
+                        task_cache_entry = get_output_document_cache_key(self.index, entry, self.use_data_urls)
                         def do_render():
                             try:
                                 return render_content(self.document, self.module_answers, entry, doc_name, show_answer_metadata=True, use_data_urls=self.use_data_urls)
@@ -1454,6 +1738,50 @@ class ModuleAnswers(object):
         return [ LazyRenderedDocument(self, d, i, use_data_urls) for i, d in enumerate(self.module.spec.get("output", [])) ]
 
 
+def render_output_documents_concurrently(documents, output_formats=("html",), max_workers=None):
+    # Render the given output formats of the lazily-rendered documents
+    # returned by ModuleAnswers.render_output using a pool of worker threads,
+    # since the documents don't depend on each other. Django database
+    # connections are per-thread, so each worker uses its own connection,
+    # which it closes when it is done. Returns the documents.
+    if max_workers is None:
+        max_workers = getattr(settings, "GR_OUTPUT_RENDER_WORKERS", 1)
+    jobs = [(document, output_format) for document in documents for output_format in output_formats]
+    if max_workers <= 1 or len(jobs) <= 1:
+        for document, output_format in jobs:
+            document[output_format]
+        return documents
+
+    # Load the answers before the threads share them.
+    for document in documents:
+        document.module_answers.as_dict()
+
+    def render_jobs(jobs):
+        from django.db import connection
+        try:
+            for document, output_format in jobs:
+                document[output_format]
+        finally:
+            connection.close()
+
+    from concurrent.futures import ThreadPoolExecutor
+    max_workers = min(max_workers, len(jobs))
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # Give each worker every max_workers'th job.
+        futures = [pool.submit(render_jobs, jobs[i::max_workers]) for i in range(max_workers)]
+        for future in futures:
+            future.result()
+    return documents
+
+def get_output_document_cache_key(index, output_format, use_data_urls=False):
+    # The key in the Task's cached state of a rendered output document.
+    return "output_r1_{}_{}_{}".format(
+        index,
+        output_format,
+        1 if use_data_urls else 0,
+    )
+
+
 class UndefinedReference:
     def __init__(self, varname, errorfunc, path=[]):
         self.varname = varname
@@ -1470,7 +1798,49 @@ class UndefinedReference:
     def __getitem__(self, item):
         return UndefinedReference(item, self.errorfunc, self.path+[self.varname])
 
-from collections.abc import Mapping
+# Dependency tracking for cached Task state.
+#
+# While a value that is stored in a Task's cached state is being computed,
+# the template and expression runtime records which Tasks and which of their
+# questions it reads, so that the value only needs to be invalidated when one
+# of those answers changes. Trackers nest: when a cached value is computed
+# while computing another, its dependencies are also dependencies of the
+# outer value. Dependencies are (task_id, question_key) pairs where an empty
+# question_key means the value depends on all of the Task's answers.
+
+import threading
+from contextlib import contextmanager
+
+task_dependency_trackers = threading.local()
+
+@contextmanager
+def track_task_dependencies():
+    stack = task_dependency_trackers.__dict__.setdefault("stack", [])
+    dependencies = set()
+    stack.append(dependencies)
+    try:
+        yield dependencies
+    finally:
+        stack.pop()
+        if stack:
+            stack[-1] |= dependencies
+
+def is_tracking_task_dependencies():
+    return bool(getattr(task_dependency_trackers, "stack", None))
+
+def record_task_dependency(task, question_key=None):
+    # Record that the value currently being computed read the answer to
+    # question_key of task, or all of its answers if question_key is None.
+    if task is None or task.id is None or not is_tracking_task_dependencies():
+        return
+    task_dependency_trackers.stack[-1].add((task.id, question_key or ""))
+
+def record_task_dependencies(dependencies):
+    if not is_tracking_task_dependencies():
+        return
+    task_dependency_trackers.stack[-1].update(dependencies)
+
+from collections.abc import Mapping, Sequence
 class TemplateContext(Mapping):
     """A Jinja2 execution context that wraps the Pythonic answers to questions
        of a ModuleAnswers instance in RenderedAnswer instances that provide
@@ -1486,11 +1856,21 @@ class TemplateContext(Mapping):
         self.show_answer_metadata = parent_context.show_answer_metadata if parent_context else (show_answer_metadata or False)
         self.is_computing_title = parent_context.is_computing_title if parent_context else is_computing_title
         self._cache = { }
+        self._control_catalogs = { }
         self.parent_context = parent_context
 
     def __str__(self):
         return "<TemplateContext for %s>" % (self.module_answers)
 
+    def get_control_catalog(self, project):
+        # Control catalogs are cached in the outermost context, so that they
+        # are shared by all of the contexts of a render.
+        if self.parent_context is not None:
+            return self.parent_context.get_control_catalog(project)
+        if project.id not in self._control_catalogs:
+            self._control_catalogs[project.id] = get_project_control_catalog(project)
+        return self._control_catalogs[project.id]
+
     def __getitem__(self, item):
         # Cache every context variable's value, since some items are expensive.
         if item not in self._cache:
@@ -1519,6 +1899,7 @@ class TemplateContext(Mapping):
         if question:
             # The question might or might not be answered. If not, its value is None.
             self.module_answers.as_dict() # trigger lazy-loading
+            record_task_dependency(self.module_answers.task, item)
             _, is_answered, answerobj, answervalue = self.module_answers.answertuples.get(item, (None, None, None, None))
             return RenderedAnswer(self.module_answers.task, question, is_answered, answerobj, answervalue, self)
 
@@ -1538,43 +1919,9 @@ class TemplateContext(Mapping):
                     return self.parent_context[item]
                 return RenderedOrganization(self.module_answers.task, parent_context=self)
             if item == "control_catalog":
-                # Retrieve control catalog(s) for project
-                # Temporarily retrieve a single catalog
-                # TODO: Retrieve multiple catalogs because we could have catalogs plus overlays
-                #       Will need a better way to determine the catalogs on a system so we can retrieve at once
-                #       Maybe get the catalogs as a property of the system
-                # Retrieve a Django dictionary of dictionaries object of full control catalog
-
-                from controls.oscal import Catalog
-                try:
-                    all_keys = list(set([controls.oscal_catalog_key for controls in
-                                         self.module_answers.task.project.system.root_element.controls.all()]))
-                except:
-                    all_keys = []
-                # Need default if there are no control catalogs present
-                control_catalog = []
-                # If there are multiple catalogs
-                if len(all_keys) > 1:
-                    for idx, key in enumerate(all_keys):
-                    # Detect single control catalog from first control
-                        try:
-                            parameter_values = self.module_answers.task.project.get_parameter_values(key)
-
-                            sca = Catalog.GetInstance(catalog_key=key,
-                                                      parameter_values=parameter_values)
-                            control_catalog.append(sca.flattened_controls_all_as_dict_list)
-                        except:
-                            control_catalog = None
-                # If there is one catalog
-                elif len(all_keys) == 1:
-                    try:
-                        parameter_values = self.module_answers.task.project.get_parameter_values(all_keys[0])
-                        sca = Catalog.GetInstance(catalog_key=all_keys[0],
-                                                  parameter_values=parameter_values)
-                        control_catalog = sca.flattened_controls_all_as_dict
-                    except:
-                        control_catalog = None
-                return control_catalog
+                # The control catalog(s) of the project's system, with the
+                # project's organization-defined parameter values applied.
+                return self.get_control_catalog(self.module_answers.task.project)
             if item == "system":
                 # Retrieve the system object associated with this project
                 # Returned value must be a python dictionary
@@ -1582,6 +1929,7 @@ class TemplateContext(Mapping):
             if item == "oscal":
                 return oscal_context(self.module_answers.task.project.system)
             if item in ("is_started", "is_finished"):
+                record_task_dependency(self.module_answers.task)
                 # These are methods on the Task instance. Don't
                 # call the method here because that leads to infinite
                 # recursion. Figuring out if a module is finished
@@ -1599,6 +1947,7 @@ class TemplateContext(Mapping):
             if self.module_answers is None:
                 return []
             self.module_answers.as_dict() # trigger lazy-loading
+            record_task_dependency(self.module_answers.task)
             ret = []
             for question, is_answered, answerobj, answervalue in self.module_answers.answertuples.values():
                 ret.append((
@@ -1610,6 +1959,8 @@ class TemplateContext(Mapping):
         # The output_documents key returns the output documents as a dict-like mapping
         # from IDs to rendered content.
         if item == "output_documents":
+            if self.module_answers is not None:
+                record_task_dependency(self.module_answers.task)
             return TemplateContext.LazyOutputDocuments(self)
 
         # The item is not something found in the context.
@@ -1682,6 +2033,66 @@ class TemplateContext(Mapping):
                     yield doc["id"]
 
 
+def get_project_control_catalog(project):
+    # Return the value of the control_catalog template variable: if the
+    # project's system uses controls from one catalog, a mapping from control
+    # ids to flattened controls; if it uses more than one, a list of sequences
+    # of flattened controls, one per catalog; otherwise an empty list.
+    from controls.models import ElementControl
+    from controls.oscal import Catalog
+    if project.system_id is None:
+        return []
+    catalog_keys = list(ElementControl.objects
+        .filter(element__system=project.system_id)
+        .exclude(oscal_catalog_key__isnull=True).exclude(oscal_catalog_key="")
+        .order_by("oscal_catalog_key")
+        .values_list("oscal_catalog_key", flat=True).distinct())
+    catalogs = [
+        Catalog.GetInstance(catalog_key=catalog_key,
+                            parameter_values=project.get_parameter_values(catalog_key))
+        for catalog_key in catalog_keys
+    ]
+    if len(catalogs) == 1:
+        return LazyControlCatalog(catalogs[0])
+    return [LazyControlList(catalog) for catalog in catalogs]
+
+class LazyControlCatalog(Mapping):
+    """The flattened controls of a Catalog by control id. Controls are only
+       flattened (and their parameters substituted) when they are accessed."""
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def __getitem__(self, control_id):
+        control = self.catalog.get_control_by_id(control_id)
+        if control is None:
+            raise KeyError(control_id)
+        return self.catalog.get_flattened_control_as_dict(control)
+
+    def __contains__(self, control_id):
+        return control_id in self.catalog.controls_by_id
+
+    def __iter__(self):
+        return iter(self.catalog.controls_by_id)
+
+    def __len__(self):
+        return len(self.catalog.controls_by_id)
+
+class LazyControlList(Sequence):
+    """The flattened controls of a Catalog in catalog order, flattened as
+       they are accessed."""
+
+    def __init__(self, catalog):
+        self.catalog = catalog
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.catalog.get_flattened_control_as_dict(control) for control in self.catalog.controls_all[index]]
+        return self.catalog.get_flattened_control_as_dict(self.catalog.controls_all[index])
+
+    def __len__(self):
+        return len(self.catalog.controls_all)
+
 class RenderedProject(TemplateContext):
     def __init__(self, project, parent_context=None):
         self.project = project
@@ -1,7 +1,7 @@
 from django.contrib.auth.models import Permission
 from django.core.files import File
 from django.db.models import Q
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase
 
 from controls.models import Element, System
 from siteapp.enums.assets import AssetTypeEnum
@@ -248,6 +248,151 @@ class ImputeConditionTests(TestCaseWithFixtureData):
         self.assertEqual(answers.get("im_templ_1"), '1')
         self.assertEqual(answers.get("im_templ_2"), '2')
 
+    def test_incremental_module_state(self):
+        # Test that re-evaluating only the questions affected by a changed
+        # answer gives the same result as a full evaluation.
+        m = self.getModule("question_types_text")
+        q_text = m.questions.get(key="q_text")
+        previous = ModuleAnswers(m, None, { }).with_extended_info()
+        answers = ModuleAnswers(m, None, { "q_text": (q_text, True, None, "Hello!") })
+
+        full = answers.with_extended_info()
+        incremental = answers.with_extended_info(previous_state=previous, changed_keys={"q_text"})
+        self.assertEqual(list(incremental.answertuples.items()), list(full.answertuples.items()))
+        self.assertEqual(incremental.can_answer, full.can_answer)
+        self.assertEqual(incremental.unanswered, full.unanswered)
+        self.assertEqual(incremental.answerable, full.answerable)
+        self.assertEqual(incremental.was_imputed, full.was_imputed)
+
+        # Dependent questions are re-evaluated too.
+        m = self.getModule("impute_conditions")
+        self.assertEqual(get_dependent_questions(m, {"im_expr_1"}), {"im_expr_1", "im_templ_2"})
+        previous = ModuleAnswers(m, None, { }).with_extended_info()
+        incremental = ModuleAnswers(m, None, { }).with_extended_info(previous_state=previous, changed_keys={"im_expr_1"})
+        self.assertEqual(incremental.as_dict(), previous.as_dict())
+        self.assertEqual(incremental.was_imputed, previous.was_imputed)
+
+    def test_module_plan(self):
+        m = self.getModule("impute_conditions")
+        plan = get_module_plan(m)
+        self.assertEqual(plan["questions"][-3:], ["im_expr_1", "im_templ_1", "im_templ_2"])
+        self.assertEqual(plan["dependencies"]["im_templ_2"], [("impute-value", "im_expr_1")])
+        self.assertEqual(plan["root_questions"][-2:], ["im_templ_1", "im_templ_2"])
+        self.assertEqual(plan["order"][-3:], ["im_templ_1", "im_expr_1", "im_templ_2"])
+        self.assertIsNone(plan["cycle"])
+
+        # Changing a question invalidates the plan.
+        version = plan["version"]
+        q = m.questions.get(key="im_templ_1")
+        q.spec["impute"] = [{ "value": "{{im_templ_2}}", "value-mode": "template" }]
+        q.save()
+        clear_module_question_cache(m)
+        plan = get_module_plan(m)
+        self.assertNotEqual(plan["version"], version)
+        self.assertEqual(plan["root_questions"][-1:], ["im_templ_1"])
+
+class TaskStateTests(TestCaseWithFixtureData):
+    ## CACHED TASK STATE TESTS ##
+
+    def test_dependency_tracked_invalidation(self):
+        from .models import TaskAnswer
+        m = self.getModule("simple")
+        task1 = Task.objects.create(module=m, project=self.project, editor=self.user)
+        task2 = Task.objects.create(module=m, project=self.project, editor=self.user)
+        def set_answer(task, value):
+            ans, _ = TaskAnswer.objects.get_or_create(task=task, question=m.questions.get(key="q1"))
+            ans.save_answer(value, [], None, self.user, "web")
+
+        set_answer(task1, "Hello")
+        self.assertEqual(task1.title, "Hello")
+        self.assertFalse(task2.is_finished())
+
+        # A value that reads another Task's title depends on that Task's answers.
+        self.assertEqual(task2._get_cached_state("peek", lambda : task1.title), "Hello")
+        self.assertIn((task1.id, ""), set(task2.state_dependencies.filter(key="peek").values_list("source_task_id", "question_key")))
+
+        # Changing task2's answer leaves task1's cached state alone.
+        set_answer(task2, "World")
+        self.assertEqual(Task.objects.get(id=task1.id).cached_state, { "title": "Hello" })
+        self.assertIsNone(Task.objects.get(id=task2.id).cached_state)
+
+        # Changing task1's answer invalidates task2's value that read it.
+        self.assertEqual(task2._get_cached_state("peek", lambda : task1.title), "Hello")
+        task2.is_finished()
+        set_answer(task1, "Goodbye")
+        self.assertEqual(set(Task.objects.get(id=task2.id).cached_state), { "is_finished" })
+        task1 = Task.objects.get(id=task1.id)
+        self.assertEqual(task1.title, "Goodbye")
+        task2 = Task.objects.get(id=task2.id)
+        self.assertEqual(task2._get_cached_state("peek", lambda : task1.title), "Goodbye")
+
+    def test_cached_state_store(self):
+        from .models import TaskStateCacheEntry
+        m = self.getModule("simple")
+        tasks = [Task.objects.create(module=m, project=self.project, editor=self.user) for i in range(3)]
+        progress = [list(task.get_progress_percent_tuple()) for task in tasks]
+        self.assertEqual(TaskStateCacheEntry.get_total_size(tasks), 3 * len(str(progress[0])))
+
+        # Bulk-loaded values are read without further queries.
+        tasks = list(Task.objects.filter(id__in=[task.id for task in tasks]))
+        with self.assertNumQueries(1):
+            Task.load_cached_state(tasks, ["progress_percent_tuple"])
+        with self.assertNumQueries(0):
+            self.assertEqual([task.get_progress_percent_tuple() for task in tasks], progress)
+
+        # So are prefetched entries, which the API's task serializers use.
+        from api.guidedmodules.serializers.tasks import SimpleTaskSerializer
+        tasks = SimpleTaskSerializer.prefetch_queryset(Task.objects.filter(id__in=[task.id for task in tasks]).order_by("id"))
+        with self.assertNumQueries(2):
+            data = SimpleTaskSerializer(tasks, many=True).data
+        self.assertEqual([item["cached_state"] for item in data], [{ "progress_percent_tuple": p } for p in progress])
+
+        # Entries from another version of the cache are misses.
+        TaskStateCacheEntry.objects.filter(task=tasks[0]).update(version=0, value=[5, 5])
+        self.assertEqual(list(Task.objects.get(id=tasks[0].id).get_progress_percent_tuple()), progress[0])
+
+    def test_current_answer_records(self):
+        from .models import TaskAnswer
+        m = self.getModule("simple")
+        tasks = [Task.objects.create(module=m, project=self.project, editor=self.user) for i in range(2)]
+        ans = TaskAnswer.objects.create(task=tasks[0], question=m.questions.get(key="q1"))
+        ans.save_answer("first", [], None, self.user, "web")
+        ans.save_answer("second", [], None, self.user, "web")
+        records = { (task.id, q.key): a for task, q, a in Task.get_all_current_answer_records(tasks) }
+        self.assertEqual(records[(tasks[0].id, "q1")].get_value(), "second")
+        self.assertIsNone(records[(tasks[1].id, "q1")])
+
+        # A cleared answer is not a current answer.
+        ans.clear_answer(self.user)
+        records = { (task.id, q.key): a for task, q, a in Task.get_all_current_answer_records(tasks) }
+        self.assertIsNone(records[(tasks[0].id, "q1")])
+        self.assertFalse(ans.has_answer())
+
+        # The current answer pointer can be rebuilt from the history.
+        latest = ans.answer_history.order_by('-id').first()
+        TaskAnswer.objects.filter(id=ans.id).update(current_answer=None, current_answer_cleared=False)
+        self.assertEqual(TaskAnswer.update_current_answers(), 1)
+        ans = TaskAnswer.objects.get(id=ans.id)
+        self.assertEqual(ans.get_current_answer(), latest)
+        self.assertTrue(ans.current_answer_cleared)
+
+    def test_load_dashboard_state(self):
+        m = self.getModule("simple")
+        tasks = [Task.objects.create(module=m, project=self.project, editor=self.user) for i in range(3)]
+        expected = [(task.title, task.is_finished(), list(task.get_progress_percent_tuple())) for task in tasks]
+        Task.clear_state(tasks)
+
+        # After a batch load, the values are available without queries...
+        tasks = list(Task.objects.filter(id__in=[task.id for task in tasks]).order_by("id"))
+        Task.load_dashboard_state(tasks)
+        with self.assertNumQueries(0):
+            self.assertEqual([(task.title, task.is_finished(), list(task.get_progress_percent_tuple())) for task in tasks], expected)
+
+        # ... and were stored for the next page load.
+        tasks = list(Task.objects.filter(id__in=[task.id for task in tasks]))
+        with self.assertNumQueries(2):
+            Task.load_dashboard_state(tasks)
+
 class RenderTests(TestCaseWithFixtureData):
     ## GENERAL RENDER TESTS ##
 
@@ -576,6 +721,135 @@ class RenderTests(TestCaseWithFixtureData):
 
         # TODO: Test module-set questions.
 
+    def test_compiled_template_cache(self):
+        # Compiled templates are reused and the least recently used
+        # template is evicted when the cache is full.
+        cache = CompiledTemplateCache(2)
+        compile = lambda source : cache.get(("template", source), lambda : Jinja2Environment().from_string(source))
+        t1 = compile("{{a}}")
+        self.assertIs(compile("{{a}}"), t1)
+        compile("{{b}}")
+        compile("{{c}}")
+        self.assertEqual(cache.stats(), { "size": 2, "maxsize": 2, "hits": 1, "misses": 3 })
+        self.assertIsNot(compile("{{a}}"), t1)
+
+        # Syntax errors are raised and not cached.
+        import jinja2
+        with self.assertRaises(jinja2.TemplateSyntaxError):
+            get_compiled_template("{{")
+        self.assertIs(get_compiled_template("{{a}}", autoescape=True), get_compiled_template("{{a}}", autoescape=True))
+
+    def test_output_document_rendering(self):
+        # The URL-rewriting pass over rendered HTML is memoized.
+        m = self.getModule("simple")
+        task = Task.objects.create(module=m, project=self.project, editor=self.user)
+        answers = ModuleAnswers(m, task, None)
+        content = { "format": "markdown", "template": "[link](javascript:alert(1)) ![image](missing.png)" }
+        hits = rendered_html_cache.stats()["hits"]
+        html = render_content(content, answers, "html", "test")
+        self.assertEqual(render_content(content, answers, "html", "test"), html)
+        self.assertEqual(rendered_html_cache.stats()["hits"], hits + 1)
+        self.assertIn("Invalid link", html)
+
+        # Documents rendered together are cached for later requests.
+        documents = render_output_documents_concurrently(task.render_output_documents(), ("html", "text"), max_workers=1)
+        self.assertIn("The Answer", documents[0]["text"])
+        self.assertIn(get_output_document_cache_key(0, "html"), Task.objects.get(id=task.id).cached_state)
+
+        # The documents are rendered for download after the task's finished page.
+        from .document_exports import prerender_documents
+        prerender_documents(task.id, close_connection=False)
+        self.assertIn(get_output_document_cache_key(0, "html", use_data_urls=True), Task.objects.get(id=task.id).cached_state)
+
+    def test_document_export_jobs(self):
+        from .models import DocumentExportJob, TaskAnswer
+        m = self.getModule("simple")
+        m.spec["output"][0]["id"] = "answers"
+        m.save()
+        task = Task.objects.create(module=m, project=self.project, editor=self.user)
+
+        def enqueue(document_id):
+            # Jobs are submitted when the transaction commits, and run in the
+            # requesting thread during tests.
+            with self.captureOnCommitCallbacks(execute=True):
+                job = DocumentExportJob.enqueue(task, document_id, "markdown", user=self.user)
+                self.assertEqual(job.status, DocumentExportJob.STATUS_QUEUED)
+            job.refresh_from_db()
+            return job
+
+        job = enqueue("answers")
+        self.assertEqual(job.status, DocumentExportJob.STATUS_FINISHED)
+        self.assertEqual(job.filename, "answers.md")
+        job.file.open("rb")
+        self.assertIn(b"The Answer", job.file.read())
+
+        # Requests for the same document while the answers are unchanged
+        # share the job.
+        self.assertEqual(DocumentExportJob.enqueue(task, "answers", "markdown").id, job.id)
+
+        # Changing an answer starts a new export and removes the old one.
+        q1 = m.questions.get(key="q1")
+        TaskAnswer.objects.get_or_create(task=task, question=q1)[0].save_answer("42", [], None, self.user, "web")
+        job2 = enqueue("answers")
+        self.assertNotEqual(job2.id, job.id)
+        self.assertFalse(DocumentExportJob.objects.filter(id=job.id).exists())
+        job2.file.open("rb")
+        self.assertIn(b"The Answer: 42", job2.file.read())
+
+        # Invalid documents fail with an error message.
+        job3 = enqueue("missing")
+        self.assertEqual(job3.status, DocumentExportJob.STATUS_FAILED)
+        self.assertEqual(job3.error, "Problem processing document request.")
+
+    def test_document_export_version(self):
+        # Exports are versioned by everything documents read, not only answers.
+        from controls.models import ElementControl, Statement
+        from controls.oscal import Catalogs
+        m = self.getModule("simple")
+        task = Task.objects.create(module=m, project=self.project, editor=self.user)
+        root_element = Element.objects.create(name="My Root Element", element_type="system")
+        self.project.system = System.objects.create(root_element=root_element)
+        self.project.save()
+
+        versions = [task.get_answers_version()]
+        smt = Statement.objects.create(sid="ac-2", sid_class=Catalogs.NIST_SP_800_53_rev5, body="A",
+                                       statement_type="control_implementation", consumer_element=root_element)
+        versions.append(task.get_answers_version())
+        smt.body = "B"
+        smt.save()
+        versions.append(task.get_answers_version())
+        ElementControl.objects.create(element=root_element, oscal_ctl_id="ac-2", oscal_catalog_key=Catalogs.NIST_SP_800_53_rev5)
+        versions.append(task.get_answers_version())
+        m.spec["output"][0]["template"] = "Changed"
+        m.save()
+        versions.append(task.get_answers_version())
+        self.assertEqual(len(set(versions)), len(versions))
+        self.assertEqual(task.get_answers_version(), versions[-1])
+
+    def test_render_control_catalog(self):
+        from controls.models import ElementControl
+        from controls.oscal import Catalogs
+        root_element = Element.objects.create(name="My Root Element", element_type="system")
+        system = System.objects.create(root_element=root_element)
+        self.project.system = system
+        self.project.save()
+        for control_id in ("ac-1", "ac-2"):
+            ElementControl.objects.create(element=root_element, oscal_ctl_id=control_id,
+                                          oscal_catalog_key=Catalogs.NIST_SP_800_53_rev5)
+
+        m = self.getModule("simple")
+        task = Task.objects.create(module=m, project=self.project, editor=self.user)
+        answers = ModuleAnswers(m, task, {})
+        self._test_render_single_question_md("simple", None, None,
+            "Account Management (AC) yes",
+            template="{{control_catalog['ac-2'].title}} ({{control_catalog['ac-2'].family_id|upper}}) {% if 'ac-3' in control_catalog %}yes{% endif %}",
+            answers=answers)
+
+        # Only the controls that were used were flattened.
+        catalog = get_project_control_catalog(self.project).catalog
+        self.assertIn("ac-2", catalog.flattened_controls)
+        self.assertNotIn("ac-3", catalog.flattened_controls)
+
     def test_render_global_context_variables(self):
         # test that the organization and project render as their names
 
@@ -670,6 +944,70 @@ class RenderTests(TestCaseWithFixtureData):
             expected_impute_value = expected
         self.assertEqual(actual, expected_impute_value, msg="impute value expression %s" % expression)
 
+class DocumentExportWorkerTests(TransactionTestCase):
+    # Export jobs run on the worker pool, which uses its own database
+    # connections, so the job must be committed before a worker sees it.
+    serialized_rollback = True
+
+    def setUp(self):
+        from .models import AppSource
+        from .app_source_connections import MultiplexedAppSourceConnection
+        settings.VALIDATE_EMAIL_DELIVERABILITY = False
+        AppSource.objects.create(slug="fixture", spec={ "type": "local", "path": "fixtures/modules/other" })
+        with MultiplexedAppSourceConnection(ms for ms in AppSource.objects.all()) as store:
+            for app in store.list_apps():
+                load_app_into_database(app)
+        self.user = User.objects.create(username="unit.test", email='regular@example.org')
+        self.project = Project.objects.create(organization=Organization.objects.create(name="My Organization"))
+
+    def test_export_job_on_worker_pool(self):
+        from django.db import transaction
+        from django.test import override_settings
+        from . import document_exports
+        from .models import DocumentExportJob
+        m = Module.objects.get(app__appname="simple_project", module_name="simple")
+        m.spec["output"][0]["id"] = "answers"
+        m.save()
+        task = Task.objects.create(module=m, project=self.project, editor=self.user)
+
+        with override_settings(GR_EXPORT_WORKERS=1):
+            document_exports.executor = None
+            try:
+                # As in a request with ATOMIC_REQUESTS.
+                with transaction.atomic():
+                    job = DocumentExportJob.enqueue(task, "answers", "markdown", user=self.user)
+                    self.assertEqual(job.status, DocumentExportJob.STATUS_QUEUED)
+                # The pool has one worker, so this waits until the job has run.
+                document_exports.get_executor().submit(lambda: None).result()
+            finally:
+                document_exports.get_executor().shutdown(wait=True)
+                document_exports.executor = None
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, DocumentExportJob.STATUS_FINISHED)
+        job.file.open("rb")
+        self.assertIn(b"The Answer", job.file.read())
+
+    def test_prerender_submitted_once_per_task(self):
+        from unittest.mock import patch
+        from django.core.cache.backends.locmem import LocMemCache
+        from django.test import override_settings
+        from . import document_exports
+        # Tests otherwise use a dummy cache, which stores nothing.
+        with override_settings(GR_EXPORT_WORKERS=1), \
+             patch.object(document_exports, "get_executor") as get_executor, \
+             patch.object(document_exports, "cache", LocMemCache("prerender", {})):
+            # Repeated views of a finished task queue one prerender.
+            document_exports.submit_prerender(1)
+            document_exports.submit_prerender(1)
+            document_exports.submit_prerender(2)
+            self.assertEqual([call.args for call in get_executor.return_value.submit.call_args_list],
+                             [(document_exports.prerender_documents, 1), (document_exports.prerender_documents, 2)])
+            # Once it has run, a later view queues another.
+            document_exports.prerender_documents(1, close_connection=False)
+            document_exports.submit_prerender(1)
+            self.assertEqual(get_executor.return_value.submit.call_count, 3)
+
 class ImportExportTests(TestCaseWithFixtureData):
     ## IMPORT/EXPORT TASK DATA TESTS ##
 
@@ -21,6 +21,7 @@ urlpatterns = [
     url(r'^(\d+)/([\w_-]+)(/finished)()$', guidedmodules.views.task_finished),
     url(r'^(\d+)/([\w_-]+)/media/(.*)$', guidedmodules.views.download_module_asset),
     url(r'^(\d+)/([\w_-]+)/(download/document)()/(.*)/(.*)$', guidedmodules.views.download_module_output),
+    url(r'^(\d+)/([\w_-]+)/(export/document)()/(.*)/(.*)$', guidedmodules.views.export_module_output),
     url(r'^(\d+)/([\w_-]+)()()$', guidedmodules.views.next_question),
     url(r'^start$', guidedmodules.views.new_task),
     url(r'^_delete_task$', guidedmodules.views.delete_task, name="delete_task"),
@@ -36,5 +37,7 @@ urlpatterns = [
     url(r'^_authoring_tool/edit-appversion$', guidedmodules.views.authoring_edit_appversion, name="authoring_edit_appversion"),
     url(r'^_upgrade-app$', guidedmodules.views.upgrade_app),
     url(r'^_refresh-output-doc$', guidedmodules.views.refresh_output_doc),
+    url(r'^_document_export/(\d+)$', guidedmodules.views.document_export_status, name="document_export_status"),
+    url(r'^_document_export/(\d+)/download$', guidedmodules.views.download_document_export, name="download_document_export"),
 ]
 
@@ -23,7 +23,8 @@ from django.utils.text import slugify
 
 from controls.enums.statements import StatementTypeEnum
 from discussion.validators import validate_file_extension
-from .models import AppVersion, Module, ModuleQuestion, Task, TaskAnswer, TaskAnswerHistory, InstrumentationEvent
+from .models import AppVersion, Module, ModuleQuestion, Task, TaskAnswer, TaskAnswerHistory, InstrumentationEvent, \
+    DocumentExportJob
 
 import guidedmodules.module_logic as module_logic
 import guidedmodules.answer_validation as answer_validation
@@ -32,13 +33,13 @@ from discussion.models import Discussion
 from siteapp.models import User, Invitation, Project, ProjectMembership, Tag
 from guidedmodules.forms import ExportCSVTemplateSSPForm
 from controls.models import Element, ElementRole, Statement, System
+from controls.tabular_export import Column, csv_response, get_rows
 from siteapp.utils.views_helper import project_context
 
 import fs, fs.errors
 
 import logging
 logging.basicConfig()
-import csv
 import structlog
 from structlog import get_logger
 from structlog.stdlib import LoggerFactory
@@ -214,9 +215,13 @@ def next_question(request, task, answered, *unused_args):
         q = answered.can_answer[0]
         return HttpResponseRedirect(task.get_absolute_url_to_question(q) + previous)
 
-def get_next_question(current_question, task):
-    # get context of questions in module
-    answers = task.get_answers().with_extended_info()
+def get_next_question(current_question, task, previous_answers=None):
+    # get context of questions in module. If the caller has the evaluated
+    # answers from before current_question's answer changed, only the
+    # questions affected by the change are re-evaluated.
+    answers = task.get_answers().with_extended_info(
+        previous_state=previous_answers,
+        changed_keys={current_question.key} if previous_answers is not None else None)
 
     # if there are no more questions to answer, return None
     if len(answers.can_answer) == 0:
@@ -264,7 +269,7 @@ def save_answer(request, task, answered, context, __):
 
     # make a function that gets the URL to the next page
     def redirect_to():
-        next_q = get_next_question(q, task)
+        next_q = get_next_question(q, task, previous_answers=answered)
         if next_q:
             # Redirect to the next question.
             return task.get_absolute_url_to_question(next_q) + f"?back_url={back_url}&previous=nquestion"
@@ -1352,6 +1357,10 @@ def task_finished(request, task, answered, context, *unused_args):
 
     top_of_page_output = None
     outputs = task.render_output_documents(answered)
+    # Render the documents for download in the background. Wait for this
+    # request's transaction to commit so the workers see the same data.
+    from .document_exports import submit_prerender
+    transaction.on_commit(lambda: submit_prerender(task.id))
     for i, output in enumerate(outputs):
         if output.get("display") == "top":
             top_of_page_output = output
@@ -1460,6 +1469,43 @@ def download_module_output(request, task, answered, context, question, document_
     resp['Content-Disposition'] = 'inline; filename=' + filename
     return resp
 
+@task_view
+def export_module_output(request, task, answered, context, question, document_id, download_format):
+    # Queue a background conversion of an output document. The browser then
+    # polls document_export_status until the file is ready.
+    if request.method != "POST":
+        return HttpResponseNotAllowed(["POST"])
+    from .document_exports import BACKGROUND_EXPORT_FORMATS
+    if document_id in (None, "") or download_format not in BACKGROUND_EXPORT_FORMATS:
+        raise Http404()
+
+    # As in download_module_output, pick up any changes to the app.
+    module_logic.clear_module_question_cache()
+
+    job = DocumentExportJob.enqueue(task, document_id, download_format, user=request.user)
+    return JsonResponse(job.get_status_dict())
+
+def get_document_export_job(request, job_id):
+    job = get_object_or_404(DocumentExportJob.objects.select_related("task"), id=job_id)
+    if not job.task.has_read_priv(request.user):
+        raise Http404()
+    return job
+
+@login_required
+def document_export_status(request, job_id):
+    job = get_document_export_job(request, job_id)
+    return JsonResponse(job.get_status_dict())
+
+@login_required
+def download_document_export(request, job_id):
+    job = get_document_export_job(request, job_id)
+    if job.status != DocumentExportJob.STATUS_FINISHED:
+        raise Http404("The document is not ready yet.")
+
+    resp = HttpResponse(job.file.read(), job.mime_type)
+    resp['Content-Disposition'] = 'inline; filename=' + job.filename
+    return resp
+
 @login_required
 def instrumentation_record_interaction(request):
     if request.method != "POST":
@@ -1887,7 +1933,7 @@ def authoring_new_question(request, task, mq):
 
     # Clear cache...
     from .module_logic import clear_module_question_cache
-    clear_module_question_cache()
+    clear_module_question_cache(task.module)
 
     # Return status. The browser will reload/redirect --- if the question key
     # changed, this sends the new key.
@@ -1998,7 +2044,7 @@ def authoring_new_question2(request):
 
     # Clear cache...
     from .module_logic import clear_module_question_cache
-    clear_module_question_cache()
+    clear_module_question_cache(module)
 
     # Return status. The browser will reload/redirect --- if the question key
     # changed, this sends the new key.
@@ -2022,7 +2068,7 @@ def authoring_edit_question2(request):
             question.delete()
             # Clear cache...
             from .module_logic import clear_module_question_cache
-            clear_module_question_cache()
+            clear_module_question_cache(module)
             if task_id:
                 # if coming from editor on a question page, return to project page after deleting question
                 return JsonResponse({ "status": "ok", "redirect": task.project.get_absolute_url() })
@@ -2126,7 +2172,7 @@ def authoring_edit_question2(request):
 
     # Clear cache...
     from .module_logic import clear_module_question_cache
-    clear_module_question_cache()
+    clear_module_question_cache(question.module)
 
     # Return to question in module if Task defined or reload question in authoring tool if not
     if 'task' in request.POST:
@@ -2496,44 +2542,31 @@ def export_ssp_csv(form_data, system):
 
     smts = system.root_element.statements_consumed.filter(
         statement_type=StatementTypeEnum.CONTROL_IMPLEMENTATION.name).order_by('pid')
-
-    selected_controls = list(smts.values_list('sid', flat=True))
-    # If the user selected to format the control id in OSCAL this will be skipped
-    if not form_data.get('oscal_format'):
-        # De-oscalize every control id (sid)
-        selected_controls = [de_oscalize_control_id(control) for control in selected_controls]
-    db_catalog_keys = list(smts.values_list('sid_class', flat=True))
-    catalog_keys = []
-    # XYZ_3_0 --> XYZ 3.0
-    for catalog in db_catalog_keys:
-        if catalog.count("_") == 3:
-            catalog_keys.append(" ".join(catalog.split("_")[:2]) + " " + ".".join(catalog.split("_")[-2:]))
-        else:
-            catalog_keys.append(catalog)
-    imps = list(smts.values_list('body', flat=True))
-    headers = [form_data.get('info_system'), form_data.get('control_id'), form_data.get('catalog'), form_data.get('shared_imps'), form_data.get('private_imps')]
     system_name = system.root_element.name # TODO: Should this come from questionnaire answer or project name as we have it?
 
-    data = [
-        [system_name] * len(selected_controls),
-        selected_controls,
-        catalog_keys,
-        [""] * len(selected_controls),# shared imps are not implemented
-        imps
+    def control_id(sid):
+        # If the user selected to format the control id in OSCAL this will be skipped
+        if not form_data.get('oscal_format'):
+            # De-oscalize every control id (sid)
+            return de_oscalize_control_id(sid)
+        return sid
+
+    def catalog_key(catalog):
+        # XYZ_3_0 --> XYZ 3.0
+        if catalog.count("_") == 3:
+            return " ".join(catalog.split("_")[:2]) + " " + ".".join(catalog.split("_")[-2:])
+        return catalog
+
+    columns = [
+        Column(form_data.get('info_system'), lambda smt: system_name),
+        Column(form_data.get('control_id'), lambda smt: control_id(smt[0])),
+        Column(form_data.get('catalog'), lambda smt: catalog_key(smt[1])),
+        Column(form_data.get('shared_imps'), lambda smt: ""), # shared imps are not implemented
+        Column(form_data.get('private_imps'), lambda smt: smt[2]),
     ]
+    rows = get_rows(columns, smts.values_list('sid', 'sid_class', 'body').iterator(chunk_size=500))
     filename = str(PurePath(slugify(system_name+ "-" + datetime.now().strftime("%Y-%m-%d-%H-%M"))).with_suffix('.csv'))
 
-    # Create the HttpResponse object with the appropriate CSV header.
-    response = HttpResponse(
-        content_type='text/csv',
-        headers={'Content-Disposition': 'attachment; filename=' + filename},
-    )
-
-    writer = csv.writer(response)
-    writer.writerow(headers)
-    # spread and write rows
-    writer.writerows(zip(*data))
-
-    return response
+    return csv_response(filename, columns, rows)
   
   
@@ -22,7 +22,7 @@ from siteapp.utils.views_helper import project_context, start_app, get_complianc
     get_compliance_apps_catalog_for_user, get_compliance_apps_catalog_for_user
 from guidedmodules.models import AppSource
 from guidedmodules.app_loading import ModuleDefinitionError
-import xlsxwriter
+from controls.tabular_export import Column, iter_chunks, xlsx_response
 
 logging.basicConfig()
 import structlog
@@ -183,155 +183,133 @@ def monthly_poams_admin(request):
 def export_csam_poams_xlsx(request):
     """Export poams to CSAM spreadsheet format"""
 
-    # Save to spreadsheet
-    def save_worksheet(poams_list, filename, custom_fields=None):
-        """Save poams list to spreadsheet"""
-
-        # print(f"saving {len(poams_list)} POAMS to file '{filename}'")
-        workbook = xlsxwriter.Workbook(filename)
-        worksheet = workbook.add_worksheet()
-        column_format = workbook.add_format({'bold': True, 'font_color': 'white', 'bg_color': '#6487DC'})
-        date_format = workbook.add_format({'num_format': 'mm/dd/yyyy'})
-        # Write Column Headers
-        headers = [
-            "CSAM ID", 
-            "Org", 
-            "Sub Org", 
-            "System Name", 
-            "Acronym", 
-            "System Category", 
-            "System Operational Status", 
-            "System Type", 
-            "Contractor System", 
-            "Financial System", 
-            "FISMA Reportable", 
-            "Critical Infrastructure", 
-            "Mission Critical", 
-            "UII Code", 
-            "Investment Name", 
-            "Portfolio", 
-            "POAM ID", 
-            "POAM Sequence", 
-            "POAM Title", 
-            "Detailed Weakness Description", 
-            "Create Date", 
-            "Days Since Creation", 
-            "Scheduled Completion Date", 
-            "Planned Start Date", 
-            "Actual Start Date" , 
-            "Planned Finish Date", 
-            "Actual Finish Date", 
-            "Status", 
-            "Weakness",
-            "Cost", 
-            "Control Risk Severity", 
-            "User Identified Criticality",
-            "Severity", 
-            "Workflow Status", 
-            "Workflow Status Date", 
-            "Days Until Auto-Approved",
-            "Exclude From OMB",
-            "Accepted Risk",
-            "Assigned To",
-            "Phone",
-            "Email",
-            "Assigned Date",
-            "Delay Reason",
-            "Controls",
-            "CSFFunction",
-            "CSFCategory",
-            "CSFSubCategory",
-            "Number Milestones",
-            "Number Artifacts",
-            "RBD Approval Date",
-            "Deficiency Category",
-            "Source of Finding",
-            "Percent Complete",
-            "Date % Complete Last Updated",
-            "Delay Justification",
-            "Monthly Status", 
-            "Comments"
-        ]
-        # include custom fields
-        # if custom_fields:
-        #     for cf in custom_fields:
-        #         headers.append(cf['field_name'])
-        col_index = 0
-        row_index = 0
-        # write headers
-        for col_index in range(0,len(headers)):
-            worksheet.write(row_index, col_index, headers[col_index])
-        # write content for each poam
-        for index, poam in enumerate(poams_list):
-            row_index = index + 1
-            
+    # Write Column Headers
+    headers = [
+        "CSAM ID", 
+        "Org", 
+        "Sub Org", 
+        "System Name", 
+        "Acronym", 
+        "System Category", 
+        "System Operational Status", 
+        "System Type", 
+        "Contractor System", 
+        "Financial System", 
+        "FISMA Reportable", 
+        "Critical Infrastructure", 
+        "Mission Critical", 
+        "UII Code", 
+        "Investment Name", 
+        "Portfolio", 
+        "POAM ID", 
+        "POAM Sequence", 
+        "POAM Title", 
+        "Detailed Weakness Description", 
+        "Create Date", 
+        "Days Since Creation", 
+        "Scheduled Completion Date", 
+        "Planned Start Date", 
+        "Actual Start Date" , 
+        "Planned Finish Date", 
+        "Actual Finish Date", 
+        "Status", 
+        "Weakness",
+        "Cost", 
+        "Control Risk Severity", 
+        "User Identified Criticality",
+        "Severity", 
+        "Workflow Status", 
+        "Workflow Status Date", 
+        "Days Until Auto-Approved",
+        "Exclude From OMB",
+        "Accepted Risk",
+        "Assigned To",
+        "Phone",
+        "Email",
+        "Assigned Date",
+        "Delay Reason",
+        "Controls",
+        "CSFFunction",
+        "CSFCategory",
+        "CSFSubCategory",
+        "Number Milestones",
+        "Number Artifacts",
+        "RBD Approval Date",
+        "Deficiency Category",
+        "Source of Finding",
+        "Percent Complete",
+        "Date % Complete Last Updated",
+        "Delay Justification",
+        "Monthly Status", 
+        "Comments"
+    ]
+    # set column widths
+    word_width = 20
+    column_widths = {}
+    column_widths.update(dict.fromkeys(range(1, 8), word_width))  # Width of columns B:H
+    column_widths[3] = word_width * 2  # Width of columns D
+    column_widths[9] = word_width  # Width of columns J
+    column_widths[15] = word_width  # Width of columns P
+    column_widths.update(dict.fromkeys(range(18, 20), word_width * 2))  # Width of columns S:T
+    column_widths.update(dict.fromkeys(range(20, 29), word_width))  # Width of columns U:AC
+    column_widths.update(dict.fromkeys(range(32, 36), word_width))  # Width of columns AG:AJ
+    column_widths.update(dict.fromkeys(range(38, 43), word_width))  # Width of columns AM:AQ
+    column_widths[51] = word_width * 2  # Width of columns AZ
+    columns = [Column(header, width=column_widths.get(index)) for index, header in enumerate(headers)]
+    # include custom fields
+    # if custom_fields:
+    #     for cf in custom_fields:
+    #         headers.append(cf['field_name'])
+
+    def poam_row(poam, sys):
+        """Return the spreadsheet row of a poam"""
+        row = [None] * len(headers)
+        ele = poam.statement.consumer_element
+        row[headers.index("System Name")] = ele.name
+        # Check for specific poam fields:
+        # poam_id => POAM ID
+        row[headers.index("POAM ID")] = poam.poam_id
+        # weakness => POAM Title
+        row[headers.index("POAM Title")] = poam.weakness_name
+        # controls => Controls
+        row[headers.index("Controls")] = poam.controls
+        # scheduled_completion_date => Planned Finish Date
+        if poam.scheduled_completion_date:
+            row[headers.index("Planned Finish Date")] = poam.scheduled_completion_date.strftime('%x %X')
+        # milestones => Number Milestones
+        row[headers.index("Number Milestones")] = poam.milestones
+
+        # Check POAM Statement for specific fields:
+        # body => Detailed Weakness Description
+        row[headers.index("Detailed Weakness Description")] = poam.statement.body
+        # status => Status
+        row[headers.index("Status")] = poam.statement.status
+        # created => Create Date
+        row[headers.index("Create Date")] = poam.created.strftime('%x %X')
+
+        # check if "poam extra" is in the list of headers, if it is, add it to the row
+        for col_index, field in enumerate(headers):
+            if sys.info.get(field) or sys.info.get(field) == 0:
+                row[col_index] = str(sys.info.get(field)).strip(":")
+            if poam.extra.get(field) or poam.extra.get(field) == 0:
+                row[col_index] = str(poam.extra.get(field)).strip(":")
+        return row
+
+    def rows(poams):
+        for chunk in iter_chunks(poams):
             # Get Info from System
-            
-            ele = poam.statement.consumer_element
-            sys = System.objects.get(root_element=ele)
-            worksheet.write(row_index, headers.index("System Name"), ele.name)
-            # for field in poam.keys():
-            
-            # 
-            # Check for specific poam fields: 
-            # poam_id => POAM ID
-            worksheet.write(row_index, headers.index("POAM ID"), poam.poam_id) 
-            # weakness => POAM Title
-            worksheet.write(row_index, headers.index("POAM Title"), poam.weakness_name) 
-            # controls => Controls
-            worksheet.write(row_index, headers.index("Controls"), poam.controls)
-            # scheduled_completion_date => Planned Finish Date
-            worksheet.write(row_index, headers.index("Planned Finish Date"), poam.scheduled_completion_date.strftime('%x %X'))
-            # milestones => Number Milestones
-            worksheet.write(row_index, headers.index("Number Milestones"), poam.milestones)
-            
-            # Check POAM Statement for specific fields:
-            # body => Detailed Weakness Description
-            worksheet.write(row_index, headers.index("Detailed Weakness Description"), poam.statement.body)
-            # status => Status
-            worksheet.write(row_index, headers.index("Status"), poam.statement.status)
-            # created => Create Date
-            worksheet.write(row_index, headers.index("Create Date"), poam.created.strftime('%x %X'))
-            
-            # check if "poam extra" is in the list of headers, if it is, add it to the row
-            for field in headers:
-                col_index = headers.index(field)
-                if sys.info.get(field) or sys.info.get(field) == 0:
-                    sys_field = sys.info.get(field)
-                    worksheet.write(row_index, col_index, str(sys_field).strip(":") ) 
-                if poam.extra.get(field) or poam.extra.get(field) == 0:
-                    poam_field = poam.extra.get(field)
-                    worksheet.write(row_index, col_index, str(poam_field).strip(":") ) 
-
-        # set column widths
-        word_width = 20
-        worksheet.set_column(1, 7, word_width)  # Width of columns B:H
-        worksheet.set_column(3, 3, word_width * 2)  # Width of columns D
-        worksheet.set_column(9, 9, word_width)  # Width of columns J
-        worksheet.set_column(15, 15, word_width)  # Width of columns P
-        worksheet.set_column(18, 19, word_width * 2)  # Width of columns S:T
-        worksheet.set_column(20, 28, word_width)  # Width of columns U:AC
-        worksheet.set_column(32, 35, word_width)  # Width of columns AG:AJ
-        worksheet.set_column(38, 42, word_width)  # Width of columns AM:AQ
-        worksheet.set_column(51, 51, word_width * 2)  # Width of columns AZ
-        # close and save workbook
-        workbook.close()
-        return filename
+            systems = System.objects.filter(root_element_id__in=set(poam.statement.consumer_element_id for poam in chunk))
+            systems = { sys.root_element_id: sys for sys in systems }
+            for poam in chunk:
+                yield poam_row(poam, systems[poam.statement.consumer_element_id])
 
     # get all POA&Ms
-    # TODO: 
+    # TODO:
     #   - How to get only the POA&Ms from current month?
-    #   - Erase saved file; make file file temporary directory
-    poams_list = Poam.objects.all()
+    poams_list = Poam.objects.select_related('statement__consumer_element').order_by('id')
     # put all POA&Ms into spreadsheet
     file_name = f"poams_list_{datetime.now().strftime('%Y-%m-%d-%H-%M')}.xlsx"
-    save_worksheet(poams_list, file_name)
-    # path = open(poams_xlsx_filepath, 'rb')
-    path = open(f'{file_name}', 'rb')
-    response = HttpResponse(path, content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet') # mimetype is replaced by content_type for django 1.7
-    response['Content-Disposition'] = 'attachment; filename=%s' % smart_str(file_name)
-    # remove created file
-    return response
+    return xlsx_response(smart_str(file_name), columns, rows(poams_list), header_style=None)
 
 
 def get_system_info(request, system_id=2):
@@ -1,7 +1,7 @@
 from django.core.management.base import BaseCommand
 
 from controls.enums.statements import StatementTypeEnum
-from controls.models import Statement, ImportRecord
+from controls.models import Statement, ImportRecord, SystemRollup
 from controls.utilities import oscalize_control_id
 from siteapp.models import User, Project, Organization
 import xlsxio
@@ -118,6 +118,7 @@ class Command(BaseCommand):
             if create_statements:
                 # Bulk insert the creates
                 Statement.objects.bulk_create(create_statements)
+                SystemRollup.invalidate([project.system.root_element_id])
 
             if not import_record.import_record_statements.exists():
                 # Removes the import record object IF there were no creates or updates.
@@ -779,12 +779,13 @@ class Project(TagModelMixin, BaseModel):
         # Get all tasks that the user might want to continue working on
         # (except for the project root task).
         from guidedmodules.models import Task
-        return [
-            task for task in
-            Task.get_all_tasks_readable_by(user)
+        tasks = list(Task.get_all_tasks_readable_by(user)
                 .filter(project=self, editor=user) \
                 .order_by('-updated') \
-                .select_related('project')
+                .select_related('project'))
+        Task.load_cached_state(tasks, ["is_finished"])
+        return [
+            task for task in tasks
             if not task.is_finished()
                and task != self.root_task]
 
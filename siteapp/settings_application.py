@@ -1,6 +1,7 @@
 from .settings import *
 import re
 import sys
+import tempfile
 
 INSTALLED_APPS += [
     'django_extensions',
@@ -123,6 +124,38 @@ if GR_IMG_GENERATOR not in GR_IMG_GENERATOR_SUPPORTED:
 else:
     print("INFO: GR_IMG_GENERATOR set to {}".format(GR_IMG_GENERATOR))
 
+# Maximum number of compiled Jinja2 templates and expressions kept in
+# each process's template cache.
+GR_TEMPLATE_CACHE_SIZE = int(environment.get("gr-template-cache-size", 2000))
+
+# Maximum number of rendered HTML documents kept in each process's cache
+# of HTML whose URLs have been rewritten.
+GR_RENDERED_HTML_CACHE_SIZE = int(environment.get("gr-rendered-html-cache-size", 200))
+
+# Number of worker threads used to render output documents concurrently.
+GR_OUTPUT_RENDER_WORKERS = int(environment.get("gr-output-render-workers", 4))
+
+# Maximum number of control catalogs with distinct organization-defined
+# parameter values kept in each process's cache.
+GR_CATALOG_CACHE_SIZE = int(environment.get("gr-catalog-cache-size", 32))
+
+# Directory of precompiled control catalog snapshots written by the
+# compilecatalogs management command.
+GR_CATALOG_SNAPSHOT_DIR = environment.get("gr-catalog-snapshot-dir", local("catalog-snapshots"))
+
+# Number of worker threads that convert output documents to PDF and DOCX
+# in the background. Set to 0 to run export jobs in the requesting thread.
+GR_EXPORT_WORKERS = int(environment.get("gr-export-workers", 2))
+
+# Directory where reference documents (e.g. the Word template used by pandoc)
+# are cached on disk by content hash.
+GR_EXPORT_CACHE_DIR = environment.get("gr-export-cache-dir", os.path.join(tempfile.gettempdir(), "govready-q-exports"))
+
+# Number of seconds that API list rollups (?rollup=true) are cached for a
+# given user, set of filters and latest update of the listed model. Set to
+# 0 to disable caching.
+GR_API_ROLLUP_CACHE_SECONDS = int(environment.get("gr-api-rollup-cache-seconds", 30))
+
 MIDDLEWARE += [
     'siteapp.middleware.misc.ContentSecurityPolicyMiddleware',
     'guidedmodules.middleware.InstrumentQuestionPageLoadTimes',
@@ -143,6 +176,9 @@ if TESTING_MODE:
             'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
         }
     }
+    # Render in the thread that holds the test's database transaction.
+    GR_OUTPUT_RENDER_WORKERS = 1
+    GR_EXPORT_WORKERS = 0
 
 LOGIN_REDIRECT_URL = "/projects"
 
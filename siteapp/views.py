@@ -285,6 +285,10 @@ def assign_project_lifecycle_stage(projects):
     # Load each project's lifecycle stage, which is computed by each project's
     # root task's app's output document named govready_lifecycle_stage_code.
     # That output document yields a string identifying a lifecycle stage.
+    # The documents, along with the rest of the state shown on project lists,
+    # are computed for all of the projects together.
+    Task.load_dashboard_state([project.root_task for project in projects],
+                              output_document_ids=["govready_lifecycle_stage_code"])
     for project in projects:
         outputs = project.root_task.render_output_documents()
         for doc in outputs:
@@ -322,6 +326,7 @@ class ProjectList(LoginRequiredMixin, ListView):
     def get_context_data(self, **kwargs):
         query = self.request.GET.get('search', "")
         context = super().get_context_data(**kwargs)
+        Task.load_dashboard_state([project.root_task for project in context['projects']])
         context['projects_access'] = Project.get_projects_with_read_priv(
             self.request.user,
             filters={"system__root_element__name__icontains": query},
@@ -804,6 +809,10 @@ def project(request, project):
             if mq.spec.get("protocol"):
                 can_start_any_apps = True
 
+    # Load the cached state the template shows for the sub-tasks in one query.
+    Task.load_cached_state([q["task"] for q in questions.values() if q.get("task")],
+                           ["is_finished", "title"])
+
     # Assign questions to the main area or to the "action buttons" panel on the side of the page.
     main_area_questions = []
     action_buttons = []
@@ -1802,12 +1811,15 @@ def portfolio_projects(request, pk):
     perm_checker.prefetch_perms(projects)
 
     user_projects = [project for project in projects if perm_checker.has_perm('view_project', project)]
+    if perm_checker.has_perm('view_portfolio', portfolio):
+        user_projects = list(projects)
+    Task.load_dashboard_state([project.root_task for project in user_projects])
     anonymous_user = User.objects.get(username='AnonymousUser')
     users_with_perms = portfolio.users_with_perms()
 
     return render(request, "portfolios/detail.html", {
         "portfolio": portfolio,
-        "projects": projects if perm_checker.has_perm('view_portfolio', portfolio) else user_projects,
+        "projects": user_projects,
         "can_invite_to_portfolio": perm_checker.has_perm('can_grant_portfolio_owner_permission', portfolio),
         "can_edit_portfolio": perm_checker.has_perm('change_portfolio', portfolio),
         "send_invitation": Invitation.form_context_dict(perm_checker, portfolio, [request.user, anonymous_user]),